@@ -0,0 +1,77 @@
+import sys
+import time
+
+import numpy as np
+
+from tadataka.dataset.tum_rgbd import TumRgbdDataset
+from tadataka.vo.dvo import DVO, KeyframePolicy
+from tadataka.vo.dvo.selection import GradientPercentileSelector, GridSelector
+
+
+# Usage:
+#   python benchmarks/dvo.py <dataset_root> <which_freiburg> [n_frames]
+# dataset_root is a sequence of the TUM RGB-D dataset, such as
+# rgbd_dataset_freiburg1_desk
+
+
+def relative_pose_errors(poses_true, poses_pred):
+    # translation and rotation errors of pose changes between
+    # consecutive frames
+    errors_t, errors_r = [], []
+    for i in range(len(poses_true) - 1):
+        dpose_true = poses_true[i].inv() * poses_true[i+1]
+        dpose_pred = poses_pred[i].inv() * poses_pred[i+1]
+        error = dpose_true.inv() * dpose_pred
+        errors_t.append(np.linalg.norm(error.t))
+        errors_r.append(np.linalg.norm(error.rotation.as_rotvec()))
+    return np.array(errors_t), np.array(errors_r)
+
+
+def run(frames, **kwargs):
+    vo = DVO(**kwargs)
+    poses = []
+    elapsed = 0
+    for frame in frames:
+        start = time.perf_counter()
+        poses.append(vo.estimate(frame))
+        elapsed += time.perf_counter() - start
+    return elapsed / len(frames), poses
+
+
+def benchmark(frames, name, **kwargs):
+    time_per_frame, poses = run(frames, **kwargs)
+    errors_t, errors_r = relative_pose_errors([f.pose for f in frames], poses)
+    print(f"{name:<24s}  {1000 * time_per_frame:7.1f}ms/frame  "
+          f"RPE {1000 * np.mean(errors_t):6.2f}mm  "
+          f"{np.rad2deg(np.mean(errors_r)):6.3f}deg")
+
+
+if __name__ == "__main__":
+    dataset_root, which_freiburg = sys.argv[1], int(sys.argv[2])
+    n_frames = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+
+    dataset = TumRgbdDataset(dataset_root, which_freiburg)
+    frames = [dataset[i] for i in range(min(n_frames, len(dataset)))]
+
+    # compile
+    run(frames[0:2])
+
+    benchmark(frames, "dense")
+    benchmark(frames, "dense (inverse)", inverse_compositional=True)
+    for percentile in [50, 75, 90]:
+        selector = GradientPercentileSelector(percentile)
+        benchmark(frames, f"percentile {percentile}", pixel_selector=selector)
+        benchmark(frames, f"percentile {percentile} (inverse)",
+                  pixel_selector=selector, inverse_compositional=True)
+    for n_per_cell in [4, 16]:
+        selector = GridSelector(cell_size=8, n_per_cell=n_per_cell)
+        benchmark(frames, f"grid 8x8 top {n_per_cell}",
+                  pixel_selector=selector)
+        benchmark(frames, f"grid 8x8 top {n_per_cell} (inverse)",
+                  pixel_selector=selector, inverse_compositional=True)
+
+    benchmark(frames, "keyframe", keyframe_policy=KeyframePolicy())
+    benchmark(frames, "keyframe percentile 75 (inverse)",
+              keyframe_policy=KeyframePolicy(),
+              pixel_selector=GradientPercentileSelector(75),
+              inverse_compositional=True)
@@ -0,0 +1,68 @@
+import time
+
+import numpy as np
+
+from tadataka.local_ba import Projection
+from tadataka.so3_codegen import projection, pose_jacobian, point_jacobian
+
+
+def codegen_compute(viewpoint_indices, point_indices, poses, points):
+    x_pred = np.empty((len(point_indices), 2))
+    for index, (j, i) in enumerate(zip(viewpoint_indices, point_indices)):
+        x_pred[index] = projection(poses[j], points[i])
+    return x_pred
+
+
+def codegen_jacobians(viewpoint_indices, point_indices, poses, points):
+    A = np.empty((len(point_indices), 2, 6))
+    B = np.empty((len(point_indices), 2, 3))
+    for index, (j, i) in enumerate(zip(viewpoint_indices, point_indices)):
+        A[index] = pose_jacobian(poses[j], points[i])
+        B[index] = point_jacobian(poses[j], points[i])
+    return A, B
+
+
+def measure(f, *args, n_repeats=5):
+    # minimum of repeated runs
+    elapsed = np.inf
+    for _ in range(n_repeats):
+        start = time.perf_counter()
+        result = f(*args)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    return elapsed, result
+
+
+def benchmark(n_viewpoints, n_points, visible_ratio=0.6):
+    np.random.seed(3939)
+
+    poses = np.random.uniform(-1, 1, (n_viewpoints, 6))
+    points = np.random.uniform(-1, 1, (n_points, 3))
+    points[:, 2] = points[:, 2] + 5
+
+    mask = np.random.uniform(0, 1, (n_viewpoints, n_points)) < visible_ratio
+    viewpoint_indices, point_indices = np.where(mask)
+
+    args = (viewpoint_indices, point_indices, poses, points)
+    t_compute0, x0 = measure(codegen_compute, *args)
+    t_jacobians0, (A0, B0) = measure(codegen_jacobians, *args)
+
+    P = Projection(viewpoint_indices, point_indices)
+    t_compute1, x1 = measure(P.compute, poses, points)
+    t_jacobians1, (A1, B1) = measure(P.jacobians, poses, points)
+
+    error = max(np.abs(x0 - x1).max(),
+                np.abs(A0 - A1).max(),
+                np.abs(B0 - B1).max())
+
+    print(f"n_viewpoints = {n_viewpoints}  n_points = {n_points}  "
+          f"n_visible = {len(point_indices)}")
+    print(f"  compute    codegen {t_compute0:.4f}s  "
+          f"batch {t_compute1:.4f}s  ({t_compute0 / t_compute1:.1f}x)")
+    print(f"  jacobians  codegen {t_jacobians0:.4f}s  "
+          f"batch {t_jacobians1:.4f}s  ({t_jacobians0 / t_jacobians1:.1f}x)")
+    print(f"  max absolute difference {error:.3e}")
+
+
+if __name__ == "__main__":
+    for n_points in [100, 1000, 4000]:
+        benchmark(n_viewpoints=8, n_points=n_points)
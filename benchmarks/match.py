@@ -0,0 +1,42 @@
+import time
+
+import numpy as np
+
+from tadataka.match import match_descriptors
+
+
+def measure(f, *args, n_repeats=3):
+    # minimum of repeated runs
+    elapsed = np.inf
+    for _ in range(n_repeats):
+        start = time.perf_counter()
+        result = f(*args)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    return elapsed, result
+
+
+def benchmark(n_descriptors, n_bits=512):
+    np.random.seed(3939)
+
+    descriptors1 = np.random.randint(0, 2, (n_descriptors, n_bits))
+    descriptors2 = np.random.randint(0, 2, (n_descriptors, n_bits))
+    descriptors1, descriptors2 = (descriptors1.astype(np.bool_),
+                                  descriptors2.astype(np.bool_))
+
+    args = (descriptors1.astype(np.float64), descriptors2.astype(np.float64),
+            True, 0.8)
+    t_dense, matches0 = measure(match_descriptors, *args)
+    t_binary, matches1 = measure(match_descriptors,
+                                 descriptors1, descriptors2, True, 0.8)
+
+    assert(np.array_equal(matches0, matches1))
+    print(f"n_descriptors = {n_descriptors}  n_bits = {n_bits}")
+    print(f"  dense {t_dense:.4f}s  binary {t_binary:.4f}s  "
+          f"({t_dense / t_binary:.1f}x)")
+
+
+if __name__ == "__main__":
+    # compile
+    match_descriptors(np.zeros((2, 8), np.bool_), np.zeros((2, 8), np.bool_))
+    for n_descriptors in [500, 2000, 5000]:
+        benchmark(n_descriptors)
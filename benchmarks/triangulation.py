@@ -0,0 +1,56 @@
+import time
+
+import numpy as np
+
+from tadataka._triangulation import linear_triangulation_, linear_triangulation
+from tadataka.batch_projection import exp_so3, transform, pi
+
+
+def loop_triangulation(rotations, translations, keypoints):
+    n_poses, n_points = keypoints.shape[0:2]
+    points = np.empty((n_points, 3))
+    depths = np.empty((n_poses, n_points))
+    for i in range(n_points):
+        points[i], depths[:, i] = linear_triangulation_(
+            rotations, translations, keypoints[:, i]
+        )
+    return points, depths
+
+
+def measure(f, *args, n_repeats=3):
+    # minimum of repeated runs
+    elapsed = np.inf
+    for _ in range(n_repeats):
+        start = time.perf_counter()
+        result = f(*args)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    return elapsed, result
+
+
+def benchmark(n_poses, n_points):
+    np.random.seed(3939)
+
+    rotations = exp_so3(np.random.uniform(-0.1, 0.1, (n_poses, 3)))
+    translations = np.random.uniform(-1, 1, (n_poses, 3))
+    points_true = np.random.uniform(-1, 1, (n_points, 3))
+    points_true[:, 2] = points_true[:, 2] + 5
+
+    keypoints = np.array([
+        pi(transform(np.tile(R, (n_points, 1, 1)), np.tile(t, (n_points, 1)),
+                     points_true))
+        for R, t in zip(rotations, translations)
+    ])
+
+    args = (rotations, translations, keypoints)
+    t_loop, (points0, _) = measure(loop_triangulation, *args)
+    t_batch, (points1, _) = measure(linear_triangulation, *args)
+
+    print(f"n_poses = {n_poses}  n_points = {n_points}")
+    print(f"  loop {t_loop:.4f}s  batch {t_batch:.4f}s  "
+          f"({t_loop / t_batch:.1f}x)")
+    print(f"  max absolute difference {np.abs(points0 - points1).max():.3e}")
+
+
+if __name__ == "__main__":
+    for n_points in [1000, 10000, 100000]:
+        benchmark(n_poses=2, n_points=n_points)
@@ -12,7 +12,6 @@ setup(
     install_requires=[
         'autograd',
         'bidict',
-        'Cython',
         'matplotlib',
         'numba',
         'numpy',
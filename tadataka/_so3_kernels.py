@@ -0,0 +1,203 @@
+# This file is generated by 'python -m tadataka.so3_symbols'.
+# Do not edit by hand.
+
+import numpy
+
+
+def exp_so3_(a, b, c):
+    r0 = (a + 1.0e-16)**2 + (b + 1.0e-16)**2 + (c + 1.0e-16)**2
+    r1 = r0**(-1.0)
+    r2 = numpy.sqrt(r0)
+    r3 = 1 - numpy.cos(r2)
+    r4 = r1*r3
+    r5 = b**2*r4
+    r6 = c**2*r4 - 1
+    r7 = numpy.sin(r2)/r2
+    r8 = c*r7
+    r9 = a*r4
+    r10 = b*r9
+    r11 = b*r7
+    r12 = c*r9
+    r13 = a**2*r4
+    r14 = a*r7
+    out = numpy.empty(numpy.broadcast(a, b, c).shape + (3, 3))
+    out[..., 0, 0] = -r5 - r6
+    out[..., 0, 1] = r10 - r8
+    out[..., 0, 2] = r11 + r12
+    out[..., 1, 0] = r10 + r8
+    out[..., 1, 1] = -r13 - r6
+    out[..., 1, 2] = b*c*r1*r3 - r14
+    out[..., 2, 0] = -r11 + r12
+    out[..., 2, 1] = b*c*r4 + r14
+    out[..., 2, 2] = -r13 - r5 + 1
+    return out
+
+
+def projection_(a, b, c, d, e, f, x, y, z):
+    r0 = (a + 1.0e-16)**2 + (b + 1.0e-16)**2 + (c + 1.0e-16)**2
+    r1 = numpy.sqrt(r0)
+    r2 = numpy.sin(r1)/r1
+    r3 = b*r2
+    r4 = r0**(-1.0)
+    r5 = 1 - numpy.cos(r1)
+    r6 = r4*r5
+    r7 = c*r6
+    r8 = a*r7
+    r9 = c*r2
+    r10 = a*b*r6
+    r11 = c**2*r6
+    r12 = b**2*r6 - 1
+    r13 = a*r2
+    r14 = a**2*r6
+    r15 = (f + x*(-r3 + r8) + y*(b*r7 + r13) + z*(-r12 - r14) + 1.0e-16)**(-1.0)
+    out = numpy.empty(numpy.broadcast(a, b, c, d, e, f, x, y, z).shape + (2, 1))
+    out[..., 0, 0] = r15*(d + x*(-r11 - r12) + y*(r10 - r9) + z*(r3 + r8))
+    out[..., 1, 0] = r15*(e + x*(r10 + r9) + y*(-r11 - r14 + 1) + z*(b*c*r4*r5 - r13))
+    return out
+
+
+def pose_jacobian_(a, b, c, d, e, f, x, y, z):
+    r0 = a + 1.0e-16
+    r1 = b + 1.0e-16
+    r2 = c + 1.0e-16
+    r3 = r0**2 + r1**2 + r2**2
+    r4 = numpy.sqrt(r3)
+    r5 = numpy.sin(r4)
+    r6 = r5/r4
+    r7 = a*r6
+    r8 = r3**(-1.0)
+    r9 = numpy.cos(r4)
+    r10 = 1 - r9
+    r11 = r10*r8
+    r12 = b*r11
+    r13 = b*r6
+    r14 = c*r11
+    r15 = a*r14
+    r16 = a**2
+    r17 = r11*r16
+    r18 = b**2
+    r19 = r11*r18 - 1
+    r20 = f + x*(-r13 + r15) + y*(c*r12 + r7) + z*(-r17 - r19) + 1.0e-16
+    r21 = r20**(-1.0)
+    r22 = 2*a
+    r23 = -r22 - 2.0e-16
+    r24 = r3**(-2.0)
+    r25 = r10*r24
+    r26 = r23*r25
+    r27 = r3**(-3/2)
+    r28 = r27*r5
+    r29 = r0*r28
+    r30 = r18*r26 + r18*r29
+    r31 = c**2
+    r32 = r26*r31 + r29*r31
+    r33 = r8*r9
+    r34 = r0*r33
+    r35 = b*r34
+    r36 = -r0*r28
+    r37 = b*r36
+    r38 = a*c
+    r39 = r14 + r26*r38 + r29*r38
+    r40 = c*r34
+    r41 = c*r36
+    r42 = a*b
+    r43 = r12 + r26*r42 + r29*r42
+    r44 = b*c
+    r45 = a*r34 + a*r36 + r6
+    r46 = r11*r22 + r16*r26 + r16*r29
+    r47 = -x*(-r35 - r37 + r39) - y*(r26*r44 + r29*r44 + r45) - z*(-r30 - r46)
+    r48 = c*r6
+    r49 = a*r12
+    r50 = r11*r31
+    r51 = r20**(-2.0)
+    r52 = r51*(d + x*(-r19 - r50) + y*(-r48 + r49) + z*(r13 + r15))
+    r53 = 2*b
+    r54 = -r53 - 2.0e-16
+    r55 = r25*r54
+    r56 = r1*r28
+    r57 = r1*r33
+    r58 = -r1*r28
+    r59 = b*r57 + b*r58 + r6
+    r60 = c*r57
+    r61 = c*r58
+    r62 = a*r11
+    r63 = r42*r55 + r42*r56 + r62
+    r64 = r31*r55 + r31*r56
+    r65 = r11*r53 + r18*r55 + r18*r56
+    r66 = a*r57
+    r67 = a*r58
+    r68 = r14 + r44*r55 + r44*r56
+    r69 = r16*r55 + r16*r56
+    r70 = -x*(a*c*r1*r27*r5 + a*c*r10*r24*r54 - r59) - y*(r66 + r67 + r68) - z*(-r65 - r69)
+    r71 = 2*c
+    r72 = -r71 - 2.0e-16
+    r73 = r2*r33
+    r74 = -r2*r28
+    r75 = c*r73 + c*r74 + r6
+    r76 = b*r73
+    r77 = b*r74
+    r78 = r25*r72
+    r79 = r2*r28
+    r80 = r38*r78 + r38*r79 + r62
+    r81 = r18*r78 + r18*r79
+    r82 = r11*r71 + r31*r78 + r31*r79
+    r83 = r16*r78 + r16*r79
+    r84 = a*r73
+    r85 = a*r74
+    r86 = r12 + r44*r78 + r44*r79
+    r87 = -x*(-r76 - r77 + r80) - y*(r84 + r85 + r86) - z*(-r81 - r83)
+    r88 = r51*(e + x*(r48 + r49) + y*(-r17 - r50 + 1) + z*(b*c*r10*r8 - r7))
+    out = numpy.empty(numpy.broadcast(a, b, c, d, e, f, x, y, z).shape + (2, 6))
+    out[..., 0, 0] = r21*(x*(-r30 - r32) + y*(-r40 - r41 + r43) + z*(r35 + r37 + r39)) + r47*r52
+    out[..., 0, 1] = r21*(x*(-r64 - r65) + y*(-r60 - r61 + r63) + z*(r38*r55 + r38*r56 + r59)) + r52*r70
+    out[..., 0, 2] = r21*(x*(-r81 - r82) + y*(a*b*r10*r24*r72 + a*b*r2*r27*r5 - r75) + z*(r76 + r77 + r80)) + r52*r87
+    out[..., 0, 3] = r21
+    out[..., 0, 4] = 0
+    out[..., 0, 5] = -r52
+    out[..., 1, 0] = r21*(x*(r40 + r41 + r43) + y*(-r32 - r46) + z*(b*c*r0*r27*r5 + b*c*r10*r23*r24 - r45)) + r47*r88
+    out[..., 1, 1] = r21*(x*(r60 + r61 + r63) + y*(-r64 - r69) + z*(-r66 - r67 + r68)) + r70*r88
+    out[..., 1, 2] = r21*(x*(r42*r78 + r42*r79 + r75) + y*(-r82 - r83) + z*(-r84 - r85 + r86)) + r87*r88
+    out[..., 1, 3] = 0
+    out[..., 1, 4] = r21
+    out[..., 1, 5] = -r88
+    return out
+
+
+def point_jacobian_(a, b, c, d, e, f, x, y, z):
+    r0 = (a + 1.0e-16)**2 + (b + 1.0e-16)**2 + (c + 1.0e-16)**2
+    r1 = numpy.sqrt(r0)
+    r2 = (1 - numpy.cos(r1))/r0
+    r3 = c**2*r2
+    r4 = b**2*r2 - 1
+    r5 = -r3 - r4
+    r6 = numpy.sin(r1)/r1
+    r7 = a*r6
+    r8 = c*r2
+    r9 = b*r8
+    r10 = r7 + r9
+    r11 = b*r6
+    r12 = a*r8
+    r13 = -r11 + r12
+    r14 = a**2*r2
+    r15 = r14 + r4
+    r16 = f + r10*y + r13*x - r15*z + 1.0e-16
+    r17 = r16**(-1.0)
+    r18 = -r13
+    r19 = r16**(-2.0)
+    r20 = r11 + r12
+    r21 = c*r6
+    r22 = a*b*r2
+    r23 = -r21 + r22
+    r24 = r19*(d + r20*z + r23*y + r5*x)
+    r25 = -r10
+    r26 = r21 + r22
+    r27 = -r7 + r9
+    r28 = -r14 - r3 + 1
+    r29 = r19*(e + r26*x + r27*z + r28*y)
+    out = numpy.empty(numpy.broadcast(a, b, c, d, e, f, x, y, z).shape + (2, 3))
+    out[..., 0, 0] = r17*r5 + r18*r24
+    out[..., 0, 1] = r17*r23 + r24*r25
+    out[..., 0, 2] = r15*r24 + r17*r20
+    out[..., 1, 0] = r17*r26 + r18*r29
+    out[..., 1, 1] = r17*r28 + r25*r29
+    out[..., 1, 2] = r15*r29 + r17*r27
+    return out
@@ -1,6 +1,6 @@
 import numpy as np
 
-from tadataka.matrix import solve_linear
+from tadataka.matrix import solve_linear, to_homogeneous
 
 
 def linear_triangulation_(rotations, translations, keypoints):
@@ -70,11 +70,154 @@ def linear_triangulation(rotations, translations, keypoints):
     assert(translations.shape[1] == 3)
     assert(keypoints.shape[2] == 2)
 
-    n_poses, n_points = keypoints.shape[0:2]
-    points = np.empty((n_points, 3))
-    depths = np.empty((n_poses, n_points))
-    for i in range(n_points):
-        points[i], depths[:, i] = linear_triangulation_(
-            rotations, translations, keypoints[:, i]
-        )
+    # Same as 'linear_triangulation_' but all points are solved at once
+    points = solve_stacked(rotations, translations,
+                           keypoints.transpose(1, 0, 2))
+    depths = np.dot(rotations[:, 2], points.T) + translations[:, [2]]
+    depths[:, np.isinf(points[:, 0])] = np.nan
     return points, depths
+
+
+def solve_stacked(rotations, translations, keypoints):
+    """
+    Args:
+        rotations : np.ndarray (n_points, n_poses, 3, 3) or (n_poses, 3, 3)
+        translations : np.ndarray (n_points, n_poses, 3) or (n_poses, 3)
+        keypoints : np.ndarray (n_points, n_poses, 2)
+            keypoints[i, j] is an observation of the i-th point
+            from the viewpoint (rotations[i, j], translations[i, j])
+    Returns:
+        points : np.ndarray (n_points, 3)
+            Triangulated points. Filled with inf if not triangulatable
+    """
+
+    n_points, n_poses = keypoints.shape[0:2]
+
+    # A.shape == (n_points, 2 * n_poses, 4)
+    # each A[i] is the same matrix as 'linear_triangulation_' builds
+    xs, ys = keypoints[..., [0]], keypoints[..., [1]]
+    r0, r1, r2 = rotations[..., 0, :], rotations[..., 1, :], rotations[..., 2, :]
+    t0, t1, t2 = translations[..., 0], translations[..., 1], translations[..., 2]
+
+    A = np.empty((n_points, 2 * n_poses, 4))
+    A[:, 0::2, 0:3] = xs * r2 - r0
+    A[:, 1::2, 0:3] = ys * r2 - r1
+    A[:, 0::2, 3] = xs[..., 0] * t2 - t0
+    A[:, 1::2, 3] = ys[..., 0] * t2 - t1
+
+    x = solve_linear(A)
+
+    invalid = np.isclose(x[:, 3], 0)
+    x[invalid, 3] = 1  # avoid zero division
+
+    points = x[:, 0:3] / x[:, [3]]
+    points[invalid] = np.inf
+    return points
+
+
+def sparse_linear_triangulation(rotations, translations,
+                                viewpoint_indices, point_indices, keypoints):
+    """
+    Triangulate points each of which is observed from
+    a different subset of viewpoints
+
+    Args:
+        rotations : np.ndarray (n_poses, 3, 3)
+        translations : np.ndarray (n_poses, 3)
+        viewpoint_indices : np.ndarray (n_observations,)
+        point_indices : np.ndarray (n_observations,)
+            keypoints[k] is an observation of the point_indices[k]-th point
+            from the viewpoint_indices[k]-th viewpoint.
+            Point indices have to be in range [0, n_points)
+        keypoints : np.ndarray (n_observations, 2)
+    Returns:
+        points : np.ndarray (n_points, 3)
+            Triangulated points. Points observed from less than 2 viewpoints
+            are filled with inf
+        depths : np.ndarray (n_observations,)
+            depths[k] is the depth of the point_indices[k]-th point from
+            the viewpoint_indices[k]-th viewpoint
+    """
+
+    viewpoint_indices = np.asarray(viewpoint_indices)
+    point_indices = np.asarray(point_indices)
+
+    assert(len(viewpoint_indices) == len(point_indices) == len(keypoints))
+    assert(rotations.shape[0] == translations.shape[0])
+
+    n_points = np.max(point_indices) + 1 if len(point_indices) > 0 else 0
+
+    # sort observations by point index so that observations of
+    # the same point are contiguous
+    order = np.argsort(point_indices, kind='stable')
+    track_lengths = np.bincount(point_indices, minlength=n_points)
+    offsets = np.cumsum(track_lengths) - track_lengths
+
+    points = np.full((n_points, 3), np.inf)
+
+    # points that have the same track length are solved at once
+    for n_poses in np.unique(track_lengths):
+        if n_poses < 2:
+            continue
+        indices = np.where(track_lengths == n_poses)[0]
+        # observations[i, j] is the j-th observation of the i-th point
+        observations = order[offsets[indices, np.newaxis] + np.arange(n_poses)]
+        viewpoints = viewpoint_indices[observations]
+        points[indices] = solve_stacked(rotations[viewpoints],
+                                        translations[viewpoints],
+                                        keypoints[observations])
+
+    P = points[point_indices]
+    depths = (np.sum(rotations[viewpoint_indices, 2] * P, axis=1) +
+              translations[viewpoint_indices, 2])
+    depths[np.isinf(P[:, 0])] = np.nan
+    return points, depths
+
+
+def two_view_depths(R0, t0, R1, t1, keypoints0, keypoints1, threshold=1e-10):
+    """
+    Args:
+        R0, R1 : np.ndarray (3, 3)
+            rotation matrices
+        t0, t1 : np.ndarray (3,)
+            translation vectors
+        keypoints0, keypoints1 : np.ndarray (n_keypoints, 2)
+            corresponding keypoints in normalized coordinates
+        threshold : float
+            rays are regarded as parallel if the squared sine of
+            the angle between them is less than this value
+    Returns:
+        depths : np.ndarray (n_keypoints, 2)
+            depths from the first and the second viewpoint.
+            NaN if the rays are nearly parallel
+    """
+
+    assert(keypoints0.shape == keypoints1.shape)
+
+    # R0 * X + t0 = depth0 * y0
+    # R1 * X + t1 = depth1 * y1
+    # Let a = R0.T * y0, c = R1.T * y1 and b = R0.T * t0 - R1.T * t1. Then
+    # b = depth0 * a - depth1 * c
+    # The least squares solution is obtained by solving
+    # the 2x2 normal equations in closed form
+    # [ a.a  -a.c] [depth0] = [ a.b]
+    # [-a.c   c.c] [depth1]   [-c.b]
+
+    A = np.dot(to_homogeneous(keypoints0), R0)  # a = R0.T * y0
+    C = np.dot(to_homogeneous(keypoints1), R1)  # c = R1.T * y1
+    b = np.dot(R0.T, t0) - np.dot(R1.T, t1)
+
+    aa = np.sum(A * A, axis=1)
+    cc = np.sum(C * C, axis=1)
+    ac = np.sum(A * C, axis=1)
+    ab, cb = np.dot(A, b), np.dot(C, b)
+
+    det = aa * cc - ac * ac
+    # det / (aa * cc) is the squared sine of the angle between rays
+    parallel = det <= threshold * aa * cc
+    det[parallel] = 1  # avoid zero division
+
+    depths = np.column_stack(((cc * ab - ac * cb) / det,
+                              (ac * ab - aa * cb) / det))
+    depths[parallel] = np.nan
+    return depths
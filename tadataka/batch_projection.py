@@ -0,0 +1,148 @@
+import numpy as np
+
+
+EPSILON = 1e-16
+
+
+# Vectorized counterparts of 'projection', 'pose_jacobian' and
+# 'point_jacobian' in 'tadataka.so3_codegen'.
+# Each row of 'poses' is [omega, t] where omega is a rotation vector,
+# and 'poses[k]' is paired with 'points[k]'.
+# All functions compute values for all pairs at once.
+
+
+def tangents_so3(V):
+    """
+    Compute skew-symmetric matrices of given vectors
+
+    Args:
+        V: np.ndarray, shape (N, 3)
+    Returns:
+        np.ndarray, shape (N, 3, 3)
+    """
+    K = np.zeros((V.shape[0], 3, 3))
+    K[:, 0, 1] = -V[:, 2]
+    K[:, 0, 2] = V[:, 1]
+    K[:, 1, 0] = V[:, 2]
+    K[:, 1, 2] = -V[:, 0]
+    K[:, 2, 0] = -V[:, 1]
+    K[:, 2, 1] = V[:, 0]
+    return K
+
+
+def exp_so3(omegas):
+    # Rodrigues' formula
+    # R = I + sin(theta) * K + (1 - cos(theta)) * K * K
+    # where theta = |omega| and K = tangent(omega / theta)
+    theta = np.linalg.norm(omegas, axis=1)
+    nonzero = theta > 0
+
+    axes = np.zeros(omegas.shape)
+    axes[nonzero] = omegas[nonzero] / theta[nonzero].reshape(-1, 1)
+
+    K = tangents_so3(axes)
+    KK = np.matmul(K, K)
+    s = np.sin(theta).reshape(-1, 1, 1)
+    c = np.cos(theta).reshape(-1, 1, 1)
+    return np.identity(3) + s * K + (1 - c) * KK
+
+
+def transform(rotations, translations, points):
+    # same as [np.dot(R, p) + t for R, t, p in zip(...)]
+    return np.einsum('ijk,ik->ij', rotations, points) + translations
+
+
+def pi(P):
+    return P[:, 0:2] / (P[:, [2]] + EPSILON)
+
+
+def pi_jacobian(P):
+    # derivative of pi(P) with respect to P
+    x, y, z = P[:, 0], P[:, 1], P[:, 2] + EPSILON
+    JP = np.zeros((P.shape[0], 2, 3))
+    JP[:, 0, 0] = 1 / z
+    JP[:, 0, 2] = -x / (z * z)
+    JP[:, 1, 1] = 1 / z
+    JP[:, 1, 2] = -y / (z * z)
+    return JP
+
+
+def rotation_jacobian(omegas, rotations, points, threshold=1e-8):
+    """
+    Derivative of R(omega) * p with respect to omega
+
+    Gallego, Guillermo, and Anthony Yezzi.
+    "A compact formula for the derivative of a 3-D rotation in
+    exponential coordinates."
+    Journal of Mathematical Imaging and Vision 51.3 (2015): 378-384.
+    """
+
+    # d(R * p) / d(omega) =
+    #   -R * [p]_x * (omega * omega^T + (R^T - I) * [omega]_x) / theta^2
+    # which converges to -[p]_x when theta -> 0
+
+    N = omegas.shape[0]
+    theta_squared = np.sum(np.power(omegas, 2), axis=1)
+    small = theta_squared < threshold * threshold
+
+    P = tangents_so3(points)
+
+    JR = np.empty((N, 3, 3))
+    JR[small] = -P[small]
+
+    large = ~small
+    if not np.any(large):
+        return JR
+
+    omegas, R, P = omegas[large], rotations[large], P[large]
+    RT = np.swapaxes(R, 1, 2)
+    M = (np.einsum('ij,ik->ijk', omegas, omegas) +
+         np.matmul(RT - np.identity(3), tangents_so3(omegas)))
+    M = M / theta_squared[large].reshape(-1, 1, 1)
+    JR[large] = -np.matmul(np.matmul(R, P), M)
+    return JR
+
+
+def projection(poses, points):
+    """
+    Args:
+        poses: np.ndarray, shape (N, 6)
+        points: np.ndarray, shape (N, 3)
+    Returns:
+        np.ndarray, shape (N, 2)
+            Projections of 'points[k]' by 'poses[k]'
+    """
+    omegas, translations = poses[:, 0:3], poses[:, 3:6]
+    return pi(transform(exp_so3(omegas), translations, points))
+
+
+def jacobians(poses, points):
+    """
+    Args:
+        poses: np.ndarray, shape (N, 6)
+        points: np.ndarray, shape (N, 3)
+    Returns:
+        A: np.ndarray, shape (N, 2, 6)
+            Jacobian of projection with respect to poses
+        B: np.ndarray, shape (N, 2, 3)
+            Jacobian of projection with respect to points
+    """
+    omegas, translations = poses[:, 0:3], poses[:, 3:6]
+    R = exp_so3(omegas)
+    JP = pi_jacobian(transform(R, translations, points))
+
+    A = np.empty((poses.shape[0], 2, 6))
+    A[:, :, 0:3] = np.matmul(JP, rotation_jacobian(omegas, R, points))
+    A[:, :, 3:6] = JP
+    B = np.matmul(JP, R)
+    return A, B
+
+
+def pose_jacobian(poses, points):
+    A, _ = jacobians(poses, points)
+    return A
+
+
+def point_jacobian(poses, points):
+    _, B = jacobians(poses, points)
+    return B
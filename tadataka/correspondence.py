@@ -7,23 +7,71 @@ from bidict import bidict
 from tadataka.random import random_bytes
 
 
+# A correspondence between points and keypoints in a viewpoint is
+# represented either by
+#   - a bidict of point hash -> keypoint index, or
+#   - a dense int array of keypoint index -> point id where
+#     -1 means that the keypoint has no corresponding point and
+#     REJECTED means that the keypoint was judged as an outlier and
+#     must not be associated with any point.
+# Functions below accept both and lookups on dense arrays are done
+# by single gathers
+
+
+REJECTED = -2
+
+
 def init_correspondence(*args, **kwargs):
     return bidict(*args, **kwargs)
 
 
+def dense_correspondence(point_ids, keypoint_indices, n_keypoints):
+    """
+    Create a dense array of keypoint index -> point id
+    """
+    assert(len(point_ids) == len(keypoint_indices))
+    correspondence = np.full(n_keypoints, -1, dtype=np.int64)
+    correspondence[keypoint_indices] = point_ids
+    return correspondence
+
+
+def is_dense(correspondence):
+    return isinstance(correspondence, np.ndarray)
+
+
 def point_by_keypoint(point_keypoint_map, keypoint_index):
+    if is_dense(point_keypoint_map):
+        point_id = point_keypoint_map[keypoint_index]
+        if point_id < 0:
+            raise KeyError(keypoint_index)
+        return point_id
     return point_keypoint_map.inverse[keypoint_index]
 
 
 def point_exists(point_keypoint_map, keypoint_index):
-    return keypoint_index in point_keypoint_map.values()
+    if is_dense(point_keypoint_map):
+        return point_keypoint_map[keypoint_index] >= 0
+    return keypoint_index in point_keypoint_map.inverse
 
 
 def get_point_hashes(point_keypoint_map, keypoint_indices):
+    if is_dense(point_keypoint_map):
+        return point_keypoint_map[keypoint_indices]
     return [point_by_keypoint(point_keypoint_map, i) for i in keypoint_indices]
 
 
 def get_indices(correspondence, matches01):
+    """
+    Returns points corresponding to keypoints matches01[:, 0] and
+    the matched keypoint indices matches01[:, 1].
+    Matches whose keypoints in viewpoint 0 have no corresponding
+    points are skipped
+    """
+    if is_dense(correspondence):
+        point_ids0 = correspondence[matches01[:, 0]]
+        mask = point_ids0 >= 0
+        return point_ids0[mask], matches01[mask, 1]
+
     point_hashes0 = []
     keypoint_indices1 = []
     for index0, index1 in matches01:
@@ -61,12 +109,27 @@ def subscribe(point_array, matches01):
 
 
 def is_triangulated(correspondence, indices):
-    return np.array([point_exists(correspondence, i) for i in indices])
+    if is_dense(correspondence):
+        return correspondence[indices] >= 0
+    return np.array([point_exists(correspondence, i) for i in indices],
+                    dtype=np.bool_)
+
+
+def is_rejected(correspondence, indices):
+    if is_dense(correspondence):
+        return correspondence[indices] == REJECTED
+    # a bidict doesn't hold rejected keypoints
+    return np.zeros(len(indices), dtype=np.bool_)
 
 
 def associate_triangulated(correspondence0, matches01):
     # Find keypoints that have corresponding 3D points
     # If keypoint in one frame has corresponding 3D point,
-    # associate it to the matched keypoint in the other frame
+    # associate it to the matched keypoint in the other frame.
+    # For a dense correspondence, (point ids, keypoint indices) are
+    # returned instead of a bidict
+    if is_dense(correspondence0):
+        return get_indices(correspondence0, matches01)
+
     point_hashes0 = get_point_hashes(correspondence0, matches01[:, 0])
     return init_correspondence(zip(point_hashes0, matches01[:, 1]))
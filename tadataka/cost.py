@@ -1,6 +1,7 @@
 import numpy as np
 from skimage.transform import ProjectiveTransform
 
+from tadataka.exceptions import print_error
 from tadataka.stat import ChiSquaredTest
 
 
@@ -0,0 +1,202 @@
+import itertools
+
+import numpy as np
+
+from tadataka.fundamental import epipolar_constraints, sampson_distances
+from tadataka.ransac import ransac
+
+
+# Five-point essential matrix estimation vectorized over sample sets.
+# Keypoints have to be normalized, i.e. K = I.
+#
+# E is searched in the 4-dimensional null space of the epipolar
+# constraints, E = x * X + y * Y + z * Z + W, and (x, y, z) are
+# determined by the cubic constraints
+#     det(E) = 0
+#     2 * E * E^T * E - trace(E * E^T) * E = 0
+# which are solved by the hidden variable method.
+#
+# Li, Hongdong, and Richard Hartley.
+# "Five-point motion estimation made easy."
+# 18th International Conference on Pattern Recognition (ICPR'06). 2006.
+
+
+# exponents (a, b, c) of monomials x^a * y^b * z^c of degree <= 3
+MONOMIALS = [m for m in itertools.product(range(4), repeat=3) if sum(m) <= 3]
+MONOMIAL_INDEX = {m: i for i, m in enumerate(MONOMIALS)}
+N_MONOMIALS = len(MONOMIALS)  # 20
+
+
+def multiplication_table():
+    # T[i, j, k] = 1 if MONOMIALS[i] * MONOMIALS[j] == MONOMIALS[k]
+    T = np.zeros((N_MONOMIALS, N_MONOMIALS, N_MONOMIALS))
+    for i, j in itertools.product(range(N_MONOMIALS), repeat=2):
+        m = tuple(np.add(MONOMIALS[i], MONOMIALS[j]))
+        if m in MONOMIAL_INDEX:
+            T[i, j, MONOMIAL_INDEX[m]] = 1
+    return T
+
+
+MULTIPLICATION_TABLE = multiplication_table()
+
+
+def multiply(p, q):
+    # product of polynomials represented by coefficient arrays
+    # of shape (..., N_MONOMIALS). The degree must not exceed 3
+    return np.einsum('...i,...j,ijk->...k', p, q, MULTIPLICATION_TABLE)
+
+
+def linear_polynomials(X, Y, Z, W):
+    """
+    Represent E = x * X + y * Y + z * Z + W as a matrix of polynomials
+    X, Y, Z, W: np.ndarray (n_sets, 3, 3)
+    Returns np.ndarray (n_sets, 3, 3, N_MONOMIALS)
+    """
+    E = np.zeros(X.shape + (N_MONOMIALS,))
+    E[..., MONOMIAL_INDEX[(1, 0, 0)]] = X
+    E[..., MONOMIAL_INDEX[(0, 1, 0)]] = Y
+    E[..., MONOMIAL_INDEX[(0, 0, 1)]] = Z
+    E[..., MONOMIAL_INDEX[(0, 0, 0)]] = W
+    return E
+
+
+def determinant(E):
+    def minor(i, j, k, l):
+        return (multiply(E[:, i, k], E[:, j, l]) -
+                multiply(E[:, i, l], E[:, j, k]))
+
+    return (multiply(E[:, 0, 0], minor(1, 2, 1, 2)) -
+            multiply(E[:, 0, 1], minor(1, 2, 0, 2)) +
+            multiply(E[:, 0, 2], minor(1, 2, 0, 1)))
+
+
+def trace_constraints(E):
+    # 2 * E * E^T * E - trace(E * E^T) * E
+    EEt = np.zeros(E.shape)
+    for i, j, k in itertools.product(range(3), repeat=3):
+        EEt[:, i, j] += multiply(E[:, i, k], E[:, j, k])
+
+    trace = EEt[:, 0, 0] + EEt[:, 1, 1] + EEt[:, 2, 2]
+
+    C = np.zeros(E.shape)
+    for i, j in itertools.product(range(3), repeat=2):
+        C[:, i, j] = -multiply(trace, E[:, i, j])
+        for k in range(3):
+            C[:, i, j] += 2 * multiply(EEt[:, i, k], E[:, k, j])
+    return C.reshape(-1, 9, N_MONOMIALS)
+
+
+# monomials of x and y regarding z as a hidden variable
+XY_MONOMIALS = [(a, b) for a in range(4) for b in range(4) if a + b <= 3]
+
+
+def hidden_variable_matrices(M):
+    """
+    Rewrite polynomial equations M * monomials = 0 as
+    (C0 + z * C1 + z^2 * C2 + z^3 * C3) * v = 0
+    where v is a vector of XY_MONOMIALS.
+    M: np.ndarray (n_sets, 10, N_MONOMIALS)
+    Returns np.ndarray (4, n_sets, 10, 10)
+    """
+    C = np.zeros((4,) + M.shape[0:2] + (len(XY_MONOMIALS),))
+    for j, (a, b) in enumerate(XY_MONOMIALS):
+        for c in range(4 - a - b):
+            C[c, :, :, j] = M[:, :, MONOMIAL_INDEX[(a, b, c)]]
+    return C
+
+
+def nonsingular_sets(C0, max_condition=1e10):
+    # sample sets whose C0 can be inverted. C0 becomes singular
+    # for degenerate samples such as coincident points or zero motion
+    finite = np.all(np.isfinite(C0), axis=(1, 2))
+    nonsingular = np.zeros(C0.shape[0], dtype=np.bool_)
+    nonsingular[finite] = np.linalg.cond(C0[finite]) < max_condition
+    return np.flatnonzero(nonsingular)
+
+
+def solve_hidden_variable(C, eps=1e-8):
+    """
+    Solve det(C0 + z * C1 + z^2 * C2 + z^3 * C3) = 0.
+    C3 is singular so the equation is rewritten with w = 1 / z as
+    (C3 + w * C2 + w^2 * C1 + w^3 * C0) * v = 0
+    and solved as an eigenvalue problem of the companion matrix.
+    Sample sets with singular C0 are skipped.
+    Returns (set indices, x, y, z) of real solutions
+    """
+    sets = nonsingular_sets(C[0])
+    if len(sets) == 0:
+        empty = np.empty(0)
+        return np.empty(0, dtype=np.int64), empty, empty, empty
+
+    C0, C1, C2, C3 = C[:, sets]
+    n_sets, n = C0.shape[0:2]
+
+    C0_inv = np.linalg.inv(C0)
+    L = np.zeros((n_sets, 3 * n, 3 * n))
+    L[:, 0:n, n:2*n] = np.identity(n)
+    L[:, n:2*n, 2*n:3*n] = np.identity(n)
+    L[:, 2*n:3*n, 0:n] = -np.matmul(C0_inv, C3)
+    L[:, 2*n:3*n, n:2*n] = -np.matmul(C0_inv, C2)
+    L[:, 2*n:3*n, 2*n:3*n] = -np.matmul(C0_inv, C1)
+
+    w, V = np.linalg.eig(L)
+
+    # w == 0 corresponds to z == inf
+    valid = (np.abs(w.imag) < eps) & (np.abs(w.real) > eps)
+    set_indices, solution_indices = np.where(valid)
+
+    w = w.real[set_indices, solution_indices]
+    v = V[set_indices, 0:n, solution_indices].real
+
+    one = XY_MONOMIALS.index((0, 0))
+    x = v[:, XY_MONOMIALS.index((1, 0))] / v[:, one]
+    y = v[:, XY_MONOMIALS.index((0, 1))] / v[:, one]
+    return sets[set_indices], x, y, 1 / w
+
+
+def five_point(X0, X1):
+    """
+    X0, X1 : np.ndarray (n_sets, 5, 2)
+        Normalized keypoints
+    Returns up to 10 essential matrices per sample set
+    as an array of shape (n_models, 3, 3)
+    """
+    A = epipolar_constraints(X0, X1)  # (n_sets, 5, 9)
+    _, _, VH = np.linalg.svd(A)
+    X, Y, Z, W = [VH[:, k].reshape(-1, 3, 3) for k in range(5, 9)]
+
+    E = linear_polynomials(X, Y, Z, W)
+    M = np.concatenate((determinant(E)[:, np.newaxis],
+                        trace_constraints(E)), axis=1)
+
+    with np.errstate(all='ignore'):
+        set_indices, x, y, z = solve_hidden_variable(
+            hidden_variable_matrices(M)
+        )
+
+    x, y, z = [v.reshape(-1, 1, 1) for v in (x, y, z)]
+    E = (x * X[set_indices] + y * Y[set_indices] + z * Z[set_indices] +
+         W[set_indices])
+    E = E / np.linalg.norm(E, axis=(1, 2), keepdims=True)
+    return E[np.all(np.isfinite(E), axis=(1, 2))]
+
+
+def ransac_essential(keypoints0, keypoints1, residual_threshold=3e-3,
+                     max_trials=100, confidence=0.99, random_state=3939):
+    """
+    Estimate the essential matrix robustly from normalized keypoints.
+    E satisfies x1^T * E * x0 = 0.
+    Returns the essential matrix and the inlier mask
+    """
+
+    assert(keypoints0.shape == keypoints1.shape)
+
+    def estimate(samples):
+        return five_point(keypoints0[samples], keypoints1[samples])
+
+    def residuals(E):
+        return sampson_distances(E, keypoints0, keypoints1)
+
+    return ransac(estimate, residuals, keypoints0.shape[0], 5,
+                  residual_threshold, max_trials=max_trials,
+                  confidence=confidence, random_state=random_state)
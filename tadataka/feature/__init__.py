@@ -1,3 +1,5 @@
 from tadataka.feature.feature import (
     extract_features, empty_match, Features, Matcher
 )
+from tadataka.feature.grid import KeypointGrid
+from tadataka.feature.guided import match_by_projection
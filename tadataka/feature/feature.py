@@ -1,8 +1,8 @@
 import warnings
 from collections import namedtuple
+from functools import lru_cache
 
 import numpy as np
-import cv2
 
 from skimage import img_as_ubyte
 from skimage.feature import corner_peaks, corner_harris, BRIEF, ORB
@@ -12,6 +12,7 @@ from skimage.measure import ransac
 from skimage import exposure
 
 from tadataka.coordinates import yx_to_xy, xy_to_yx
+from tadataka import essential, fundamental
 from tadataka.cost import symmetric_transfer_filter
 from tadataka.match import match_descriptors
 
@@ -19,8 +20,6 @@ from tadataka.match import match_descriptors
 Features = namedtuple("Features", ["keypoints", "descriptors"])
 
 
-keypoint_detector = cv2.FastFeatureDetector_create(threshold=50)
-
 brief = BRIEF(
     descriptor_size=512,
     patch_size=64,
@@ -40,8 +39,15 @@ def to_opencv_format(image):
         return img_as_ubyte(image)
 
 
+@lru_cache(maxsize=None)
+def keypoint_detector():
+    # OpenCV is imported only when FAST keypoints are extracted
+    import cv2
+    return cv2.FastFeatureDetector_create(threshold=50)
+
+
 def extract_keypoints(image):
-    keypoints = keypoint_detector.detect(to_opencv_format(image), None)
+    keypoints = keypoint_detector().detect(to_opencv_format(image), None)
     if len(keypoints) == 0:
         return np.empty((0, 2), dtype=np.float64)
     return np.array([list(p.pt) for p in keypoints])
@@ -76,32 +82,54 @@ def match(descriptors0, descriptors1):
     return match_descriptors(descriptors0, descriptors1, cross_check=True, max_ratio=0.8)
 
 
-def ransac_affine(keypoints1, keypoints2):
+def ransac_affine(keypoints1, keypoints2, random_state=3939):
     # estimate inliers using ransac on AffineTransform
     tform, inliers_mask = ransac((keypoints1, keypoints2),
                                  tf.AffineTransform,
-                                 min_samples=2, random_state=3939,
+                                 min_samples=2, random_state=random_state,
                                  residual_threshold=1, max_trials=100)
     return tform.params, inliers_mask
 
 
-def ransac_fundamental(keypoints1, keypoints2):
-    # estimate inliers using ransac on FundamentalMatrixTransform
-    tform, inliers_mask = ransac((keypoints1, keypoints2),
-                                 tf.FundamentalMatrixTransform,
-                                 random_state=3939, min_samples=8,
-                                 residual_threshold=1, max_trials=100)
-    return tform.params, inliers_mask
+def ransac_fundamental(keypoints1, keypoints2, random_state=3939):
+    # estimate inliers using ransac on the fundamental matrix
+    return fundamental.ransac_fundamental(keypoints1, keypoints2,
+                                          residual_threshold=1,
+                                          max_trials=100,
+                                          random_state=random_state)
+
+
+def ransac_essential(keypoints1, keypoints2, random_state=3939):
+    # estimate inliers using ransac on the essential matrix
+    # keypoints have to be normalized
+    return essential.ransac_essential(keypoints1, keypoints2,
+                                      residual_threshold=3e-3,
+                                      max_trials=100,
+                                      random_state=random_state)
 
 
 class Matcher(object):
-    def __init__(self, enable_ransac=True, enable_homography_filter=True):
+    def __init__(self, enable_ransac=True, enable_homography_filter=True,
+                 random_state=3939, model='fundamental'):
+        """
+        model : 'fundamental' or 'essential'
+            Model used for the geometric verification by RANSAC.
+            'essential' requires normalized keypoints
+        """
+        assert(model in ('fundamental', 'essential'))
         self.enable_ransac = enable_ransac
         self.enable_homography_filter = enable_homography_filter
+        self.model = model
+        # RANSAC is seeded by this fixed value at every call so that
+        # the result does not depend on the order of calls,
+        # even if the matcher is called from multiple threads or processes
+        self.random_state = random_state
 
     def _ransac(self, keypoints1, keypoints2):
         assert(len(keypoints1) == len(keypoints2))
-        _, inliers_mask = ransac_fundamental(keypoints1, keypoints2)
+        estimate = {'fundamental': ransac_fundamental,
+                    'essential': ransac_essential}[self.model]
+        _, inliers_mask = estimate(keypoints1, keypoints2, self.random_state)
         return inliers_mask
 
     def __call__(self, kd1, kd2, min_inliers=12):
@@ -121,15 +149,21 @@ class Matcher(object):
             return matches12
 
         if self.enable_ransac:
-            _, mask = ransac_fundamental(keypoints1[matches12[:, 0]],
-                                         keypoints2[matches12[:, 1]])
+            mask = self._ransac(keypoints1[matches12[:, 0]],
+                                keypoints2[matches12[:, 1]])
             matches12 = matches12[mask]
 
+        # RANSAC finds no inlier if the sample sets are degenerate,
+        # for example when the camera does not move
+        if len(matches12) < min_inliers:
+            return matches12
+
         if self.enable_homography_filter:
             mask = symmetric_transfer_filter(keypoints1[matches12[:, 0]],
                                              keypoints2[matches12[:, 1]],
                                              p=0.95)
-            matches12 = matches12[mask]
+            if mask is not None:
+                matches12 = matches12[mask]
 
         return matches12
 
@@ -0,0 +1,149 @@
+import numpy as np
+from numba import njit
+
+
+@njit(cache=True)
+def cell_range(x, y, radius, origin, cell_size, grid_shape):
+    # cells overlapping with the square [x-radius, x+radius] x [y-radius, y+radius]
+    n_rows, n_cols = grid_shape
+    xmin = int(np.floor((x - radius - origin[0]) / cell_size))
+    xmax = int(np.floor((x + radius - origin[0]) / cell_size))
+    ymin = int(np.floor((y - radius - origin[1]) / cell_size))
+    ymax = int(np.floor((y + radius - origin[1]) / cell_size))
+    return (max(xmin, 0), min(xmax, n_cols - 1),
+            max(ymin, 0), min(ymax, n_rows - 1))
+
+
+@njit(cache=True)
+def count_in_radius(keypoints, offsets, indices, origin, cell_size,
+                    grid_shape, queries, radius):
+    counts = np.zeros(queries.shape[0], dtype=np.int64)
+    r2 = radius * radius
+    n_cols = grid_shape[1]
+    for q in range(queries.shape[0]):
+        x, y = queries[q, 0], queries[q, 1]
+        xmin, xmax, ymin, ymax = cell_range(x, y, radius, origin,
+                                            cell_size, grid_shape)
+        for cy in range(ymin, ymax + 1):
+            for cx in range(xmin, xmax + 1):
+                cell = cy * n_cols + cx
+                for k in indices[offsets[cell]:offsets[cell+1]]:
+                    dx, dy = keypoints[k, 0] - x, keypoints[k, 1] - y
+                    if dx * dx + dy * dy <= r2:
+                        counts[q] += 1
+    return counts
+
+
+@njit(cache=True)
+def query_radius_(keypoints, offsets, indices, origin, cell_size,
+                  grid_shape, queries, radius, query_offsets):
+    result = np.empty(query_offsets[-1], dtype=np.int64)
+    r2 = radius * radius
+    n_cols = grid_shape[1]
+    for q in range(queries.shape[0]):
+        x, y = queries[q, 0], queries[q, 1]
+        xmin, xmax, ymin, ymax = cell_range(x, y, radius, origin,
+                                            cell_size, grid_shape)
+        p = query_offsets[q]
+        for cy in range(ymin, ymax + 1):
+            for cx in range(xmin, xmax + 1):
+                cell = cy * n_cols + cx
+                for k in indices[offsets[cell]:offsets[cell+1]]:
+                    dx, dy = keypoints[k, 0] - x, keypoints[k, 1] - y
+                    if dx * dx + dy * dy <= r2:
+                        result[p] = k
+                        p += 1
+    return result
+
+
+class KeypointGrid(object):
+    def __init__(self, keypoints, cell_size, image_shape=None):
+        """
+        Bucket keypoint indices by square cells of size 'cell_size'.
+        Indices in each cell are stored contiguously:
+        indices[offsets[c]:offsets[c+1]] are keypoints in the c-th cell
+
+        If 'image_shape' is given, the grid covers the image and
+        keypoints out of the image are not registered.
+        Otherwise the grid covers the bounding box of keypoints
+        """
+        assert(keypoints.shape[1] == 2)
+        assert(cell_size > 0)
+
+        self.keypoints = keypoints.astype(np.float64)
+        self.cell_size = float(cell_size)
+
+        if image_shape is not None:
+            height, width = image_shape[0:2]
+            self.origin = np.zeros(2)
+            self.grid_shape = (int(np.ceil(height / self.cell_size)),
+                               int(np.ceil(width / self.cell_size)))
+        elif keypoints.shape[0] == 0:
+            self.origin = np.zeros(2)
+            self.grid_shape = (1, 1)
+        else:
+            self.origin = np.min(self.keypoints, axis=0)
+            n_cols, n_rows = (np.floor((np.max(self.keypoints, axis=0) -
+                                        self.origin) / self.cell_size)
+                              .astype(np.int64) + 1)
+            self.grid_shape = (int(n_rows), int(n_cols))
+
+        cells = self.cell_indices(self.keypoints)
+        inside = np.where(cells >= 0)[0]
+        self.indices = inside[np.argsort(cells[inside], kind='stable')]
+        self.counts = np.bincount(cells[inside], minlength=self.n_cells)
+        self.offsets = np.concatenate(([0], np.cumsum(self.counts)))
+
+    @property
+    def n_cells(self):
+        return self.grid_shape[0] * self.grid_shape[1]
+
+    def cell_indices(self, points):
+        # cell index of each point. -1 if the point is out of the grid
+        n_rows, n_cols = self.grid_shape
+        xs, ys = np.floor((points - self.origin) / self.cell_size).T
+        inside = (0 <= xs) & (xs < n_cols) & (0 <= ys) & (ys < n_rows)
+        cells = np.full(points.shape[0], -1, dtype=np.int64)
+        cells[inside] = (ys[inside] * n_cols + xs[inside]).astype(np.int64)
+        return cells
+
+    def occupied(self, points):
+        """
+        Returns True for each point if the cell that contains the point
+        has at least one keypoint
+        """
+        cells = self.cell_indices(np.atleast_2d(points))
+        mask = np.zeros(len(cells), dtype=np.bool_)
+        inside = cells >= 0
+        mask[inside] = self.counts[cells[inside]] > 0
+        return mask
+
+    def cap(self, max_per_cell, scores=None):
+        """
+        Select at most 'max_per_cell' keypoints from each cell
+        to distribute keypoints uniformly.
+        Keypoints with higher 'scores' are preferred.
+        If 'scores' is None, keypoints with smaller indices are selected.
+        Returns indices of the selected keypoints in ascending order
+        """
+        indices = self.indices
+        cells = np.repeat(np.arange(self.n_cells), self.counts)
+        if scores is not None:
+            # sort by cell, then by descending score
+            order = np.lexsort((-scores[indices], cells))
+            indices, cells = indices[order], cells[order]
+        ranks = np.arange(len(indices)) - self.offsets[cells]
+        return np.sort(indices[ranks < max_per_cell])
+
+    def query_radius(self, points, radius):
+        """
+        Returns indices of keypoints within 'radius' from each point
+        in the CSR format. Keypoints around points[i] are
+        indices[offsets[i]:offsets[i+1]]
+        """
+        points = np.atleast_2d(points).astype(np.float64)
+        args = (self.keypoints, self.offsets, self.indices, self.origin,
+                self.cell_size, self.grid_shape, points, float(radius))
+        counts = count_in_radius(*args)
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        return query_radius_(*args, offsets), offsets
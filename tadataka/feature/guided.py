@@ -0,0 +1,63 @@
+import numpy as np
+
+from tadataka.feature.grid import KeypointGrid
+from tadataka.match import hamming_pairs, pack_descriptors
+
+
+def unique_by_distance(indices, distances):
+    # mask that keeps only the nearest one among elements
+    # that have the same index
+    order = np.lexsort((distances, indices))
+    first = np.ones(len(order), dtype=np.bool_)
+    first[1:] = indices[order][1:] != indices[order][:-1]
+    mask = np.zeros(len(order), dtype=np.bool_)
+    mask[order[first]] = True
+    return mask
+
+
+def match_by_projection(projected, map_descriptors,
+                        keypoints1, descriptors1, radius, max_distance):
+    """
+    Guided matching.
+    Associate map points to keypoints by searching descriptors only
+    within 'radius' around the projected map points.
+
+    Args:
+        projected : np.ndarray (n_map_points, 2)
+            Map points projected onto the image with a predicted pose
+        map_descriptors : np.ndarray (n_map_points, n_bits)
+            Binary descriptors of map points
+        keypoints1 : np.ndarray (n_keypoints, 2)
+        descriptors1 : np.ndarray (n_keypoints, n_bits)
+        radius : float
+            Search radius in the keypoint coordinate
+        max_distance : int
+            Maximum Hamming distance accepted as a match
+    Returns:
+        matches : np.ndarray (n_matches, 2)
+            Pairs of (map point index, keypoint index).
+            Each map point and each keypoint appear at most once
+    """
+
+    assert(map_descriptors.dtype == descriptors1.dtype == np.bool_)
+
+    grid = KeypointGrid(keypoints1, cell_size=radius)
+    candidates, offsets = grid.query_radius(projected, radius)
+    queries = np.repeat(np.arange(len(projected)), np.diff(offsets))
+
+    distances = hamming_pairs(pack_descriptors(map_descriptors),
+                              pack_descriptors(descriptors1),
+                              queries, candidates)
+
+    mask = distances <= max_distance
+    queries, candidates, distances = (queries[mask], candidates[mask],
+                                      distances[mask])
+
+    # the nearest keypoint for each map point
+    mask = unique_by_distance(queries, distances)
+    queries, candidates, distances = (queries[mask], candidates[mask],
+                                      distances[mask])
+
+    # a keypoint can correspond to only one map point
+    mask = unique_by_distance(candidates, distances)
+    return np.column_stack((queries[mask], candidates[mask]))
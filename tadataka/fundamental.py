@@ -0,0 +1,171 @@
+import numpy as np
+
+from tadataka.matrix import solve_linear, to_homogeneous
+from tadataka.ransac import ransac
+
+
+# Fundamental matrix estimation vectorized over sample sets.
+# F satisfies x1^T * F * x0 = 0 for corresponding keypoints x0 and x1
+# in homogeneous coordinates, the same convention as
+# skimage.transform.FundamentalMatrixTransform
+
+
+def normalization_matrices(X):
+    """
+    Hartley normalization of point sets
+    X: np.ndarray (n_sets, n_points, 2)
+    Returns transformation matrices of shape (n_sets, 3, 3) that move
+    the centroid to the origin and make the mean distance sqrt(2)
+    """
+    centroids = np.mean(X, axis=1)
+    d = np.linalg.norm(X - centroids[:, np.newaxis], axis=2)
+    mean = np.mean(d, axis=1)
+    mean[mean == 0] = 1  # avoid zero division
+    s = np.sqrt(2) / mean
+
+    T = np.zeros((X.shape[0], 3, 3))
+    T[:, 0, 0] = T[:, 1, 1] = s
+    T[:, 0:2, 2] = -s[:, np.newaxis] * centroids
+    T[:, 2, 2] = 1
+    return T
+
+
+def normalize(X, T):
+    # apply T to each point set X
+    return np.einsum('sij,snj->sni', T[:, 0:2, 0:2], X) + T[:, np.newaxis, 0:2, 2]
+
+
+def epipolar_constraints(X0, X1):
+    # A[s] * vec(F[s]) = 0 gives x1^T * F * x0 = 0
+    x0, y0 = X0[..., 0], X0[..., 1]
+    x1, y1 = X1[..., 0], X1[..., 1]
+    ones = np.ones(x0.shape)
+    return np.stack((x1 * x0, x1 * y0, x1,
+                     y1 * x0, y1 * y0, y1,
+                     x0, y0, ones), axis=-1)
+
+
+def enforce_rank2(F):
+    U, S, VH = np.linalg.svd(F)
+    S[:, 2] = 0
+    return np.matmul(U * S[:, np.newaxis], VH)
+
+
+def denormalize(F, T0, T1):
+    F = np.matmul(np.matmul(np.swapaxes(T1, 1, 2), F), T0)
+    # fix the scale
+    return F / np.linalg.norm(F, axis=(1, 2), keepdims=True)
+
+
+def eight_point(X0, X1):
+    """
+    X0, X1 : np.ndarray (n_sets, n_points, 2) where n_points >= 8
+    Returns fundamental matrices of shape (n_sets, 3, 3)
+    """
+    T0, T1 = normalization_matrices(X0), normalization_matrices(X1)
+    A = epipolar_constraints(normalize(X0, T0), normalize(X1, T1))
+    F = solve_linear(A).reshape(-1, 3, 3)
+    return denormalize(enforce_rank2(F), T0, T1)
+
+
+def cubic_coefficients(F1, F2):
+    # coefficients of det(a * F1 + (1 - a) * F2) = c3 a^3 + c2 a^2 + c1 a + c0
+    # computed by interpolating the determinant at 4 points
+    alphas = np.array([0., 1., -1., 2.])
+    D = np.stack([np.linalg.det(a * F1 + (1 - a) * F2) for a in alphas],
+                 axis=1)
+    V = np.vander(alphas, 4)
+    return np.linalg.solve(V, D.T).T  # (n_sets, 4), highest degree first
+
+
+def real_cubic_roots(C, eps=1e-8):
+    """
+    C: cubic coefficients of shape (n_sets, 4)
+    Returns (set indices, real roots) for all real roots
+    """
+    # polynomials that are not cubic are skipped
+    valid = np.abs(C[:, 0]) > eps
+    indices = np.where(valid)[0]
+    C = C[valid] / C[valid, 0:1]
+
+    # roots are the eigenvalues of companion matrices
+    M = np.zeros((len(C), 3, 3))
+    M[:, 0, :] = -C[:, 1:4]
+    M[:, 1, 0] = M[:, 2, 1] = 1
+    roots = np.linalg.eigvals(M)
+    real = np.abs(roots.imag) < eps
+    set_indices = np.repeat(indices, 3).reshape(-1, 3)[real]
+    return set_indices, roots.real[real]
+
+
+def seven_point(X0, X1):
+    """
+    X0, X1 : np.ndarray (n_sets, 7, 2)
+    Returns up to 3 fundamental matrices per sample set
+    as an array of shape (n_models, 3, 3)
+    """
+    T0, T1 = normalization_matrices(X0), normalization_matrices(X1)
+    A = epipolar_constraints(normalize(X0, T0), normalize(X1, T1))
+
+    # F is in the 2-dimensional null space spanned by F1 and F2
+    _, _, VH = np.linalg.svd(A)
+    F1, F2 = VH[:, -1].reshape(-1, 3, 3), VH[:, -2].reshape(-1, 3, 3)
+
+    # det(F) == 0
+    set_indices, alphas = real_cubic_roots(cubic_coefficients(F1, F2))
+    a = alphas.reshape(-1, 1, 1)
+    F = a * F1[set_indices] + (1 - a) * F2[set_indices]
+    return denormalize(F, T0[set_indices], T1[set_indices])
+
+
+def sampson_distances(F, keypoints0, keypoints1):
+    """
+    F : np.ndarray (n_models, 3, 3)
+    keypoints0, keypoints1 : np.ndarray (n_points, 2)
+    Returns square roots of the Sampson distances of all models
+    for all points, an array of shape (n_models, n_points)
+    """
+    x0, x1 = to_homogeneous(keypoints0), to_homogeneous(keypoints1)
+    Fx0 = np.einsum('mij,nj->mni', F, x0)
+    Ftx1 = np.einsum('mji,nj->mni', F, x1)
+    x1Fx0 = np.sum(x1 * Fx0, axis=2)
+    d = (Fx0[..., 0] ** 2 + Fx0[..., 1] ** 2 +
+         Ftx1[..., 0] ** 2 + Ftx1[..., 1] ** 2)
+    return np.abs(x1Fx0) / np.sqrt(d)
+
+
+def estimate_fundamental(keypoints0, keypoints1):
+    # least squares estimation by the normalized 8-point algorithm
+    F = eight_point(keypoints0[np.newaxis], keypoints1[np.newaxis])
+    return F[0]
+
+
+def ransac_fundamental(keypoints0, keypoints1, residual_threshold=1.0,
+                       max_trials=100, method='8point', confidence=0.99,
+                       random_state=3939):
+    """
+    Estimate the fundamental matrix robustly.
+    Returns the fundamental matrix re-estimated from all inliers
+    and the inlier mask.
+    method : '8point' or '7point'
+    """
+
+    assert(keypoints0.shape == keypoints1.shape)
+
+    solvers = {'8point': (eight_point, 8), '7point': (seven_point, 7)}
+    solver, min_samples = solvers[method]
+
+    def estimate(samples):
+        return solver(keypoints0[samples], keypoints1[samples])
+
+    def residuals(F):
+        return sampson_distances(F, keypoints0, keypoints1)
+
+    F, inliers = ransac(estimate, residuals, keypoints0.shape[0],
+                        min_samples, residual_threshold,
+                        max_trials=max_trials, confidence=confidence,
+                        random_state=random_state)
+
+    if np.sum(inliers) >= 8:
+        F = estimate_fundamental(keypoints0[inliers], keypoints1[inliers])
+    return F, inliers
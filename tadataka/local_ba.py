@@ -3,64 +3,87 @@ import warnings
 import numpy as np
 
 from scipy.spatial.transform import Rotation
+from scipy.stats import chi2
 from sparseba import SBA, can_run_ba
 
 from tadataka.rigid_transform import transform
 from tadataka.pose import Pose
-from tadataka.so3_codegen import projection, pose_jacobian, point_jacobian
+from tadataka.batch_projection import (projection, jacobians,
+                                       pose_jacobian, point_jacobian)
 
 
 class Projection(object):
     def __init__(self, viewpoint_indices, point_indices):
         assert(len(viewpoint_indices) == len(point_indices))
 
-        self.viewpoint_indices = viewpoint_indices
-        self.point_indices = point_indices
+        self.viewpoint_indices = np.asarray(viewpoint_indices)
+        self.point_indices = np.asarray(point_indices)
 
         self.n_visible = len(self.point_indices)
 
     def compute(self, poses, points):
-        x_pred = np.empty((self.n_visible, 2))
-
-        I = zip(self.viewpoint_indices, self.point_indices)
-        for index, (j, i) in enumerate(I):
-            x_pred[index] = projection(poses[j], points[i])
-        return x_pred
+        return projection(poses[self.viewpoint_indices],
+                          points[self.point_indices])
 
     def jacobians(self, poses, points):
-        A = np.zeros((self.n_visible, 2, 6))
-        B = np.zeros((self.n_visible, 2, 3))
-        I = zip(self.viewpoint_indices, self.point_indices)
-
-        for index, (j, i) in enumerate(I):
-            A[index] = pose_jacobian(poses[j], points[i])
-            B[index] = point_jacobian(poses[j], points[i])
-        return A, B
+        return jacobians(poses[self.viewpoint_indices],
+                         points[self.point_indices])
 
 
 def calc_relative_error(current_error, new_error):
     return np.abs((current_error - new_error) / new_error)
 
 
-def calc_errors(x_true, x_pred):
-    return np.sum(np.power(x_true - x_pred, 2), axis=1)
+def calc_errors(x_true, x_pred, weights=None):
+    d = x_true - x_pred
+    if weights is None:
+        return np.sum(np.power(d, 2), axis=1)
+    return np.einsum('ni,nij,nj->n', d, weights, d)  # d * W * d
+
+
+def calc_error(x_true, x_pred, weights=None):
+    return np.mean(calc_errors(x_true, x_pred, weights))
 
 
-def calc_error(x_true, x_pred):
-    return np.mean(calc_errors(x_true, x_pred))
+def standardized_residuals(x_true, x_pred):
+    # norms of residuals divided by the robust estimate of
+    # the standard deviation of residual elements.
+    # The scale is estimated from the median of the norms, which is
+    # sqrt(2 log 2) times the standard deviation for Gaussian noise.
+    # The median of elements underestimates it when residuals are
+    # anisotropic, e.g. when they are absorbed along epipolar lines
+    r = np.sqrt(calc_errors(x_true, x_pred))
+    scale = np.median(r) / np.sqrt(2 * np.log(2))
+    if scale == 0:
+        return np.zeros(r.shape)
+    return r / scale
 
 
-def update_weights(robustifier, x_true, x_pred, weights):
-    E = calc_errors(x_true, x_pred, weights)
-    I = np.identity(2)
-    return np.array([I * w for w in robustifier.weights(E)])
+def update_weights(robustifier, x_true, x_pred):
+    """
+    robustifier: Weight function of standardized residuals such as
+        'tadataka.robust.weights.compute_weights_huber'
+    """
+    w = robustifier(standardized_residuals(x_true, x_pred))
+    return w.reshape(-1, 1, 1) * np.identity(2)
+
+
+def calc_inliers(x_true, x_pred, p=0.95):
+    # squared norms of standardized residuals follow
+    # the chi-squared distribution with 2 degrees of freedom
+    z = standardized_residuals(x_true, x_pred)
+    return np.power(z, 2) <= chi2.ppf(p, 2)
 
 
 class LocalBundleAdjustment(object):
-    def __init__(self, viewpoint_indices, point_indices, x_true):
+    def __init__(self, viewpoint_indices, point_indices, x_true,
+                 robustifier=None):
         """
         Z = zip(viewpoint_indices, pointpoint_indices)
         x_true = [projection(poses[j], points[i]) for j, i in Z]
+
+        If 'robustifier' is given, observations are reweighted by
+        'robustifier' at every iteration (IRLS)
         """
         assert(len(viewpoint_indices) == x_true.shape[0])
         assert(len(point_indices) == x_true.shape[0])
@@ -68,41 +91,78 @@ class LocalBundleAdjustment(object):
         self.projection = Projection(viewpoint_indices, point_indices)
         self.x_true = x_true
 
-        self.sba = SBA(viewpoint_indices, point_indices)
+        self.robustifier = robustifier
+        self.weights = None
+        self.inliers = np.ones(x_true.shape[0], dtype=np.bool_)
 
-    def calc_update(self, poses, points, mu):
-        x_pred = self.projection.compute(poses, points)
-        A, B = self.projection.jacobians(poses, points)
-        return self.sba.compute(self.x_true, x_pred, A, B, weights=None, mu=mu)
+        self._sba = None
+
+    @property
+    def sba(self):
+        # indexing observations for SBA takes a Python loop over them,
+        # so it is done at the first use and skipped by subclasses
+        # solving the normal equation by themselves
+        if self._sba is None:
+            self._sba = SBA(self.projection.viewpoint_indices,
+                            self.projection.point_indices)
+        return self._sba
+
+    def linearize(self, poses, points):
+        return self.projection.jacobians(poses, points)
+
+    def calc_update(self, x_pred, A, B, mu):
+        # 'x_pred', 'A' and 'B' have to be computed at the same poses
+        # and points, the latter two by 'linearize'
+        return self.sba.compute(self.x_true, x_pred, A, B,
+                                weights=self.weights, mu=mu)
 
     def calc_error(self, poses, points):
         x_pred = self.projection.compute(poses, points)
-        return calc_error(self.x_true, x_pred)
+        return calc_error(self.x_true, x_pred, self.weights)
 
-    def calc_new_error(self, poses, points, mu):
-        dposes, dpoints = self.calc_update(poses, points, mu)
-        error = self.calc_error(poses + dposes, points + dpoints)
-        return dposes, dpoints, error
+    def evaluate(self, poses, points, x_pred=None):
+        # 'x_pred' is reused if it is already computed at (poses, points)
+        if x_pred is None:
+            x_pred = self.projection.compute(poses, points)
+        return x_pred, calc_error(self.x_true, x_pred, self.weights)
 
-    def lm_update(self, poses, points, mu, nu):
-        error0 = self.calc_error(poses, points)
+    def reweight(self, x_pred):
+        self.weights = update_weights(self.robustifier, self.x_true, x_pred)
+
+    def calc_new_error(self, poses, points, x_pred, A, B, mu):
+        dposes, dpoints = self.calc_update(x_pred, A, B, mu)
+        new_poses, new_points = poses + dposes, points + dpoints
+        new_x_pred, error = self.evaluate(new_poses, new_points)
+        return new_poses, new_points, new_x_pred, error
+
+    def lm_update(self, poses, points, x_pred, error0, mu, nu):
+        """
+        x_pred and error0 are the projections and the error at
+        (poses, points). Jacobians are computed only once here and
+        shared among the trials because only 'mu' changes between them.
+        """
+
+        A, B = self.linearize(poses, points)
+
+        def new_error(mu):
+            return self.calc_new_error(poses, points, x_pred, A, B, mu)
 
         new_mu = mu / nu
-        dposes, dpoints, error = self.calc_new_error(poses, points, new_mu)
+        new_poses, new_points, new_x_pred, error = new_error(new_mu)
         if error < error0:
-            return poses + dposes, points + dpoints, new_mu, error
+            return new_poses, new_points, new_x_pred, new_mu, error
 
         new_mu = mu
-        dposes, dpoints, error = self.calc_new_error(poses, points, new_mu)
+        new_poses, new_points, new_x_pred, error = new_error(new_mu)
         if error < error0:
-            return poses + dposes, points + dpoints, new_mu, error
+            return new_poses, new_points, new_x_pred, new_mu, error
 
         error = np.inf
         new_mu = mu
         while error > error0:
             new_mu = new_mu * nu
-            dposes, dpoints, error = self.calc_new_error(poses, points, new_mu)
-        return poses + dposes, points + dpoints, new_mu, error
+            new_poses, new_points, new_x_pred, error = new_error(new_mu)
+        return new_poses, new_points, new_x_pred, new_mu, error
 
     def compute(self, initial_rotvecs, initial_translations, initial_points,
                 max_iter=200, initial_mu=1.0, nu=100.0,
@@ -112,14 +172,20 @@ class LocalBundleAdjustment(object):
         points = initial_points
 
         mu = initial_mu
-        current_error = self.calc_error(poses, points)
+        # the projections and the error of the accepted step are
+        # carried over to the next iteration
+        x_pred, current_error = self.evaluate(poses, points)
         for iter_ in range(max_iter):
-            poses, points, mu, new_error = self.lm_update(poses, points, mu, nu)
+            if self.robustifier is not None:
+                self.reweight(x_pred)
+                # the error changes with the weights
+                _, current_error = self.evaluate(poses, points, x_pred)
 
-            relative_error = calc_relative_error(current_error, new_error)
+            poses, points, x_pred, mu, new_error = self.lm_update(
+                poses, points, x_pred, current_error, mu, nu
+            )
 
-            print(f"absolute_error[{iter_}] = {new_error}")
-            print(f"relative_error[{iter_}] = {relative_error}")
+            relative_error = calc_relative_error(current_error, new_error)
 
             if new_error < absolute_error_threshold:
                 break
@@ -129,35 +195,173 @@ class LocalBundleAdjustment(object):
 
             current_error = new_error
 
+        if self.robustifier is not None:
+            self.inliers = calc_inliers(self.x_true, x_pred)
+
         rotvecs, translations = poses[:, 0:3], poses[:, 3:6]
         return rotvecs, translations, points
 
 
-def run_ba(viewpoint_indices, point_indices,
-                poses, points, keypoints_true):
-    ba = LocalBundleAdjustment(viewpoint_indices, point_indices,
-                               keypoints_true)
-
+def poses_to_params(poses):
     rotvecs = np.array([p.rotation.as_rotvec() for p in poses])
     ts = np.array([p.t for p in poses])
+    return np.hstack((rotvecs, ts))
+
+
+def params_to_poses(params):
+    return [Pose(Rotation.from_rotvec(p[0:3]), p[3:6]) for p in params]
 
-    rotvecs, ts, points = ba.compute(rotvecs, ts, points,
+
+def run_ba_(ba, poses, points):
+    params = poses_to_params(poses)
+
+    rotvecs, ts, points = ba.compute(params[:, 0:3], params[:, 3:6], points,
                                      absolute_error_threshold=1e-9,
                                      max_iter=5,
                                      relative_error_threshold=0.20)
 
-    rotations = [Rotation.from_rotvec(rotvec) for rotvec in rotvecs]
-    poses = [Pose(r, t) for r, t in zip(rotations, ts)]
+    return params_to_poses(np.hstack((rotvecs, ts))), points
+
+
+def run_ba(viewpoint_indices, point_indices,
+                poses, points, keypoints_true):
+    ba = LocalBundleAdjustment(viewpoint_indices, point_indices,
+                               keypoints_true)
+    return run_ba_(ba, poses, points)
+
+
+def run_robust_ba(viewpoint_indices, point_indices,
+                  poses, points, keypoints_true, robustifier):
+    """
+    Same as 'run_ba' but observations are reweighted by 'robustifier'.
+    Per-observation inlier flags are returned as well.
+    """
+    ba = LocalBundleAdjustment(viewpoint_indices, point_indices,
+                               keypoints_true, robustifier)
+    poses, points = run_ba_(ba, poses, points)
+    return poses, points, ba.inliers
+
+
+def calc_block_errors(x_true, x_pred, block_indices, n_blocks):
+    return np.bincount(block_indices, calc_errors(x_true, x_pred),
+                       minlength=n_blocks)
+
+
+def block_lm(compute, jacobian, params, block_indices, x_true,
+             max_iter=10, initial_mu=1.0, nu=10.0, max_mu=1e10):
+    """
+    Levenberg-Marquardt for problems whose parameter blocks are
+    independent of each other, such as points with fixed poses or
+    poses with fixed points.
+    Each block has its own damping factor and all blocks are updated
+    at once by solving small (d x d) systems.
+    The damping factor of a block is multiplied by 'nu' when its step is
+    rejected, and the block stops being updated once it exceeds 'max_mu'
+
+    compute : params -> x_pred of shape (n_observations, 2)
+    jacobian : params -> jacobians of shape (n_observations, 2, d)
+    params : np.ndarray (n_blocks, d)
+    block_indices : np.ndarray (n_observations,)
+        x_true[k] depends only on params[block_indices[k]]
+    """
+
+    n_blocks, d = params.shape
+
+    def block_errors(x_pred):
+        return calc_block_errors(x_true, x_pred, block_indices, n_blocks)
+
+    def normal_equations(params, x_pred):
+        J = jacobian(params)
+        JT = np.swapaxes(J, 1, 2)
+        H = np.zeros((n_blocks, d, d))
+        g = np.zeros((n_blocks, d))
+        np.add.at(H, block_indices, np.matmul(JT, J))
+        np.add.at(g, block_indices, np.einsum('nij,ni->nj', J, x_true - x_pred))
+        return H, g
+
+    mu = np.full(n_blocks, initial_mu)
+    x_pred = compute(params)
+    errors = block_errors(x_pred)
+    H, g = normal_equations(params, x_pred)
+    for iter_ in range(max_iter):
+        active = mu <= max_mu
+        if not np.any(active):
+            break
+
+        D = mu.reshape(-1, 1, 1) * np.identity(d)
+        delta = np.linalg.solve(H + D, g[..., np.newaxis])[..., 0]
+        new_params = params + delta
+        new_x_pred = compute(new_params)
+        new_errors = block_errors(new_x_pred)
+
+        # accept blocks whose errors decreased
+        # and retry the others with larger damping
+        accepted = active & (new_errors < errors)
+        params[accepted] = new_params[accepted]
+        errors[accepted] = new_errors[accepted]
+        mu[accepted] = mu[accepted] / nu
+        mu[~accepted] = mu[~accepted] * nu
+
+        if not np.any(accepted):
+            continue
+
+        mask = accepted[block_indices]
+        x_pred[mask] = new_x_pred[mask]
+        # H and g of rejected blocks don't change
+        H, g = normal_equations(params, x_pred)
+    return params
+
+
+def run_structure_only_ba(viewpoint_indices, point_indices,
+                          poses, points, keypoints_true, max_iter=10):
+    """
+    Optimize points with poses fixed.
+    Each point is independent of the others so
+    all points are refined at once
+    """
+    viewpoint_indices = np.asarray(viewpoint_indices)
+    point_indices = np.asarray(point_indices)
+    pose_params = poses_to_params(poses)[viewpoint_indices]
+
+    def compute(points):
+        return projection(pose_params, points[point_indices])
+
+    def jacobian(points):
+        return point_jacobian(pose_params, points[point_indices])
+
+    points = block_lm(compute, jacobian, np.copy(points), point_indices,
+                      keypoints_true, max_iter)
     return poses, points
 
 
+def run_motion_only_ba(viewpoint_indices, point_indices,
+                       poses, points, keypoints_true, max_iter=10):
+    """
+    Optimize poses with points fixed.
+    Each pose is independent of the others so
+    all poses are refined at once
+    """
+    viewpoint_indices = np.asarray(viewpoint_indices)
+    point_indices = np.asarray(point_indices)
+    P = points[point_indices]
+
+    def compute(params):
+        return projection(params[viewpoint_indices], P)
+
+    def jacobian(params):
+        return pose_jacobian(params[viewpoint_indices], P)
+
+    params = block_lm(compute, jacobian, poses_to_params(poses),
+                      viewpoint_indices, keypoints_true, max_iter)
+    return params_to_poses(params), points
+
+
 def test_unique(viewpoint_indices, point_indices):
     A = np.vstack((viewpoint_indices, point_indices))
     assert(np.unique(A, axis=1).shape[1] == A.shape[1])
 
 
-def try_run_ba(viewpoint_indices, point_indices,
-               poses, points, keypoints_true):
+def can_run(viewpoint_indices, point_indices, poses, points, keypoints_true):
     assert(len(viewpoint_indices) == len(point_indices))
     assert(len(set(viewpoint_indices)) == len(poses))
     assert(len(set(point_indices)) == len(points))
@@ -170,8 +374,26 @@ def try_run_ba(viewpoint_indices, point_indices,
                       n_pose_params=6, n_point_params=3):
         warnings.warn("Arguments are not satisfying condition to run BA",
                       RuntimeWarning)
-        return poses, points
+        return False
         # raise ValueError("Arguments are not satisfying condition to run BA")
+    return True
+
+
+def try_run_ba(viewpoint_indices, point_indices,
+               poses, points, keypoints_true):
+    if not can_run(viewpoint_indices, point_indices,
+                   poses, points, keypoints_true):
+        return poses, points
 
     return run_ba(viewpoint_indices, point_indices,
                   poses, points, keypoints_true)
+
+
+def try_run_robust_ba(viewpoint_indices, point_indices,
+                      poses, points, keypoints_true, robustifier):
+    if not can_run(viewpoint_indices, point_indices,
+                   poses, points, keypoints_true):
+        return poses, points, np.ones(len(keypoints_true), dtype=np.bool_)
+
+    return run_robust_ba(viewpoint_indices, point_indices,
+                         poses, points, keypoints_true, robustifier)
@@ -0,0 +1,172 @@
+import numpy as np
+
+from tadataka.correspondence import REJECTED, dense_correspondence
+
+
+class GrowableArray(object):
+    def __init__(self, shape=(), dtype=np.float64, capacity=256):
+        """
+        Array whose capacity is doubled when it is full.
+        'shape' is the shape of each element
+        """
+        self.data = np.empty((capacity,) + tuple(shape), dtype=dtype)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def array(self):
+        # a view of the valid elements
+        return self.data[:self.size]
+
+    def append(self, values):
+        """
+        Append 'values' and return their indices
+        """
+        n = len(values)
+        if self.size + n > len(self.data):
+            capacity = max(2 * len(self.data), self.size + n)
+            data = np.empty((capacity,) + self.data.shape[1:],
+                            dtype=self.data.dtype)
+            data[:self.size] = self.array
+            self.data = data
+        self.data[self.size:self.size+n] = values
+        self.size += n
+        return np.arange(self.size - n, self.size)
+
+    def compress(self, mask):
+        # keep only elements where 'mask' is True
+        n = np.sum(mask)
+        self.data[:n] = self.array[mask]
+        self.size = n
+
+
+class MapStore(object):
+    """
+    Map points and their observations stored in columnar arrays.
+    A point is identified by its index in the point array (point id).
+    Observations are indexed by viewpoint, and each observation made from
+    a viewpoint is a row of (point id, keypoint index), so looking up
+    observations costs only as much as the viewpoints looked up
+    """
+
+    def __init__(self):
+        self._points = GrowableArray((3,), np.float64)
+        self._colors = GrowableArray((3,), np.uint8)
+        # viewpoint -> observations (point id, keypoint index)
+        self._observations = dict()
+        # viewpoint -> dense correspondence (keypoint index -> point id)
+        self._dense = dict()
+        # viewpoint -> indices of keypoints judged as outliers
+        self._rejected = dict()
+
+    @property
+    def n_points(self):
+        return len(self._points)
+
+    @property
+    def n_observations(self):
+        return sum(len(rows) for rows in self._observations.values())
+
+    @property
+    def points(self):
+        # writable view of the point array, indexed by point ids
+        return self._points.array
+
+    @property
+    def colors(self):
+        return self._colors.array
+
+    def add_points(self, points, colors):
+        """
+        Returns point ids of the added points
+        """
+        assert(len(points) == len(colors))
+        self._colors.append(colors)
+        return self._points.append(points)
+
+    def add_observations(self, viewpoint, point_ids, keypoint_indices):
+        assert(len(point_ids) == len(keypoint_indices))
+        rows = np.empty((len(point_ids), 2), dtype=np.int64)
+        rows[:, 0] = point_ids
+        rows[:, 1] = keypoint_indices
+        if viewpoint not in self._observations:
+            self._observations[viewpoint] = GrowableArray((2,), np.int64)
+        self._observations[viewpoint].append(rows)
+
+        if viewpoint in self._dense:
+            self._dense[viewpoint][keypoint_indices] = point_ids
+
+    def observations_(self, viewpoint):
+        # (point id, keypoint index) rows of observations from 'viewpoint'
+        rows = self._observations.get(viewpoint)
+        if rows is None:
+            return np.empty((0, 2), dtype=np.int64)
+        return rows.array
+
+    def observations(self, viewpoints):
+        """
+        Returns viewpoints, point ids and keypoint indices of
+        observations made from 'viewpoints', in the order of 'viewpoints'
+        """
+        rows = [self.observations_(v) for v in viewpoints]
+        vs = np.repeat(np.asarray(viewpoints, dtype=np.int64),
+                       [len(r) for r in rows])
+        rows = np.vstack([np.empty((0, 2), dtype=np.int64)] + rows)
+        return vs, rows[:, 0], rows[:, 1]
+
+    def keypoint_to_point(self, viewpoint, n_keypoints):
+        """
+        Returns an array of size 'n_keypoints' whose i-th element is the
+        id of the point observed by the i-th keypoint in 'viewpoint',
+        -1 if the keypoint is not associated with any point, or REJECTED
+        if the keypoint was rejected as an outlier.
+        The array is cached and kept up to date while observations
+        are added or removed. It must not be modified by the caller
+        """
+        correspondence = self._dense.get(viewpoint)
+        if correspondence is None or len(correspondence) != n_keypoints:
+            rows = self.observations_(viewpoint)
+            correspondence = dense_correspondence(rows[:, 0], rows[:, 1],
+                                                  n_keypoints)
+            correspondence[self.rejected_keypoints(viewpoint)] = REJECTED
+            self._dense[viewpoint] = correspondence
+        return correspondence
+
+    def rejected_keypoints(self, viewpoint):
+        rejected = self._rejected.get(viewpoint)
+        if rejected is None:
+            return np.empty(0, dtype=np.int64)
+        return rejected.array
+
+    def reject_keypoints(self, viewpoint, keypoint_indices):
+        """
+        Mark keypoints in 'viewpoint' as outliers so that they are not
+        associated with any point, nor used to create new points
+        """
+        if viewpoint not in self._rejected:
+            self._rejected[viewpoint] = GrowableArray((), np.int64)
+        self._rejected[viewpoint].append(keypoint_indices)
+
+        if viewpoint in self._dense:
+            self._dense[viewpoint][keypoint_indices] = REJECTED
+
+    def remove_observations(self, viewpoints, point_ids):
+        """
+        Remove observations of point_ids[i] from viewpoints[i].
+        Keypoints of the removed observations are rejected
+        """
+        assert(len(viewpoints) == len(point_ids))
+        viewpoints = np.asarray(viewpoints)
+        point_ids = np.asarray(point_ids)
+
+        for viewpoint in np.unique(viewpoints):
+            rows = self._observations.get(viewpoint)
+            if rows is None:
+                continue
+
+            removed = np.isin(rows.array[:, 0],
+                              point_ids[viewpoints == viewpoint])
+            self.reject_keypoints(viewpoint, rows.array[removed, 1])
+            rows.compress(~removed)
@@ -28,34 +28,189 @@
 # POSSIBILITY OF SUCH DAMAGE.
 
 import numpy as np
-from sklearn.metrics import pairwise_distances
-# from scipy.spatial.distance import cdist
+from numba import njit
+from scipy.spatial.distance import cdist
+
+
+def top2_dense(descriptors1, descriptors2, tile_size=1024):
+    """
+    Find the nearest and the second nearest neighbors without
+    building the whole distance matrix.
+    Distances are computed in tiles of shape (tile_size, tile_size) and
+    only the running best and second best distances are kept, so the
+    peak memory is O(n1 + n2 + tile_size^2)
+    """
+
+    n1, n2 = descriptors1.shape[0], descriptors2.shape[0]
+
+    indices2 = np.zeros(n1, dtype=np.int64)
+    best_distances = np.full(n1, np.inf)
+    second_best_distances = np.full(n1, np.inf)
+    indices1 = np.zeros(n2, dtype=np.int64)
+    column_best_distances = np.full(n2, np.inf)
+
+    for i0 in range(0, n1, tile_size):
+        rows = np.arange(i0, min(i0 + tile_size, n1))
+        for j0 in range(0, n2, tile_size):
+            columns = np.arange(j0, min(j0 + tile_size, n2))
+            # cdist is used because sklearn's pairwise_distances validates
+            # inputs and may start a worker pool at every call,
+            # which costs more than the computation of a small tile
+            D = cdist(descriptors1[rows], descriptors2[columns])
+
+            # tiles are visited in ascending order of indices and
+            # strict inequalities keep the smallest index on ties,
+            # which is the same as np.argmin over the whole matrix
+            argmin = np.argmin(D, axis=1)
+            tile_best = D[np.arange(len(rows)), argmin]
+            D[np.arange(len(rows)), argmin] = np.inf
+            tile_second_best = np.min(D, axis=1)
+            D[np.arange(len(rows)), argmin] = tile_best
+
+            best, second_best = best_distances[rows], second_best_distances[rows]
+            updated = tile_best < best
+            tied = ~updated & (tile_best < second_best)
+            second_best_distances[rows] = np.where(
+                updated, np.minimum(best, tile_second_best),
+                np.where(tied, tile_best, second_best)
+            )
+            best_distances[rows] = np.where(updated, tile_best, best)
+            indices2[rows] = np.where(updated, columns[argmin], indices2[rows])
+
+            argmin = np.argmin(D, axis=0)
+            tile_best = D[argmin, np.arange(len(columns))]
+            updated = tile_best < column_best_distances[columns]
+            column_best_distances[columns[updated]] = tile_best[updated]
+            indices1[columns[updated]] = rows[argmin[updated]]
+
+    return indices2, best_distances, second_best_distances, indices1
+
+
+M1 = np.uint64(0x5555555555555555)
+M2 = np.uint64(0x3333333333333333)
+M4 = np.uint64(0x0f0f0f0f0f0f0f0f)
+H01 = np.uint64(0x0101010101010101)
+
+
+@njit(cache=True)
+def popcount64(x):
+    # number of set bits in a 64-bit word
+    x = x - ((x >> np.uint64(1)) & M1)
+    x = (x & M2) + ((x >> np.uint64(2)) & M2)
+    x = (x + (x >> np.uint64(4))) & M4
+    return (x * H01) >> np.uint64(56)
+
+
+def pack_descriptors(descriptors):
+    """
+    Pack binary descriptors of shape (n_descriptors, n_bits) into
+    an array of 64-bit words of shape (n_descriptors, ceil(n_bits / 64))
+    """
+    packed = np.packbits(descriptors, axis=1)
+    n_bytes = 8 * ((packed.shape[1] + 7) // 8)
+    padded = np.zeros((packed.shape[0], n_bytes), dtype=np.uint8)
+    padded[:, :packed.shape[1]] = packed
+    return padded.view(np.uint64)
+
+
+@njit(cache=True)
+def hamming_top2_(packed1, packed2):
+    n1, n2 = packed1.shape[0], packed2.shape[0]
+    n_words = packed1.shape[1]
+
+    sentinel = np.iinfo(np.int64).max
+    indices2 = np.zeros(n1, dtype=np.int64)
+    best = np.full(n1, sentinel, dtype=np.int64)
+    second_best = np.full(n1, sentinel, dtype=np.int64)
+    indices1 = np.zeros(n2, dtype=np.int64)
+    column_best = np.full(n2, sentinel, dtype=np.int64)
+
+    for i in range(n1):
+        for j in range(n2):
+            d = 0
+            for k in range(n_words):
+                d += popcount64(packed1[i, k] ^ packed2[j, k])
+
+            # strict inequalities keep the smallest index on ties,
+            # which is the same as np.argmin
+            if d < best[i]:
+                second_best[i] = best[i]
+                best[i] = d
+                indices2[i] = j
+            elif d < second_best[i]:
+                second_best[i] = d
+
+            if d < column_best[j]:
+                column_best[j] = d
+                indices1[j] = i
+    return indices2, best, second_best, indices1
+
+
+@njit(cache=True)
+def hamming_pairs_(packed1, packed2, indices1, indices2):
+    distances = np.empty(len(indices1), dtype=np.int64)
+    for p in range(len(indices1)):
+        i, j = indices1[p], indices2[p]
+        d = 0
+        for k in range(packed1.shape[1]):
+            d += popcount64(packed1[i, k] ^ packed2[j, k])
+        distances[p] = d
+    return distances
+
+
+def hamming_pairs(packed1, packed2, indices1, indices2):
+    """
+    Hamming distances between packed1[indices1[k]] and packed2[indices2[k]]
+    """
+    assert(len(indices1) == len(indices2))
+    return hamming_pairs_(packed1, packed2,
+                          np.asarray(indices1, dtype=np.int64),
+                          np.asarray(indices2, dtype=np.int64))
+
+
+def top2_hamming(descriptors1, descriptors2):
+    indices2, best, second_best, indices1 = hamming_top2_(
+        pack_descriptors(descriptors1), pack_descriptors(descriptors2)
+    )
+
+    # Euclidean distance between binary vectors is
+    # the square root of the Hamming distance
+    sentinel = np.iinfo(np.int64).max
+    best_distances = np.sqrt(best)
+    second_best_distances = np.where(second_best == sentinel, np.inf,
+                                     np.sqrt(second_best.astype(np.float64)))
+    return indices2, best_distances, second_best_distances, indices1
 
 
 def match_descriptors(descriptors1, descriptors2,
-                      cross_check=True, max_ratio=1.0):
+                      cross_check=True, max_ratio=1.0, tile_size=1024):
+    """
+    tile_size: Non-binary descriptors are compared in blocks of
+        shape (tile_size, tile_size) to bound the memory usage
+    """
     if descriptors1.shape[1] != descriptors2.shape[1]:
         raise ValueError("Descriptor length must equal.")
 
-    # this line gets slower if metric='hamming' is specified even in the case
-    # features are in binary
-    distances = pairwise_distances(descriptors1, descriptors2, n_jobs=-1)
+    # indices2[i] : nearest neighbor of descriptors1[i] in descriptors2
+    # matches1[j] : nearest neighbor of descriptors2[j] in descriptors1
+    if descriptors1.dtype == np.bool_ and descriptors2.dtype == np.bool_:
+        indices2, best_distances, second_best_distances, matches1 =\
+            top2_hamming(descriptors1, descriptors2)
+    else:
+        indices2, best_distances, second_best_distances, matches1 =\
+            top2_dense(descriptors1, descriptors2, tile_size)
 
     indices1 = np.arange(descriptors1.shape[0])
-    indices2 = np.argmin(distances, axis=1)
 
     if cross_check:
-        matches1 = np.argmin(distances, axis=0)
         mask = indices1 == matches1[indices2]
         indices1 = indices1[mask]
         indices2 = indices2[mask]
+        best_distances = best_distances[mask]
+        second_best_distances = second_best_distances[mask]
 
     if max_ratio < 1.0:
-        distances = distances.astype(np.float64)
-        best_distances = distances[indices1, indices2]
-        distances[indices1, indices2] = np.inf
-        second_best_indices2 = np.argmin(distances[indices1], axis=1)
-        second_best_distances = distances[indices1, second_best_indices2]
+        second_best_distances = np.copy(second_best_distances)
         second_best_distances[second_best_distances == 0] \
             = np.finfo(np.double).eps
         ratio = best_distances / second_best_distances
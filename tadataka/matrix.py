@@ -89,8 +89,15 @@ def solve_linear(A):
     # Ax = 0  if A.shape[0] < A.shape[1]
     # min ||Ax|| otherwise
     # x is a vector in the kernel space of A
-    U, S, VH = np.linalg.svd(A)
-    return VH[-1]
+    # If A is a stack of matrices of shape (n, n_rows, n_cols),
+    # x is computed for each matrix and an array of shape (n, n_cols)
+    # is returned
+    # VH has to be square (full_matrices=True). Then the last row is
+    # the right singular vector of the smallest singular value if
+    # n_rows >= n_cols, and a vector in the kernel otherwise because
+    # the rows after the n_rows-th correspond to zero singular values
+    U, S, VH = np.linalg.svd(A, full_matrices=True)
+    return VH[..., -1, :]
 
 
 def estimate_homography(keypoints1, keypoints2):
@@ -0,0 +1,277 @@
+import itertools
+
+import numpy as np
+
+from tadataka.ransac import ransac
+from tadataka.so3 import exp_so3
+
+
+# Perspective-n-Point vectorized over sample sets.
+# Keypoints have to be normalized, i.e. K = I, and the estimated
+# (R, t) satisfies keypoint = pi(R * point + t)
+#
+# Lepetit, Vincent, Francesc Moreno-Noguer, and Pascal Fua.
+# "EPnP: An accurate O(n) solution to the PnP problem."
+# International journal of computer vision 81.2 (2009): 155.
+
+
+# Sample sets whose points spread less than this ratio along the
+# 3rd principal axis are regarded as planar, and use 3 control points.
+# Sets degenerated to lines or points are dropped
+DEGENERACY_RATIO = 1e-3
+
+
+def principal_axes(P):
+    """
+    P: np.ndarray (n_sets, n_points, 3)
+    Returns centroids (n_sets, 3), standard deviations along the principal
+    axes in ascending order (n_sets, 3) and the scaled principal axes
+    (n_sets, 3, 3) where axes[:, i] corresponds to scales[:, i]
+    """
+    centroids = np.mean(P, axis=1)
+    Q = P - centroids[:, np.newaxis]
+    eigenvalues, V = np.linalg.eigh(np.matmul(np.swapaxes(Q, 1, 2), Q))
+    scales = np.sqrt(np.maximum(eigenvalues, 0) / P.shape[1])
+    axes = np.swapaxes(V, 1, 2) * scales[..., np.newaxis]
+    return centroids, scales, axes
+
+
+def control_points(P, n_control=4):
+    """
+    Returns control points of shape (n_sets, n_control, 3).
+    The first one is the centroid and the others are along
+    the (n_control-1) largest principal axes
+    """
+    centroids, _, axes = principal_axes(P)
+    axes = axes[:, 4-n_control:]
+    return np.concatenate((centroids[:, np.newaxis],
+                           centroids[:, np.newaxis] + axes), axis=1)
+
+
+def barycentric_coordinates(P, C):
+    # alphas that satisfy P[s, i] = sum_j alphas[s, i, j] * C[s, j]
+    # in the least squares sense, which is exact for the planar case
+    D = np.swapaxes(C[:, 1:] - C[:, 0:1], 1, 2)  # (n_sets, 3, n_control-1)
+    A = np.matmul(np.linalg.pinv(D), np.swapaxes(P - C[:, 0:1], 1, 2))
+    A = np.swapaxes(A, 1, 2)
+    return np.concatenate((1 - np.sum(A, axis=2, keepdims=True), A), axis=2)
+
+
+def projection_constraints(alphas, keypoints):
+    # M[s] * vec(camera control points) = 0
+    n_sets, n_points, n_control = alphas.shape
+    M = np.zeros((n_sets, n_points, 2, n_control, 3))
+    M[:, :, 0, :, 0] = alphas
+    M[:, :, 1, :, 1] = alphas
+    M[:, :, :, :, 2] = -alphas[:, :, np.newaxis] * keypoints[..., np.newaxis]
+    return M.reshape(n_sets, 2 * n_points, 3 * n_control)
+
+
+def pair_differences(C):
+    # C: (..., n_control, 3) -> differences of all pairs (..., n_pairs, 3)
+    i, j = np.array(list(itertools.combinations(range(C.shape[-2]), 2))).T
+    return C[..., i, :] - C[..., j, :]
+
+
+def betas_n1(V, rho):
+    d = np.linalg.norm(pair_differences(V[..., 0]), axis=2)
+    return np.sum(d * np.sqrt(rho), axis=1) / np.sum(d * d, axis=1)
+
+
+def products_matrix(V, n):
+    # L[s] * (b11, b12, ..., bnn) = rho[s] where bij = beta_i * beta_j
+    D = [pair_differences(V[..., k]) for k in range(n)]
+    columns = []
+    for i, j in itertools.combinations_with_replacement(range(n), 2):
+        dot = np.sum(D[i] * D[j], axis=2)
+        columns.append(dot if i == j else 2 * dot)
+    return np.stack(columns, axis=2)
+
+
+def betas_from_products(B, n):
+    # recover betas from bij by taking b11 = beta_1 ^ 2
+    index = {p: k for k, p in enumerate(
+        itertools.combinations_with_replacement(range(n), 2))}
+    beta1 = np.sqrt(np.abs(B[:, index[(0, 0)]]))
+    betas = [beta1] + [B[:, index[(0, i)]] / beta1 for i in range(1, n)]
+    return np.stack(betas, axis=1)
+
+
+def betas_nk(V, rho, n):
+    L = products_matrix(V, n)
+    B = np.matmul(np.linalg.pinv(L), rho[..., np.newaxis])[..., 0]
+    return betas_from_products(B, n)
+
+
+def align(P, Q):
+    """
+    Find (R, t) that minimize || Q - (R * P + t) ||
+    P, Q: np.ndarray (n_sets, n_points, 3)
+    """
+    mp, mq = np.mean(P, axis=1), np.mean(Q, axis=1)
+    H = np.matmul(np.swapaxes(P - mp[:, np.newaxis], 1, 2),
+                  Q - mq[:, np.newaxis])
+    U, _, VH = np.linalg.svd(H)
+    V = np.swapaxes(VH, 1, 2)
+    S = np.ones((P.shape[0], 3))
+    S[:, 2] = np.sign(np.linalg.det(np.matmul(V, np.swapaxes(U, 1, 2))))
+    R = np.matmul(V * S[:, np.newaxis], np.swapaxes(U, 1, 2))
+    t = mq - np.einsum('sij,sj->si', R, mp)
+    return R, t
+
+
+def epnp_(P, X, n_control):
+    C = control_points(P, n_control)
+    alphas = barycentric_coordinates(P, C)
+    M = projection_constraints(alphas, X)
+
+    # null space of M
+    _, V = np.linalg.eigh(np.matmul(np.swapaxes(M, 1, 2), M))
+    V = V.reshape(V.shape[0], n_control, 3, 3 * n_control)
+
+    # distances between control points have to be preserved
+    rho = np.sum(pair_differences(C) ** 2, axis=2)
+
+    # the number of products of betas cannot exceed
+    # the number of distance constraints
+    max_n = 3 if n_control == 4 else 2
+
+    rotations, translations = [], []
+    for n in range(1, max_n + 1):
+        if n == 1:
+            betas = betas_n1(V, rho)[:, np.newaxis]
+        else:
+            betas = betas_nk(V, rho, n)
+        Cc = np.einsum('sk,sijk->sij', betas, V[..., 0:n])
+        Pc = np.matmul(alphas, Cc)
+
+        finite = np.all(np.isfinite(Pc), axis=(1, 2))
+        Pc = Pc[finite]
+
+        # points have to be in front of the camera
+        signs = np.sign(np.sum(Pc[..., 2], axis=1))
+        R, t = align(P[finite], Pc * signs.reshape(-1, 1, 1))
+        rotations.append(R)
+        translations.append(t)
+    return np.concatenate(rotations), np.concatenate(translations)
+
+
+def epnp(P, X):
+    """
+    P : np.ndarray (n_sets, n_points, 3)
+        3D points where n_points >= 6
+    X : np.ndarray (n_sets, n_points, 2)
+        Normalized keypoints
+    Returns rotations (n_models, 3, 3) and translations (n_models, 3).
+    Candidates computed from 1 to 3 dimensional null spaces are returned
+    for each sample set, or 1 to 2 if the points are planar.
+    Degenerate sample sets, such as collinear or repeated points,
+    don't produce any candidate
+    """
+    _, scales, _ = principal_axes(P)
+    largest = scales[:, 2]
+    planar = scales[:, 0] <= DEGENERACY_RATIO * largest
+    degenerate = scales[:, 1] <= DEGENERACY_RATIO * largest
+
+    rotations, translations = [np.empty((0, 3, 3))], [np.empty((0, 3))]
+    for mask, n_control in [(~planar, 4), (planar & ~degenerate, 3)]:
+        if not np.any(mask):
+            continue
+        R, t = epnp_(P[mask], X[mask], n_control)
+        rotations.append(R)
+        translations.append(t)
+
+    R = np.concatenate(rotations)
+    t = np.concatenate(translations)
+    valid = np.all(np.isfinite(R), axis=(1, 2)) & np.all(np.isfinite(t), axis=1)
+    return R[valid], t[valid]
+
+
+def reprojection_errors(R, t, points, keypoints):
+    """
+    R, t : np.ndarray (n_models, 3, 3), (n_models, 3)
+    points, keypoints : np.ndarray (n_points, 3), (n_points, 2)
+    Returns reprojection errors of shape (n_models, n_points).
+    Errors of points behind the camera are inf
+    """
+    P = np.einsum('mij,nj->mni', R, points) + t[:, np.newaxis]
+    Z = P[..., 2]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        errors = np.linalg.norm(P[..., 0:2] / Z[..., np.newaxis] - keypoints,
+                                axis=2)
+    errors[~(Z > 0)] = np.inf
+    return errors
+
+
+def in_front(R, t, points):
+    return np.all(np.dot(points, R[2]) + t[2] > 0)
+
+
+def refine_pose(R, t, points, keypoints, n_iterations=10, threshold=1e-10,
+                max_halvings=10):
+    """
+    Minimize reprojection errors by the Gauss-Newton method.
+    The pose is updated as R <- exp(omega) * R, t <- exp(omega) * t + v
+    A step is halved while it moves any point behind the camera,
+    and the iteration stops if no such step is found
+    """
+    for i in range(n_iterations):
+        P = np.dot(points, R.T) + t
+        x, y, z = P.T
+        residuals = (P[:, 0:2] / P[:, [2]] - keypoints).flatten()
+
+        # jacobian of projection with respect to (omega, v)
+        JP = np.zeros((len(points), 2, 3))
+        JP[:, 0, 0] = JP[:, 1, 1] = 1 / z
+        JP[:, 0, 2] = -x / (z * z)
+        JP[:, 1, 2] = -y / (z * z)
+        skew = np.zeros((len(points), 3, 3))
+        skew[:, 0, 1], skew[:, 0, 2], skew[:, 1, 2] = -P[:, 2], P[:, 1], -P[:, 0]
+        skew = skew - np.swapaxes(skew, 1, 2)
+        J = np.concatenate((-np.matmul(JP, skew), JP), axis=2).reshape(-1, 6)
+
+        dx = np.linalg.lstsq(J, -residuals, rcond=None)[0]
+        for _ in range(max_halvings):
+            dR = exp_so3(dx[0:3])
+            R_, t_ = np.dot(dR, R), np.dot(dR, t) + dx[3:6]
+            if in_front(R_, t_, points):
+                break
+            dx = dx / 2
+        else:
+            break
+        R, t = R_, t_
+
+        if np.dot(dx, dx) < threshold:
+            break
+    return R, t
+
+
+def ransac_pnp(points, keypoints, residual_threshold, min_samples=6,
+               max_trials=100, confidence=0.99, random_state=3939):
+    """
+    Estimate the pose robustly and refine it using all inliers.
+    Returns (R, t) and the inlier mask.
+    R and t are None if no pose is found
+    """
+
+    assert(points.shape[0] == keypoints.shape[0])
+
+    def estimate(samples):
+        R, t = epnp(points[samples], keypoints[samples])
+        return np.concatenate((R, t[:, :, np.newaxis]), axis=2)
+
+    def residuals(Rt):
+        return reprojection_errors(Rt[:, :, 0:3], Rt[:, :, 3],
+                                   points, keypoints)
+
+    Rt, inliers = ransac(estimate, residuals, points.shape[0], min_samples,
+                         residual_threshold, max_trials=max_trials,
+                         confidence=confidence, random_state=random_state)
+    if Rt is None:
+        return None, None, inliers
+
+    R, t = refine_pose(Rt[:, 0:3], Rt[:, 3], points[inliers], keypoints[inliers])
+
+    errors = reprojection_errors(R[np.newaxis], t[np.newaxis],
+                                 points, keypoints)
+    return R, t, errors[0] < residual_threshold
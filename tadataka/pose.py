@@ -3,14 +3,13 @@ import itertools
 import numpy as np
 from scipy.spatial.transform import Rotation
 
-# TODO make this independent from cv2
-import cv2
-
 from tadataka.coordinates import local_to_world, world_to_local
 from tadataka.depth import (depth_condition, warn_points_behind_cameras,
                             compute_depth_mask)
 from tadataka.exceptions import NotEnoughInliersException
-from tadataka.matrix import estimate_fundamental, decompose_essential
+from tadataka.essential import ransac_essential
+from tadataka.matrix import decompose_essential
+from tadataka.pnp import ransac_pnp
 from tadataka.so3 import exp_so3, log_so3
 from tadataka.se3 import exp_se3_t_
 from tadataka._triangulation import linear_triangulation
@@ -74,39 +73,30 @@ class Pose(object):
                 np.isclose(self.t, other.t).all())
 
 
-def calc_reprojection_threshold(keypoints, k=2.0):
-    center = np.mean(keypoints, axis=0, keepdims=True)
-    squared_distances = np.sum(np.power(keypoints - center, 2), axis=1)
-    # rms of distances from center to keypoints
-    rms = np.sqrt(np.mean(squared_distances))
-    return k * rms / keypoints.shape[0]
-
-
 min_correspondences = 6
 
 
-def solve_pnp(points, keypoints):
+def solve_pnp(points, keypoints, residual_threshold=3e-3):
+    """
+    Estimate the pose from 3D points and corresponding normalized keypoints.
+    Correspondences whose reprojection errors are smaller than
+    'residual_threshold' in the normalized coordinates are inliers.
+    Returns the pose and the inlier mask
+    """
     assert(points.shape[0] == keypoints.shape[0])
 
     if keypoints.shape[0] < min_correspondences:
         raise NotEnoughInliersException("No sufficient correspondences")
 
-    t = calc_reprojection_threshold(keypoints, k=3.0)
-    retval, omega, t, inliers = cv2.solvePnPRansac(
-        points.astype(np.float64),
-        keypoints.astype(np.float64),
-        np.identity(3), np.zeros(4),
-        reprojectionError=t,
-        flags=cv2.SOLVEPNP_EPNP
-    )
-
-    if not retval:
-        raise RuntimeError("Pose estimation failed")
+    R, t, inliers = ransac_pnp(points.astype(np.float64),
+                               keypoints.astype(np.float64),
+                               residual_threshold,
+                               min_samples=min_correspondences)
 
-    if len(inliers.flatten()) == 0:
+    if R is None or np.sum(inliers) == 0:
         raise NotEnoughInliersException("No inliers found")
 
-    return Pose(Rotation.from_rotvec(omega.flatten()), t.flatten())
+    return Pose(Rotation.from_matrix(R), t), inliers
 
 
 # We triangulate only subset of keypoints to determine valid
@@ -158,24 +148,28 @@ def select_valid_pose(R1A, R1B, t1a, t1b, keypoints0, keypoints1):
     return argmax_R, argmax_t
 
 
-def pose_change_from_stereo(keypoints0, keypoints1):
+def pose_change_from_stereo(keypoints0, keypoints1, residual_threshold=3e-3):
     """Estimate camera pose change between two viewpoints"""
 
     assert(keypoints0.shape == keypoints1.shape)
 
     # we assume that keypoints are normalized
-    E = estimate_fundamental(keypoints0, keypoints1)
+    E, inliers = ransac_essential(keypoints0, keypoints1,
+                                  residual_threshold=residual_threshold)
+    if E is None:
+        raise NotEnoughInliersException("No sufficient correspondences")
 
     # R <- {R1, R2}, t <- {t1, t2} satisfy
     # K * [R | t] * homegeneous(points) = homogeneous(keypoint)
     R1A, R1B, t1a, t1b = decompose_essential(E)
-    return select_valid_pose(R1A, R1B, t1a, t1b, keypoints0, keypoints1)
+    return select_valid_pose(R1A, R1B, t1a, t1b,
+                             keypoints0[inliers], keypoints1[inliers])
 
 
-def estimate_pose_change(keypoints0, keypoints1):
+def estimate_pose_change(keypoints0, keypoints1, residual_threshold=3e-3):
     # estimate pose change between viewpoint 0 and 1
     # regarding viewpoint 0 as identity (world origin)
-    R, t = pose_change_from_stereo(keypoints0, keypoints1)
+    R, t = pose_change_from_stereo(keypoints0, keypoints1, residual_threshold)
     return Pose(Rotation.from_matrix(R), t)
 
 
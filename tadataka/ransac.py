@@ -0,0 +1,81 @@
+import numpy as np
+
+
+def n_required_trials(inlier_ratio, min_samples, confidence):
+    # number of trials required to draw at least one outlier-free
+    # sample with probability 'confidence'
+    if inlier_ratio <= 0:
+        return np.inf
+    p = inlier_ratio ** min_samples
+    if p >= 1:
+        return 0
+    return np.log(1 - confidence) / np.log(1 - p)
+
+
+def random_samples(random_state, n_data, n_sets, min_samples):
+    # draw 'n_sets' subsets of size 'min_samples' without replacement
+    # within each subset
+    R = random_state.random_sample((n_sets, n_data))
+    return np.argpartition(R, min_samples-1, axis=1)[:, :min_samples]
+
+
+def ransac(estimate, residuals, n_data, min_samples, residual_threshold,
+           max_trials=100, batch_size=20, confidence=0.99,
+           random_state=3939):
+    """
+    RANSAC that generates and scores hypotheses in batches
+
+    estimate : samples -> models
+        Estimates models from index arrays of shape (n_sets, min_samples).
+        Can return more than one model per sample set, or less if
+        estimation fails
+    residuals : models -> np.ndarray of shape (n_models, n_data)
+    n_data : int
+        Number of data points
+    max_trials : int
+        Maximum number of sample sets
+    batch_size : int
+        Number of sample sets drawn at once
+    confidence : float
+        Sampling stops when the probability of having drawn at least
+        one outlier-free sample exceeds this value
+
+    Returns:
+        best_model : model that has the largest number of inliers.
+            None if no model is found
+        inliers : boolean mask of inliers of 'best_model'
+    """
+
+    if n_data < min_samples:
+        return None, np.zeros(n_data, dtype=np.bool_)
+
+    if not isinstance(random_state, np.random.RandomState):
+        random_state = np.random.RandomState(random_state)
+
+    best_model = None
+    best_inliers = np.zeros(n_data, dtype=np.bool_)
+    best_count = 0
+
+    n_trials = 0
+    n_required = max_trials
+    while n_trials < min(max_trials, n_required):
+        n_sets = min(batch_size, max_trials - n_trials)
+        n_trials += n_sets
+
+        models = estimate(random_samples(random_state, n_data,
+                                         n_sets, min_samples))
+        if len(models) == 0:
+            continue
+
+        inliers = residuals(models) < residual_threshold
+        counts = np.sum(inliers, axis=1)
+        argmax = np.argmax(counts)
+        if counts[argmax] <= best_count:
+            continue
+
+        best_model, best_inliers = models[argmax], inliers[argmax]
+        best_count = counts[argmax]
+        n_required = n_required_trials(best_count / n_data, min_samples,
+                                       confidence)
+
+    return best_model, best_inliers
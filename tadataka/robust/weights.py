@@ -41,3 +41,7 @@ def compute_weights_huber(r, k=1.345):
     mask = abs_ > k
     weights[mask] = k / abs_[mask]
     return weights
+
+
+def compute_weights_cauchy(r, c=2.3849):
+    return 1 / (1 + np.power(r / c, 2))
@@ -0,0 +1,441 @@
+import bisect
+
+import numpy as np
+
+from tadataka.local_ba import (LocalBundleAdjustment, Projection, calc_errors,
+                               params_to_poses, poses_to_params)
+from tadataka.map_store import GrowableArray
+
+
+# Bundle adjustment over a sliding window of keyframes.
+# Observations are registered incrementally, and a keyframe leaving the
+# window is marginalized into a quadratic prior on the remaining poses
+# instead of being simply discarded.
+
+
+def calc_normal_blocks(viewpoint_indices, point_indices,
+                       n_viewpoints, n_points, A, B, epsilon, weights=None):
+    """
+    Blocks of the normal equation :math:`J^T W J \\delta = J^T W \\epsilon`
+
+    Returns:
+        U : np.ndarray (n_viewpoints, n_pose_params, n_pose_params)
+        V : np.ndarray (n_points, n_point_params, n_point_params)
+        W : np.ndarray (n_visible, n_pose_params, n_point_params)
+        epsilon_a : np.ndarray (n_viewpoints, n_pose_params)
+        epsilon_b : np.ndarray (n_points, n_point_params)
+    """
+
+    if weights is None:
+        WA, WB, We = A, B, epsilon
+    else:
+        WA = np.matmul(weights, A)
+        WB = np.matmul(weights, B)
+        We = np.einsum('nij,nj->ni', weights, epsilon)
+
+    AT, BT = np.swapaxes(A, 1, 2), np.swapaxes(B, 1, 2)
+    n_pose_params, n_point_params = A.shape[2], B.shape[2]
+
+    U = np.zeros((n_viewpoints, n_pose_params, n_pose_params))
+    np.add.at(U, viewpoint_indices, np.matmul(AT, WA))
+
+    V = np.zeros((n_points, n_point_params, n_point_params))
+    np.add.at(V, point_indices, np.matmul(BT, WB))
+
+    W = np.matmul(AT, WB)
+
+    epsilon_a = np.zeros((n_viewpoints, n_pose_params))
+    np.add.at(epsilon_a, viewpoint_indices, np.einsum('nij,nj->ni', AT, We))
+
+    epsilon_b = np.zeros((n_points, n_point_params))
+    np.add.at(epsilon_b, point_indices, np.einsum('nij,nj->ni', BT, We))
+
+    return U, V, W, epsilon_a, epsilon_b
+
+
+def shared_observations(point_indices, n_points):
+    """
+    Returns indices (first, second) of all pairs of observations
+    made of the same point, including pairs of an observation and itself
+    """
+
+    order = np.argsort(point_indices, kind='stable')
+    counts = np.bincount(point_indices, minlength=n_points)
+    offsets = np.cumsum(counts) - counts
+
+    # each observation is paired with all observations of its point
+    n_pairs = counts[point_indices[order]]
+    first = np.repeat(order, n_pairs)
+    starts = np.repeat(offsets[point_indices[order]], n_pairs)
+    within = np.arange(len(first)) - np.repeat(np.cumsum(n_pairs) - n_pairs,
+                                               n_pairs)
+    return first, order[starts + within]
+
+
+def eliminate_points(viewpoint_indices, point_indices,
+                     U, V_inv, W, epsilon_a, epsilon_b):
+    """
+    Compute the reduced camera system :math:`S \\delta_a = e`
+    by taking the Schur complement of the point blocks
+    """
+
+    n_viewpoints, n_pose_params = U.shape[0:2]
+    n_points = V_inv.shape[0]
+
+    Y = np.matmul(W, V_inv[point_indices])
+
+    # S[j, k] = U[j] * (j == k) - sum_i Y[i, j] * W[i, k]^T
+    # where the sum is taken only over points observed from both j and k
+    first, second = shared_observations(point_indices, n_points)
+    S = np.zeros((n_viewpoints, n_viewpoints, n_pose_params, n_pose_params))
+    np.add.at(S, (viewpoint_indices[first], viewpoint_indices[second]),
+              -np.matmul(Y[first], np.swapaxes(W[second], 1, 2)))
+    diagonal = np.arange(n_viewpoints)
+    S[diagonal, diagonal] += U
+
+    e = np.copy(epsilon_a)
+    np.add.at(e, viewpoint_indices,
+              -np.einsum('nij,nj->ni', Y, epsilon_b[point_indices]))
+
+    size = n_viewpoints * n_pose_params
+    return S.swapaxes(1, 2).reshape(size, size), e.flatten()
+
+
+def back_substitution(viewpoint_indices, point_indices,
+                      V_inv, W, epsilon_b, delta_a):
+    d = np.copy(epsilon_b)
+    np.add.at(d, point_indices,
+              -np.einsum('nji,nj->ni', W, delta_a[viewpoint_indices]))
+    return np.einsum('nij,nj->ni', V_inv, d)
+
+
+def damp(X, mu):
+    return X + mu * np.identity(X.shape[1])
+
+
+class PosePrior(object):
+    """
+    Quadratic prior on poses left by marginalization
+
+    .. math::
+        E(\\mathbf{a}) =
+            (\\mathbf{a} - \\mathbf{a}_0)^T H (\\mathbf{a} - \\mathbf{a}_0)
+            - 2 \\mathbf{b}^T (\\mathbf{a} - \\mathbf{a}_0)
+            + \\mathbf{b}^T H^{+} \\mathbf{b}
+
+    The constant term completes the square so that the energy is
+    zero at the minimum and never negative.
+
+    Args:
+        viewpoints : np.ndarray (n_viewpoints,)
+            Viewpoints constrained by the prior
+        poses0 : np.ndarray (n_viewpoints, 6)
+            Linearization point :math:`\\mathbf{a}_0`
+            Each row is [rotvec, translation]
+        H : np.ndarray (6 * n_viewpoints, 6 * n_viewpoints)
+        b : np.ndarray (6 * n_viewpoints,)
+    """
+
+    def __init__(self, viewpoints, poses0, H, b):
+        assert(H.shape == (b.shape[0], b.shape[0]))
+        assert(poses0.size == b.shape[0] == 6 * len(viewpoints))
+        self.viewpoints = np.asarray(viewpoints, dtype=np.int64)
+        self.poses0 = poses0
+        self.H = H
+        self.b = b
+        self.c = np.dot(b, np.dot(np.linalg.pinv(H), b))
+
+    @staticmethod
+    def empty():
+        return PosePrior(np.empty(0, dtype=np.int64), np.empty((0, 6)),
+                         np.empty((0, 0)), np.empty(0))
+
+    def __len__(self):
+        return len(self.viewpoints)
+
+    def indices(self, viewpoints):
+        viewpoints = list(viewpoints)
+        return np.array([viewpoints.index(v) for v in self.viewpoints],
+                        dtype=np.int64)
+
+    def expand(self, viewpoints, poses):
+        """
+        Represent the prior as H and rhs
+        in the coordinate of 'viewpoints' evaluated at 'poses'
+        """
+        indices = self.indices(viewpoints)
+        block = 6 * np.repeat(indices, 6) + np.tile(np.arange(6), len(indices))
+
+        d = poses[indices].flatten() - self.poses0.flatten()
+
+        size = 6 * len(viewpoints)
+        H, rhs = np.zeros((size, size)), np.zeros(size)
+        H[np.ix_(block, block)] = self.H
+        rhs[block] = self.b - np.dot(self.H, d)
+        return H, rhs
+
+    def energy(self, viewpoints, poses):
+        d = poses[self.indices(viewpoints)].flatten() - self.poses0.flatten()
+        E = np.dot(d, np.dot(self.H, d)) - 2 * np.dot(self.b, d) + self.c
+        # remove a negative round-off error
+        return max(E, 0.)
+
+
+class PriorBundleAdjustment(LocalBundleAdjustment):
+    """
+    Bundle adjustment with a :class:`PosePrior`.
+    The reduced camera system is formed with vectorized block operations
+    so that the prior can be added to it.
+    """
+
+    def __init__(self, viewpoint_indices, point_indices, x_true,
+                 viewpoints, prior, robustifier=None):
+        """
+        viewpoints : viewpoint corresponding to each pose index
+        """
+        super().__init__(viewpoint_indices, point_indices, x_true,
+                         robustifier)
+
+        self.viewpoint_indices = np.asarray(viewpoint_indices)
+        self.point_indices = np.asarray(point_indices)
+
+        self.viewpoints = viewpoints
+        self.n_viewpoints = len(viewpoints)
+        self.n_points = np.max(point_indices) + 1
+        self.prior = prior
+        # the prior expanded at the current linearization point
+        self.prior_H, self.prior_rhs = None, None
+
+    def linearize(self, poses, points):
+        self.prior_H, self.prior_rhs = self.prior.expand(self.viewpoints,
+                                                         poses)
+        return super().linearize(poses, points)
+
+    def calc_update(self, x_pred, A, B, mu):
+        I, J = self.viewpoint_indices, self.point_indices
+        U, V, W, epsilon_a, epsilon_b = calc_normal_blocks(
+            I, J, self.n_viewpoints, self.n_points,
+            A, B, self.x_true - x_pred, self.weights
+        )
+        V_inv = np.linalg.pinv(damp(V, mu))
+        S, e = eliminate_points(I, J, damp(U, mu), V_inv, W,
+                                epsilon_a, epsilon_b)
+
+        delta_a = np.linalg.solve(S + self.prior_H,
+                                  e + self.prior_rhs).reshape(-1, 6)
+        delta_b = back_substitution(I, J, V_inv, W, epsilon_b, delta_a)
+        return delta_a, delta_b
+
+    def evaluate(self, poses, points, x_pred=None):
+        if x_pred is None:
+            x_pred = self.projection.compute(poses, points)
+        E = (np.sum(calc_errors(self.x_true, x_pred, self.weights)) +
+             self.prior.energy(self.viewpoints, poses))
+        # normalize to keep the scale the same as 'calc_error'
+        return x_pred, E / self.x_true.shape[0]
+
+
+def marginalize_viewpoint(viewpoint0, viewpoints,
+                          viewpoint_indices, point_indices, keypoints,
+                          poses, points, prior):
+    """
+    Marginalize poses[0] and all points
+
+    Args:
+        viewpoint0 : viewpoint to be marginalized
+        viewpoints : viewpoints corresponding to poses[1:]
+        viewpoint_indices, point_indices, keypoints :
+            observations of points to be marginalized
+        poses : np.ndarray (1 + len(viewpoints), 6)
+        points : np.ndarray (n_points, 3)
+    Returns:
+        PosePrior on 'viewpoints'
+    """
+
+    all_viewpoints = [viewpoint0] + list(viewpoints)
+    n_viewpoints, n_points = len(all_viewpoints), points.shape[0]
+
+    S = np.zeros((6 * n_viewpoints, 6 * n_viewpoints))
+    e = np.zeros(6 * n_viewpoints)
+    if len(point_indices) > 0:
+        projection = Projection(viewpoint_indices, point_indices)
+        x_pred = projection.compute(poses, points)
+        A, B = projection.jacobians(poses, points)
+        U, V, W, epsilon_a, epsilon_b = calc_normal_blocks(
+            viewpoint_indices, point_indices, n_viewpoints, n_points,
+            A, B, keypoints - x_pred
+        )
+        S, e = eliminate_points(viewpoint_indices, point_indices,
+                                U, np.linalg.pinv(V), W,
+                                epsilon_a, epsilon_b)
+
+    H, rhs = prior.expand(all_viewpoints, poses)
+    S, e = S + H, e + rhs
+
+    # Schur complement of the block of 'viewpoint0'
+    S00_inv = np.linalg.pinv(S[0:6, 0:6])
+    Sr0 = S[6:, 0:6]
+    H = S[6:, 6:] - np.dot(Sr0, np.dot(S00_inv, Sr0.T))
+    b = e[6:] - np.dot(Sr0, np.dot(S00_inv, e[0:6]))
+    # symmetrize to remove numerical asymmetry
+    H = (H + H.T) / 2
+    return PosePrior(viewpoints, poses[1:], H, b)
+
+
+class SlidingWindowBA(object):
+    """
+    Keeps the structure of bundle adjustment alive between frames.
+    Observations are added per viewpoint as they are made, and
+    :meth:`marginalize` folds a leaving viewpoint into :class:`PosePrior`.
+    Points are identified by integer ids such as point ids of
+    :class:`tadataka.map_store.MapStore`
+    """
+
+    def __init__(self, robustifier=None):
+        self.robustifier = robustifier
+        # observations in the window are stored in columnar arrays.
+        # Rows are appended when a viewpoint is added and dropped when
+        # it is marginalized, so the arrays stay as small as the window
+        self._observations = GrowableArray((2,), np.int64)  # (viewpoint, id)
+        self._keypoints = GrowableArray((2,), np.float64)
+        self._viewpoints = []
+        self.prior = PosePrior.empty()
+
+    @property
+    def viewpoints(self):
+        return list(self._viewpoints)
+
+    def observers(self, point_id):
+        """Viewpoints observing the point 'point_id'"""
+        rows = self._observations.array
+        return set(rows[rows[:, 1] == point_id, 0])
+
+    def add_observations(self, viewpoint, point_ids, keypoints):
+        assert(len(point_ids) == len(keypoints))
+        if viewpoint not in self._viewpoints:
+            bisect.insort(self._viewpoints, viewpoint)
+
+        rows = np.empty((len(point_ids), 2), dtype=np.int64)
+        rows[:, 0] = viewpoint
+        rows[:, 1] = point_ids
+        self._observations.append(rows)
+        self._keypoints.append(np.reshape(keypoints, (-1, 2)))
+
+    def compress(self, mask):
+        # keep only observations where 'mask' is True
+        self._observations.compress(mask)
+        self._keypoints.compress(mask)
+
+    def remove_observations(self, viewpoints, point_ids):
+        """
+        Remove observations of point_ids[i] from viewpoints[i]
+        """
+        assert(len(viewpoints) == len(point_ids))
+        if len(point_ids) == 0:
+            return
+
+        rows = self._observations.array
+        # encode (viewpoint, point id) pairs to integers
+        n = max(np.max(rows[:, 1]), np.max(point_ids)) + 1
+        keys = rows[:, 0] * n + rows[:, 1]
+        removed = np.isin(keys, np.asarray(viewpoints) * n +
+                          np.asarray(point_ids))
+        self.compress(~removed)
+
+    def get_indices(self, viewpoints, point_ids=None):
+        """
+        Returns viewpoint indices, point indices, keypoints and point ids
+        of observations made from 'viewpoints', which have to be sorted.
+        If 'point_ids' is given, only observations of them are collected
+        and point indices are indices of 'point_ids'
+        """
+
+        rows = self._observations.array
+        mask = np.isin(rows[:, 0], viewpoints)
+        if point_ids is not None:
+            mask = mask & np.isin(rows[:, 1], point_ids)
+        rows, keypoints = rows[mask], self._keypoints.array[mask]
+
+        viewpoint_indices = np.searchsorted(viewpoints, rows[:, 0])
+        if point_ids is None:
+            point_ids, point_indices = np.unique(rows[:, 1],
+                                                 return_inverse=True)
+        else:
+            point_ids = np.asarray(point_ids, dtype=np.int64)
+            sorter = np.argsort(point_ids)
+            point_indices = sorter[np.searchsorted(point_ids, rows[:, 1],
+                                                   sorter=sorter)]
+        return viewpoint_indices, point_indices, keypoints, point_ids
+
+    def optimize(self, poses, points, max_iter=5):
+        """
+        Args:
+            poses : dict of viewpoint -> Pose
+            points : np.ndarray indexed by point ids
+        Returns:
+            Refined poses (dict) of viewpoints in the window,
+            ids and refined coordinates of points in the window, and
+            viewpoints and point ids of observations judged as outliers.
+            Outlier observations are removed from the window.
+        """
+
+        viewpoints = self.viewpoints
+        viewpoint_indices, point_indices, keypoints, point_ids =\
+            self.get_indices(viewpoints)
+
+        empty = np.empty(0, dtype=np.int64)
+        if len(point_ids) == 0:
+            return dict(), empty, np.empty((0, 3)), (empty, empty)
+
+        ba = PriorBundleAdjustment(viewpoint_indices, point_indices,
+                                   keypoints, viewpoints, self.prior,
+                                   self.robustifier)
+
+        params = poses_to_params([poses[v] for v in viewpoints])
+        rotvecs, ts, point_array = ba.compute(params[:, 0:3], params[:, 3:6],
+                                              points[point_ids],
+                                              absolute_error_threshold=1e-9,
+                                              max_iter=max_iter,
+                                              relative_error_threshold=0.20)
+        params = np.hstack((rotvecs, ts))
+
+        outliers = (np.asarray(viewpoints)[viewpoint_indices[~ba.inliers]],
+                    point_ids[point_indices[~ba.inliers]])
+        self.remove_observations(*outliers)
+
+        return (dict(zip(viewpoints, params_to_poses(params))),
+                point_ids, point_array, outliers)
+
+    def marginalize(self, viewpoint0, poses, points):
+        """
+        Remove 'viewpoint0' from the window and fold the information
+        into the prior.
+        Points that lose their second observation are marginalized
+        together. Observations of other points from 'viewpoint0' are
+        dropped to keep the prior only on poses.
+        """
+
+        rows = self._observations.array
+        point_ids0 = rows[rows[:, 0] == viewpoint0, 1]
+        ids, n_observers = np.unique(rows[:, 1], return_counts=True)
+        n_observers0 = n_observers[np.searchsorted(ids, point_ids0)]
+        marginalized = point_ids0[n_observers0 <= 2]
+
+        is_marginalized = np.isin(rows[:, 1], marginalized)
+        observers = set(rows[is_marginalized, 0])
+        viewpoints = sorted((observers | set(self.prior.viewpoints))
+                            - {viewpoint0})
+        all_viewpoints = [viewpoint0] + viewpoints
+
+        viewpoint_indices, point_indices, keypoints, _ = self.get_indices(
+            all_viewpoints, marginalized
+        )
+        params = poses_to_params([poses[v] for v in all_viewpoints])
+        self.prior = marginalize_viewpoint(
+            viewpoint0, viewpoints,
+            viewpoint_indices, point_indices, keypoints,
+            params, points[marginalized].reshape(-1, 3), self.prior
+        )
+
+        self.compress(~(is_marginalized | (rows[:, 0] == viewpoint0)))
+        self._viewpoints.remove(viewpoint0)
@@ -0,0 +1,146 @@
+import os
+
+import sympy
+from sympy import Matrix
+from sympy.printing.numpy import NumPyPrinter
+
+
+# Symbolic definitions of the projection and its jacobians.
+# The expressions are converted into NumPy source code and saved to
+# 'tadataka/_so3_kernels.py' so that sympy is not required at runtime.
+# Run
+#     python -m tadataka.so3_symbols
+# to regenerate the kernels after changing the expressions below, and
+#     python -m tadataka.so3_symbols --check
+# to check that the saved kernels are up to date.
+
+
+so3_base0 = Matrix([
+    [0, 0, 0],
+    [0, 0, -1],
+    [0, 1, 0]
+])
+
+so3_base1 = Matrix([
+    [0, 0, 1],
+    [0, 0, 0],
+    [-1, 0, 0]
+])
+
+so3_base2 = Matrix([
+    [0, -1, 0],
+    [1, 0, 0],
+    [0, 0, 0]
+])
+
+
+def tangent_so3(v):
+    return v[0] * so3_base0 + v[1] * so3_base1 + v[2] * so3_base2
+
+
+EPSILON = 1e-16
+
+
+def exp_so3_symbols(omega):
+    epsilons = EPSILON * sympy.ones(1, 3)
+    # add 'epsilons' to 'omega' directly
+    # ZeroDivision occurs in grad calculation if we add EPSILON to 'theta'
+    theta = (omega + epsilons).norm()
+    K = tangent_so3(omega / theta)
+    I = sympy.eye(3)
+    return I + sympy.sin(theta) * K + (1-sympy.cos(theta)) * K * K
+
+
+def transform_symbols(R, t, P):
+    return (R * P.T).T + t
+
+
+def projection_symbols(pose, point):
+    omega, t = Matrix([pose[0:3]]), Matrix([pose[3:6]])
+    R = exp_so3_symbols(omega)
+    p = transform_symbols(R, t, point)
+    return Matrix(p[0:2]) / (p[2] + EPSILON)
+
+
+a, b, c, d, e, f = sympy.symbols('a:f', real=True)
+x, y, z = sympy.symbols('x:z', real=True)
+
+omega, t = Matrix([[a, b, c]]), Matrix([[d, e, f]])
+pose = Matrix([*omega, *t])
+point = Matrix([[x, y, z]])
+
+
+def kernel_expressions():
+    x_symbols = projection_symbols(pose, point)
+    return [
+        ("exp_so3_", omega, exp_so3_symbols(omega)),
+        ("projection_", [*pose, *point], x_symbols),
+        ("pose_jacobian_", [*pose, *point], x_symbols.jacobian(pose)),
+        ("point_jacobian_", [*pose, *point], x_symbols.jacobian(point)),
+    ]
+
+
+HEADER = '''\
+# This file is generated by 'python -m tadataka.so3_symbols'.
+# Do not edit by hand.
+
+import numpy
+
+
+'''
+
+
+def generate_function(name, args, M):
+    """
+    Generate a NumPy function that evaluates the matrix expression M.
+    Arguments can be scalars or arrays of the same shape, and the result
+    has the shape of arguments + M.shape
+    """
+
+    printer = NumPyPrinter({'fully_qualified_modules': True})
+    replacements, [M] = sympy.cse(M, symbols=sympy.numbered_symbols('r'))
+
+    args = ", ".join(str(arg) for arg in args)
+    lines = [f"def {name}({args}):"]
+    for symbol, expr in replacements:
+        lines.append(f"    {symbol} = {printer.doprint(expr)}")
+
+    n_rows, n_cols = M.shape
+    lines.append(f"    out = numpy.empty(numpy.broadcast({args}).shape + "
+                 f"({n_rows}, {n_cols}))")
+    for i in range(n_rows):
+        for j in range(n_cols):
+            lines.append(f"    out[..., {i}, {j}] = {printer.doprint(M[i, j])}")
+    lines.append("    return out")
+    return "\n".join(lines) + "\n"
+
+
+def generate_source():
+    functions = [generate_function(name, args, M)
+                 for name, args, M in kernel_expressions()]
+    return HEADER + "\n\n".join(functions)
+
+
+def kernel_path():
+    return os.path.join(os.path.dirname(__file__), "_so3_kernels.py")
+
+
+def generate(path=kernel_path()):
+    with open(path, 'w') as f:
+        f.write(generate_source())
+
+
+def is_up_to_date(path=kernel_path()):
+    with open(path) as f:
+        return f.read() == generate_source()
+
+
+if __name__ == "__main__":
+    import sys
+
+    if "--check" in sys.argv[1:]:
+        if not is_up_to_date():
+            sys.exit(f"'{kernel_path()}' is out of date. "
+                     "Run 'python -m tadataka.so3_symbols' to regenerate it")
+    else:
+        generate()
@@ -33,6 +33,18 @@ class Triangulation(object):
         return TR.linear_triangulation(self.rotations, self.translations,
                                        keypoints)
 
+    def triangulate_sparse(self, viewpoint_indices, point_indices, keypoints):
+        """
+        Same as 'triangulate' but each point can be observed from
+        an arbitrary subset of poses.
+        keypoints[k] is an observation of the point_indices[k]-th point
+        from the viewpoint_indices[k]-th pose
+        """
+        return TR.sparse_linear_triangulation(
+            self.rotations, self.translations,
+            viewpoint_indices, point_indices, keypoints
+        )
+
 
 class DepthFromTriangulation(object):
     def __init__(self, pose0, pose1):
@@ -41,31 +53,17 @@ class DepthFromTriangulation(object):
 
     def __call__(self, keypoint0, keypoint1):
         """
-        pose0, pose1 : Poses in the local coordinate system
+        keypoint0, keypoint1 : Keypoints of shape (2,) or
+            keypoint arrays of shape (n_keypoints, 2)
+        Returns depths of shape (2,) or (n_keypoints, 2) respectively.
+        Depths are NaN if the corresponding rays are nearly parallel
         """
 
-        def to_homogeneous(x):
-            return np.append(x, 1)
-
-        # y0 = inv(K) * homogeneous(x0)
-        # y1 = inv(K) * homogeneous(x1)
-        # In this implementation, we assume K = I
-
-        # R0 * X + t0 = depth0 * y0
-        # R1 * X + t1 = depth1 * y1
+        assert(np.shape(keypoint0) == np.shape(keypoint1))
 
-        # X = R0.T * (depth0 * y0 - t0) = depth0 * R0.T * y0 - R0.T * t0
-        # X = R1.T * (depth1 * y1 - t1) = depth1 * R1.T * y1 - R1.T * t1
-        # 0 = (depth0 * R0.T * y0 - R0.T * t0) - (depth1 * R1.T * y1 - R1.T * t1)
-        # R0.T * t0 - R1.T * t1 = depth0 * R0.T * y0 - depth1 * R1.T * y1
-        #                       = dot([R0.T * y0, -R1.T * y1], [depth0, depth1])
+        if np.ndim(keypoint0) == 1:
+            return self(np.atleast_2d(keypoint0), np.atleast_2d(keypoint1))[0]
 
-        R0, t0 = self.R0, self.t0
-        R1, t1 = self.R1, self.t1
-
-        y0 = to_homogeneous(keypoint0)
-        y1 = to_homogeneous(keypoint1)
-        A = np.column_stack((np.dot(R0.T, y0), -np.dot(R1.T, y1)))
-        b = np.dot(R0.T, t0) - np.dot(R1.T, t1)
-        depths, residuals, rank, s = np.linalg.lstsq(A, b)
-        return depths
+        # In this implementation, we assume K = I
+        return TR.two_view_depths(self.R0, self.t0, self.R1, self.t1,
+                                  keypoint0, keypoint1)
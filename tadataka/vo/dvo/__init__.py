@@ -3,18 +3,16 @@ import warnings
 
 import numpy as np
 from numpy.linalg import norm
+from scipy.linalg import cho_factor, cho_solve
 
-from skimage.io import imread
-from skimage.transform import resize
-from skimage.color import rgb2gray
-
-from tadataka.camera import CameraParameters
 from tadataka.rigid_transform import transform
 from tadataka.interpolation import interpolation
 from tadataka.se3 import exp_se3, get_rotation, get_translation
-from tadataka.vo.dvo.mask import compute_mask
+from tadataka.vo.dvo.mask import is_in_range
 from tadataka.vo.dvo.projection import inverse_projection, projection
-from tadataka.vo.dvo.jacobian import calc_image_gradient, calc_jacobian
+from tadataka.vo.dvo.jacobian import (accumulate_normal_equation,
+                                      calc_normal_equation)
+from tadataka.vo.dvo.pyramid import ImagePyramid
 from tadataka.pose import Pose
 from tadataka.robust.weights import (compute_weights_huber,
                                      compute_weights_student_t,
@@ -27,23 +25,37 @@ def calc_error(r, weights=None):
     return np.dot(r * weights, r)  # r * W * r
 
 
-def solve_linear_equation(J, r, weights=None):
-    if weights is not None:
-        # mulitply weights to each row
-        J = J * weights.reshape(-1, 1)
+def solve_cholesky(H, g):
+    try:
+        return cho_solve(cho_factor(H), g)
+    except np.linalg.LinAlgError:
+        # H is rank deficient if some motion is not observable,
+        # e.g. the translation along stripes.
+        # Take the minimum norm solution as lstsq on J does
+        return np.linalg.lstsq(H, g, rcond=None)[0]
 
-    xi, errors, _, _ = np.linalg.lstsq(J, r, rcond=None)
-    error = 0 if len(errors) == 0 else errors[0]
-    return xi, error
 
+def log_determinant(H):
+    # -inf if H is singular, nan if H is not given
+    if H is None:
+        return np.nan
+    sign, logdet = np.linalg.slogdet(H)
+    return logdet if sign > 0 else -np.inf
 
-def level_to_ratio(level):
-    return 1 / pow(2, level)
 
+def information_ratio(logdet, logdet_reference):
+    """
+    Ratio of the information of a pose estimate to the reference one,
+    where the information is the determinant of the hessian, normalized
+    by the 6 degrees of freedom.
+    The entropy of the estimate is 0.5 * (6 * log(2 * pi * e) - logdet),
+    so the ratio is exp(-(entropy - reference entropy) / 3). Unlike
+    the ratio of entropies, it does not depend on their signs
+    """
+    return np.exp((logdet - logdet_reference) / 6)
 
-def calc_pose_update(camera_parameters,
-                     I0, D0, I1, DX, DY, S, pose, min_depth=1e-8):
 
+def linearize(camera_parameters, I0, S, I1, DX, DY, pose):
     # Transform onto the t0 coordinate
     # means that
     # 1. backproject each pixel in the t0 frame to 3D
@@ -51,89 +63,160 @@ def calc_pose_update(camera_parameters,
     # 3. reproject the transformed 3D points to the t1 coordinates
     # 4. interpolate image gradient maps using the reprojected coordinates
 
+    # 'I0' and 'S' are intensities and 3D points of the selected pixels
+    # in the t0 frame.
+    # Returns H and g of the normal equation H * xi = g and the error
+
     P = transform(pose.R, pose.t, S)  # to t1 coordinates
     Q = projection(camera_parameters, P)
-    mask = compute_mask(D0, Q).flatten()
+    mask = is_in_range(I1.shape, Q)
 
     if not np.any(mask):
-        # return xi = np.zeros(6), error = np.nan
-        # if there is no valid pixel
-        return np.zeros(6), np.nan
-
-    P = P[mask]
-    I0 = I0.flatten()[mask]  # you don't need to warp I0
-    I1 = interpolation(I1, Q, order=1)[mask]
-    DX = interpolation(DX, Q, order=1)[mask]
-    DY = interpolation(DY, Q, order=1)[mask]
+        # error = np.nan if there is no valid pixel
+        return np.zeros((6, 6)), np.zeros(6), np.nan
 
-    # J.shape == (n_image_pixels, 6)
-    J = calc_jacobian(camera_parameters, DX, DY, P)
+    P, Q = P[mask], Q[mask]
+    I0 = I0[mask]  # you don't need to warp I0
+    I1 = interpolation(I1, Q, order=1)
+    DX = interpolation(DX, Q, order=1)
+    DY = interpolation(DY, Q, order=1)
 
     r = -(I1 - I0)
     # weights = compute_weights_tukey(r)
     weights = compute_weights_student_t(r)
 
-    xi, error = solve_linear_equation(J, r, weights)
-    return xi, error
+    # W = diag(weights^2) because 'weights' are multiplied to
+    # each row of J and r
+    W = weights * weights
+    fx, fy = camera_parameters.focal_length
+    H, g = calc_normal_equation(fx, fy, DX, DY, P, r, W)
+    return H, g, calc_error(r, W)
 
 
-class PoseChangeEstimator(object):
-    def __init__(self, camera_model, I0, D0, I1,
-                 epsilon=1e-4, max_iter=20):
-        # TODO check if np.ndim(D0) == np.ndim(I1) == 2
+def linearize_inverse(camera_parameters, I0, S, I1, J, pose):
+    # Inverse compositional version of 'linearize'.
+    # 'J' is the jacobian of I0 at the identity pose, which is
+    # precomputed from the gradients and the depth of the reference frame.
+    # Only I1 is warped at each iteration
+
+    P = transform(pose.R, pose.t, S)  # to t1 coordinates
+    Q = projection(camera_parameters, P)
+    mask = is_in_range(I1.shape, Q)
+
+    if not np.any(mask):
+        return np.zeros((6, 6)), np.zeros(6), np.nan
 
-        self.I0 = I0
-        self.D0 = D0
-        self.I1 = I1
+    I0 = I0[mask]
+    I1 = interpolation(I1, Q[mask], order=1)
+
+    r = I1 - I0
+    weights = compute_weights_student_t(r)
+
+    W = weights * weights
+    H, g = accumulate_normal_equation(J, np.flatnonzero(mask), r, W)
+    return H, g, calc_error(r, W)
+
+
+def calc_overlap(camera_parameters, S, image_shape, pose):
+    # ratio of points 'S' in the t0 frame that are visible from the t1 frame
+    P = transform(pose.R, pose.t, S)
+    Q = projection(camera_parameters, P)
+    if len(Q) == 0:
+        return 0.0
+    return np.mean(is_in_range(image_shape, Q))
+
+
+class PoseChangeEstimator(object):
+    def __init__(self, pyramid0, pyramid1, epsilon=1e-4, max_iter=20,
+                 inverse_compositional=False, pixel_selector=None):
+        """
+        Estimate the pose change from the frame of 'pyramid0' to the frame
+        of 'pyramid1'. 'pyramid0' must have depth maps.
+        If 'inverse_compositional' is True, jacobians are computed from
+        'pyramid0' only once and cached in it, so they can be reused
+        while 'pyramid0' is the reference.
+        'pixel_selector' chooses pixels of 'pyramid0' used for alignment
+        (see tadataka.vo.dvo.selection). The selection is also cached in
+        'pyramid0'. All pixels with valid depth are used if it is None
+        """
+
+        assert(pyramid0.depth_maps[0] is not None)
+        assert(pyramid0.n_levels == pyramid1.n_levels)
+
+        self.pyramid0 = pyramid0
+        self.pyramid1 = pyramid1
 
         self.epsilon = epsilon
         self.max_iter = max_iter
+        self.inverse_compositional = inverse_compositional
+        self.pixel_selector = pixel_selector
 
-        # FIXME use 'camera_model'
-        self.camera_parameters = camera_model.camera_parameters
-
-    def estimate(self, n_coarse_to_fine=5):
+        # pose change from t0 to t1 and the hessian at the finest level
+        # of the last estimation
+        self.pose = Pose.identity()
+        self.hessian = None
+
+    def estimate(self, n_coarse_to_fine=5, initial_pose=None):
+        """
+        Returns the pose change which transforms points in the t1 coordinate
+        to the t0 coordinate. 'initial_pose' is the initial guess of it
+        """
+        n_coarse_to_fine = min(n_coarse_to_fine, self.pyramid0.n_levels)
         levels = list(reversed(range(n_coarse_to_fine)))
 
-        pose = Pose.identity()
+        pose = Pose.identity() if initial_pose is None else initial_pose.inv()
         for level in levels:
             try:
                 pose = self.estimate_motion_at(level, pose)
             except np.linalg.LinAlgError as e:
+                # keep the estimate of coarser levels
                 sys.stderr.write(str(e) + "\n")
-                return Pose.identity()
+                self.hessian = None
+                break
+        self.pose = pose
         # invert because 'pose' is representing the pose change from t1 to t0
         return pose.inv()
 
-    def camera_parameters_at(self, level):
-        """Change camera parameters as the image is resized"""
-        focal_length = self.camera_parameters.focal_length
-        offset = self.camera_parameters.offset
-        ratio = level_to_ratio(level)
-        return CameraParameters(focal_length * ratio, offset * ratio)
-
-    def image_shape_at(self, level):
-        shape = np.array(self.I0.shape)
-        ratio = level_to_ratio(level)
-        return shape * ratio
+    def log_determinant(self):
+        # log determinant of the hessian of the last estimate
+        return log_determinant(self.hessian)
+
+    def overlap(self, level=2):
+        """
+        Ratio of valid pixels in the t0 frame that are visible from the
+        t1 frame under the last estimate, computed at 'level'.
+        Pixels at image borders dominate the ratio at too coarse levels
+        """
+        level = min(level, self.pyramid0.n_levels - 1)
+        S = self.pyramid0.points[level][self.pyramid0.pixel_indices(level)]
+        return calc_overlap(self.pyramid0.camera_parameters[level], S,
+                            self.pyramid1.images[level].shape, self.pose)
 
     def estimate_motion_at(self, level, pose):
-        camera_parameters = self.camera_parameters_at(level)
-        shape = self.image_shape_at(level)
+        # reset so that a failure at the finest level is not hidden
+        self.hessian = None
+
+        camera_parameters = self.pyramid0.camera_parameters[level]
 
-        I0 = resize(self.I0, shape)
-        D0 = resize(self.D0, shape)
-        I1 = resize(self.I1, shape)
+        indices = self.pyramid0.pixel_indices(level, self.pixel_selector)
+        I0 = self.pyramid0.images[level].flatten()[indices]
+        S = self.pyramid0.points[level][indices]
 
-        S = inverse_projection(camera_parameters, D0)
+        I1 = self.pyramid1.images[level]
+        DX, DY = self.pyramid1.gradients[level]
 
-        DX, DY = calc_image_gradient(I1)
+        if self.inverse_compositional:
+            J = self.pyramid0.jacobian(level, self.pixel_selector)
 
         for k in range(self.max_iter):
-            dxi, error = calc_pose_update(
-                camera_parameters,
-                I0, D0, I1, DX, DY, S, pose
-            )
+            if self.inverse_compositional:
+                H, g, error = linearize_inverse(
+                    camera_parameters, I0, S, I1, J, pose
+                )
+            else:
+                H, g, error = linearize(
+                    camera_parameters, I0, S, I1, DX, DY, pose
+                )
 
             if np.isnan(error):
                 warnings.warn(
@@ -141,34 +224,115 @@ class PoseChangeEstimator(object):
                     "Camera's pose change is too large ".format(level),
                     RuntimeWarning
                 )
+                break
+
+            self.hessian = H
+            dxi = solve_cholesky(H, g)
 
             if norm(dxi) < self.epsilon:
                 break
 
             dpose = Pose.from_se3(dxi)
-            pose = pose * dpose
+            if self.inverse_compositional:
+                # I0 warped by 'dpose' matches I1 warped by 'pose'
+                pose = pose * dpose.inv()
+            else:
+                pose = pose * dpose
         return pose
 
 
+class KeyframePolicy(object):
+    def __init__(self, min_overlap=0.7, min_information_ratio=0.5):
+        """
+        A new frame becomes a keyframe if the ratio of keyframe pixels
+        visible from the frame is less than 'min_overlap', or the
+        information ratio (see 'information_ratio') of the pose estimate to
+        the first frame aligned to the keyframe is less than
+        'min_information_ratio'. A failed estimate, whose ratio is nan,
+        also makes a keyframe.
+        This follows the entropy ratio criterion of
+
+        Kerl, Christian, Jürgen Sturm, and Daniel Cremers.
+        "Dense visual SLAM for RGB-D cameras."
+        2013 IEEE/RSJ International Conference on Intelligent Robots
+        and Systems. IEEE, 2013.
+        """
+        self.min_overlap = min_overlap
+        self.min_information_ratio = min_information_ratio
+
+    def __call__(self, overlap, information_ratio):
+        # written so that nan makes a keyframe
+        if not overlap >= self.min_overlap:
+            return True
+        return not information_ratio >= self.min_information_ratio
+
+
 class DVO(object):
-    def __init__(self):
+    def __init__(self, n_levels=5, inverse_compositional=False,
+                 pixel_selector=None, keyframe_policy=None):
+        """
+        Frames are aligned to the current keyframe.
+        If 'keyframe_policy' is None, every frame becomes the keyframe
+        of the next one. Only the pyramid of the current keyframe and
+        the estimated poses are kept
+        """
+        self.n_levels = n_levels
+        self.inverse_compositional = inverse_compositional
+        self.pixel_selector = pixel_selector
+        self.keyframe_policy = keyframe_policy
+
         self.pose = Pose.identity()
-        self.frames = []
+        self.poses = []
+        # indices of keyframes in 'poses'
+        self.keyframe_indices = []
+
+        self.keyframe = None  # pyramid of the current keyframe
+        self.keyframe_pose = None
+        # pose change from the keyframe to the last frame
+        self.dpose = Pose.identity()
+        self.reference_logdet = None
+
+    def build_pyramid(self, frame):
+        camera_parameters = frame.camera_model.camera_parameters
+        return ImagePyramid(camera_parameters, frame.image, frame.depth_map,
+                            self.n_levels)
+
+    def set_keyframe(self, pyramid, pose):
+        self.keyframe_indices.append(len(self.poses) - 1)
+        self.keyframe = pyramid
+        self.keyframe_pose = pose
+        self.dpose = Pose.identity()
+        self.reference_logdet = None
+
+    def is_keyframe(self, estimator):
+        logdet = estimator.log_determinant()
+        if self.reference_logdet is None:
+            self.reference_logdet = logdet
+        return self.keyframe_policy(
+            estimator.overlap(),
+            information_ratio(logdet, self.reference_logdet)
+        )
 
     def estimate(self, frame1):
-        if len(self.frames) == 0:
-            self.frames.append(frame1)
-            return self.pose
+        pyramid1 = self.build_pyramid(frame1)
 
-        frame0 = self.frames[-1]
-
-        I0, D0 = rgb2gray(frame0.image), frame0.depth_map
-        I1 = rgb2gray(frame1.image)
+        if self.keyframe is None:
+            self.poses.append(self.pose)
+            self.set_keyframe(pyramid1, self.pose)
+            return self.pose
 
-        estimator = PoseChangeEstimator(frame1.camera_model, I0, D0, I1)
-        dpose = estimator.estimate()
+        estimator = PoseChangeEstimator(
+            self.keyframe, pyramid1,
+            inverse_compositional=self.inverse_compositional,
+            pixel_selector=self.pixel_selector
+        )
+        # the motion from the keyframe to the last frame is
+        # a good initial guess
+        self.dpose = estimator.estimate(self.n_levels, self.dpose)
 
-        self.frames.append(frame1)
+        self.pose = self.keyframe_pose * self.dpose
+        self.poses.append(self.pose)
 
-        self.pose = self.pose * dpose
+        if self.keyframe_policy is None or self.is_keyframe(estimator):
+            self.set_keyframe(pyramid1, self.pose)
         return self.pose
@@ -1,4 +1,5 @@
 import numpy as np
+from numba import njit
 
 # Kerl, Christian.
 # "Odometry from rgb-d cameras for autonomous quadrocopters."
@@ -51,6 +52,68 @@ def calc_jacobian(camera_parameters, dx, dy, P):
     return J
 
 
+@njit(cache=True)
+def calc_normal_equation(fx, fy, dx, dy, P, r, weights):
+    """
+    Compute H = J^T * W * J and g = J^T * W * r in one pass without
+    materializing J, where J is the jacobian given by 'calc_jacobian'
+    and W = diag(weights)
+    """
+
+    H = np.zeros((6, 6))
+    g = np.zeros(6)
+    j = np.empty(6)
+    for i in range(P.shape[0]):
+        x, y, z = P[i, 0], P[i, 1], P[i, 2]
+        fgx, fgy = fx * dx[i], fy * dy[i]
+        z2 = z * z
+        xy = x * y
+        j[0] = fgx / z
+        j[1] = fgy / z
+        j[2] = -(fgx * x + fgy * y) / z2
+        j[3] = -fgx * xy / z2 - fgy * (1 + (y / z) ** 2)
+        j[4] = fgx * (1 + (x / z) ** 2) + fgy * xy / z2
+        j[5] = (-fgx * y + fgy * x) / z
+
+        w = weights[i]
+        wr = w * r[i]
+        for k in range(6):
+            wj = w * j[k]
+            g[k] += j[k] * wr
+            for l in range(k, 6):
+                H[k, l] += wj * j[l]
+
+    for k in range(6):
+        for l in range(k):
+            H[k, l] = H[l, k]
+    return H, g
+
+
+@njit(cache=True)
+def accumulate_normal_equation(J, indices, r, weights):
+    """
+    Compute H = J'^T * W * J' and g = J'^T * W * r
+    where J' = J[indices] without copying rows of J
+    """
+
+    H = np.zeros((6, 6))
+    g = np.zeros(6)
+    for i in range(indices.shape[0]):
+        n = indices[i]
+        w = weights[i]
+        wr = w * r[i]
+        for k in range(6):
+            wj = w * J[n, k]
+            g[k] += J[n, k] * wr
+            for l in range(k, 6):
+                H[k, l] += wj * J[n, l]
+
+    for k in range(6):
+        for l in range(k):
+            H[k, l] = H[l, k]
+    return H, g
+
+
 def calc_image_gradient(image):
     DY, DX = np.gradient(image)
     return DX, DY  # reverse the order
@@ -0,0 +1,132 @@
+import numpy as np
+from skimage.color import rgb2gray
+
+from tadataka.camera import CameraParameters
+from tadataka.vo.dvo.jacobian import calc_image_gradient, calc_jacobian
+from tadataka.vo.dvo.projection import inverse_projection
+
+
+def crop_even(image):
+    height, width = image.shape[0:2]
+    return image[:height - height % 2, :width - width % 2]
+
+
+def blocks(image):
+    # view 'image' as 2x2 blocks of shape (height / 2, width / 2, 4)
+    image = crop_even(image)
+    return np.stack((image[0::2, 0::2], image[0::2, 1::2],
+                     image[1::2, 0::2], image[1::2, 1::2]), axis=2)
+
+
+def decimate_image(image):
+    # average each 2x2 block
+    return np.mean(blocks(image), axis=2)
+
+
+def decimate_depth(depth_map):
+    # average valid (positive) depths in each 2x2 block
+    # the depth is 0 if the block doesn't have any valid depth
+    B = blocks(depth_map)
+    valid = B > 0
+    n_valid = np.sum(valid, axis=2)
+    sum_ = np.sum(np.where(valid, B, 0), axis=2)
+    return np.divide(sum_, n_valid,
+                     out=np.zeros(sum_.shape), where=n_valid > 0)
+
+
+def camera_parameters_at(camera_parameters, level):
+    """Change camera parameters as the image is decimated"""
+    ratio = 1 / pow(2, level)
+    focal_length = camera_parameters.focal_length * ratio
+    # pixel centers move because each pixel is merged into a 2x2 block
+    offset = (camera_parameters.offset + 0.5) * ratio - 0.5
+    return CameraParameters(focal_length, offset)
+
+
+class ImagePyramid(object):
+    def __init__(self, camera_parameters, image, depth_map=None, n_levels=5):
+        """
+        Grayscale images, gradients, depth maps and back-projected points
+        of each level. Level 0 is the original resolution and the size is
+        halved as the level increases.
+        'n_levels' is capped so that every level has at least 2 pixels
+        along each axis, which is required to compute gradients
+        """
+
+        if np.ndim(image) == 3:
+            image = rgb2gray(image)
+
+        self.camera_parameters = []
+        self.images = []
+        self.gradients = []
+        self.depth_maps = []
+        self.points = []
+        self.jacobians = dict()
+        self.selections = dict()
+
+        I, D = image.astype(np.float64), depth_map
+        if min(I.shape[0:2]) < 2:
+            raise ValueError("Image is too small to build a pyramid")
+        for level in range(n_levels):
+            if level > 0:
+                if min(I.shape[0:2]) // 2 < 2:
+                    break
+                I = decimate_image(I)
+                D = None if D is None else decimate_depth(D)
+
+            camera_parameters_ = camera_parameters_at(camera_parameters, level)
+            self.camera_parameters.append(camera_parameters_)
+            self.images.append(I)
+            self.gradients.append(calc_image_gradient(I))
+            self.depth_maps.append(D)
+            if D is None:
+                self.points.append(None)
+            else:
+                self.points.append(inverse_projection(camera_parameters_, D))
+
+    @property
+    def n_levels(self):
+        return len(self.images)
+
+    def pixel_indices(self, level, selector=None):
+        """
+        Indices of pixels at 'level' used for alignment, chosen by
+        'selector' in the flattened image. All pixels with valid depth
+        are used if 'selector' is None.
+        The indices are computed at the first call and cached
+        """
+
+        key = (level, selector)
+        if key in self.selections:
+            return self.selections[key]
+
+        D = self.depth_maps[level]
+        assert(D is not None)
+        if selector is None:
+            indices = np.flatnonzero(D > 0)
+        else:
+            DX, DY = self.gradients[level]
+            indices = selector(DX, DY, D)
+        self.selections[key] = indices
+        return indices
+
+    def jacobian(self, level, selector=None):
+        """
+        Jacobian of the image at 'level' with respect to the pose change
+        of the camera, evaluated at the identity pose.
+        The i-th row corresponds to the i-th pixel of
+        'pixel_indices(level, selector)'.
+        It is computed at the first call and cached
+        """
+
+        key = (level, selector)
+        if key in self.jacobians:
+            return self.jacobians[key]
+
+        indices = self.pixel_indices(level, selector)
+        DX, DY = self.gradients[level]
+        J = calc_jacobian(self.camera_parameters[level],
+                          DX.flatten()[indices], DY.flatten()[indices],
+                          self.points[level][indices])
+        self.jacobians[key] = J
+        return J
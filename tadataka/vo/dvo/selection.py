@@ -0,0 +1,55 @@
+import numpy as np
+
+from tadataka.coordinates import image_coordinates
+from tadataka.feature.grid import KeypointGrid
+
+
+# Pixel selectors for DVO.
+# A selector is called with image gradients and the depth map of a
+# reference pyramid level and returns indices of the selected pixels
+# in the flattened image. Only pixels with valid depth are selected
+
+
+def gradient_magnitude(DX, DY):
+    return np.hypot(DX, DY).flatten()
+
+
+def valid_depth_indices(depth_map):
+    return np.flatnonzero(depth_map > 0)
+
+
+class GradientPercentileSelector(object):
+    def __init__(self, percentile=75, min_pixels=1000):
+        """
+        Select pixels whose gradient magnitudes are above 'percentile'.
+        All valid pixels are selected if there are fewer than 'min_pixels',
+        so coarse levels are not thinned out
+        """
+        self.percentile = percentile
+        self.min_pixels = min_pixels
+
+    def __call__(self, DX, DY, depth_map):
+        indices = valid_depth_indices(depth_map)
+        if len(indices) <= self.min_pixels:
+            return indices
+
+        magnitude = gradient_magnitude(DX, DY)[indices]
+        threshold = np.percentile(magnitude, self.percentile)
+        return indices[magnitude >= threshold]
+
+
+class GridSelector(object):
+    def __init__(self, cell_size=8, n_per_cell=8):
+        """
+        Divide the image into square cells and select top 'n_per_cell'
+        pixels of the largest gradient magnitudes from each cell
+        """
+        self.cell_size = cell_size
+        self.n_per_cell = n_per_cell
+
+    def __call__(self, DX, DY, depth_map):
+        indices = valid_depth_indices(depth_map)
+        coordinates = image_coordinates(depth_map.shape)[indices]
+        grid = KeypointGrid(coordinates, self.cell_size, depth_map.shape)
+        magnitude = gradient_magnitude(DX, DY)[indices]
+        return indices[grid.cap(self.n_per_cell, magnitude)]
@@ -1,22 +1,28 @@
 import warnings
+from collections import deque
+from itertools import repeat
+
 import numpy as np
 
 from skimage.color import rgb2gray
 from tadataka.exceptions import NotEnoughInliersException, print_error
 from tadataka.feature import extract_features, Matcher
-from tadataka.feature import Features
+from tadataka.feature import Features, match_by_projection
 from tadataka.camera import CameraModel
-from tadataka.correspondence import (
-    associate_triangulated,
-    get_indices, get_point_hashes, init_correspondence, is_triangulated,
-    merge_correspondences, subscribe
-)
+from tadataka.correspondence import (associate_triangulated, get_indices,
+                                     get_point_hashes, is_rejected,
+                                     is_triangulated)
 from tadataka.depth import compute_depth_mask
-from tadataka.utils import merge_dicts, value_list
+from tadataka.map_store import MapStore
+from tadataka.utils import value_list
 from tadataka.pose import Pose, solve_pnp, estimate_pose_change
+from tadataka.projection import pi
+from tadataka.rigid_transform import transform
 from tadataka.triangulation import TwoViewTriangulation
 from tadataka.keyframe_index import KeyframeIndices
-from tadataka.local_ba import try_run_ba
+from tadataka.local_ba import (try_run_ba, try_run_robust_ba,
+                               run_motion_only_ba, run_structure_only_ba)
+from tadataka.sliding_window_ba import SlidingWindowBA
 from tadataka.vo.base import BaseVO
 
 
@@ -33,42 +39,50 @@ def get_new_viewpoint(viewpoints):
     return viewpoints[-1] + 1
 
 
-def extract_colors(correspondence, point_dict, keypoints, image):
-    point_colors = dict()
-    keypoints = keypoints.astype(np.int64)
-    for point_hash in point_dict.keys():
-        keypoint_index = correspondence[point_hash]
-        x, y = keypoints[keypoint_index]
-        point_colors[point_hash] = image[y, x]
-    return point_colors
+def extract_colors(keypoints, image):
+    xs, ys = keypoints.astype(np.int64).T
+    colors = image[ys, xs]
+    if colors.ndim == 1:
+        # grayscale
+        return np.repeat(colors[:, np.newaxis], 3, axis=1)
+    return colors[:, 0:3]
 
 
-def unique_point_hashes(correspondences):
-    point_hashes = set()
-    for correspondence in correspondences:
-        point_hashes |= set(correspondence.keys())
-    return list(point_hashes)
+def empty_observations():
+    # point ids and keypoint indices
+    return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
 
 
-def get_ba_indices(correspondences, features, point_hashes):
-    assert(len(features) == len(correspondences))
+def empty_keypoints():
+    # keypoint indices
+    return np.empty(0, dtype=np.int64)
+
+
+def unique_observations(point_ids, keypoint_indices):
+    # keep the first observation of each point
+    point_ids, indices = np.unique(point_ids, return_index=True)
+    return point_ids, keypoint_indices[indices]
 
-    viewpoint_indices = []
-    point_indices = []
-    keypoints = []
-    for j, (kd, map_) in enumerate(zip(features, correspondences)):
-        for i, point_hash in enumerate(point_hashes):
-            try:
-                keypoint_index = map_[point_hash]
-            except KeyError:
-                # continue if corresponding keypoint does not exist
-                continue
-            viewpoint_indices.append(j)
-            point_indices.append(i)
-            keypoints.append(kd.keypoints[keypoint_index])
 
-    return (np.array(viewpoint_indices), np.array(point_indices),
-            np.array(keypoints))
+def remove_duplicates(matches):
+    # keep only the first match of each keypoint in the new frame
+    # so that one keypoint has only one corresponding 3D point
+    n = len(matches)
+    labels = np.concatenate([np.full(len(m), i) for i, m in enumerate(matches)])
+    matches = np.vstack(matches).reshape(-1, 2)
+    _, first = np.unique(matches[:, 1], return_index=True)
+    mask = np.zeros(len(matches), dtype=np.bool_)
+    mask[first] = True
+    return [matches[mask & (labels == i)] for i in range(n)]
+
+
+def match_all(matcher, features, features1, executor=None):
+    # matches between features1 and each element of 'features'
+    # are computed in parallel if 'executor' is given.
+    # Results are returned in the same order as 'features'
+    if executor is None:
+        return [matcher(features0, features1) for features0 in features]
+    return list(executor.map(matcher, features, repeat(features1)))
 
 
 def filter_matches(matches, viewpoints, min_matches):
@@ -81,41 +95,130 @@ def filter_matches(matches, viewpoints, min_matches):
     return zip(*Y)
 
 
+def median_parallax(points, pose0, pose1):
+    # median angle between rays from the two camera centers to each point
+    c0, c1 = pose0.inv().t, pose1.inv().t
+    v0, v1 = points - c0, points - c1
+    cos = np.sum(v0 * v1, axis=1) / (np.linalg.norm(v0, axis=1) *
+                                     np.linalg.norm(v1, axis=1))
+    return np.median(np.arccos(np.clip(cos, -1, 1)))
+
+
+class KeyframePolicy(object):
+    def __init__(self, min_tracked_ratio=0.5, max_parallax=np.deg2rad(1.0)):
+        """
+        A new frame becomes a keyframe if less than 'min_tracked_ratio'
+        of the points observed in the newest keyframe are tracked,
+        or the median parallax of tracked points from the newest
+        keyframe exceeds 'max_parallax' (in radians)
+        """
+        self.min_tracked_ratio = min_tracked_ratio
+        self.max_parallax = max_parallax
+
+    def __call__(self, n_tracked, n_reference, parallax):
+        if n_tracked < self.min_tracked_ratio * n_reference:
+            return True
+        return parallax > self.max_parallax
+
 
 class FeatureBasedVO(object):
     def __init__(self,
                  matcher=Matcher(enable_ransac=True,
-                                 enable_homography_filter=True),
-                 window_size=8, min_matches=60):
+                                 enable_homography_filter=True,
+                                 model='essential'),
+                 window_size=8, min_matches=60, incremental_ba=False,
+                 robustifier=None, full_ba_interval=1, executor=None,
+                 guided_matching=False, search_radius=0.02,
+                 max_hamming_ratio=0.25, keyframe_policy=None):
 
         self.__window_size = window_size
 
+        # full BA is run every 'full_ba_interval' frames.
+        # Otherwise the new pose and points are refined separately,
+        # which is much cheaper
+        self.full_ba_interval = full_ba_interval
+
+        # if 'robustifier' is given, BA reweights observations by it
+        # and correspondences judged as outliers are removed
+        self.robustifier = robustifier
+
+        # if 'incremental_ba' is True, the BA problem is kept between frames
+        # and the keyframe leaving the window is marginalized
+        self.window_ba = (SlidingWindowBA(robustifier) if incremental_ba
+                          else None)
+
         self.matcher = matcher
         self.min_matches = min_matches
 
+        # an instance of concurrent.futures.Executor such as
+        # ThreadPoolExecutor or ProcessPoolExecutor.
+        # If given, the new frame is matched with keyframes in parallel
+        self.executor = executor
+
+        # if 'guided_matching' is True, map points are projected onto
+        # the new frame with a pose predicted by the constant velocity
+        # model and matched with keypoints within 'search_radius'
+        # (in the normalized image coordinate)
+        self.guided_matching = guided_matching
+        self.search_radius = search_radius
+        self.max_hamming_ratio = max_hamming_ratio
+
+        # if 'keyframe_policy' is given, a new frame is first tracked
+        # against the local map by guided matching and motion-only
+        # refinement. Triangulation and BA are run only if the policy
+        # decides to make the frame a keyframe.
+        # Otherwise all frames become keyframes
+        self.keyframe_policy = keyframe_policy
+
+        # poses of the two most recent frames for motion prediction
+        self.recent_poses = deque(maxlen=2)
+
         self.active_viewpoints = np.empty((0, 0), np.int64)
-        # manages point -> keypoint correspondences
-        self.correspondences = dict()
 
-        self.point_colors = dict()
-        self.point_dict = dict()
+        # points, colors and point -> keypoint correspondences
+        self.map = MapStore()
         self.features = dict()
         self.poses = dict()
         self.images = dict()
 
+        # every estimated frame is recorded as (keyframe, pose relative to
+        # the keyframe) so that the trajectory follows refined keyframes
+        self.frames = []
+
     def export_points(self):
-        assert(len(self.point_dict) == len(self.point_colors))
-        point_hashes = self.point_dict.keys()
-        point_array = np.array(value_list(self.point_dict, point_hashes))
-        point_colors = np.array(value_list(self.point_colors, point_hashes))
-        point_colors = point_colors.astype(np.float64) / 255.
-        return point_array, point_colors
+        point_colors = self.map.colors.astype(np.float64) / 255.
+        return self.map.points.copy(), point_colors
 
     def export_poses(self):
-        return [self.poses[v] for v in sorted(self.poses.keys())]
+        # poses of all frames including non-keyframes
+        return [dpose * self.poses[v] for v, dpose in self.frames]
 
     def estimate(self, frame):
-        viewpoint = self.add(frame.camera_model, frame.image)
+        keypoints, descriptors = extract_features(frame.image)
+        features1 = Features(frame.camera_model.normalize(keypoints),
+                             descriptors)
+        return self.estimate_(keypoints, features1, frame.image)
+
+    def estimate_(self, keypoints, features1, image):
+        # same as 'estimate' but takes features already extracted.
+        # 'keypoints' are keypoints before normalization
+        tracked = None
+        if self.keyframe_policy is not None:
+            tracked = self.track(features1)
+
+        if tracked is not None:
+            pose1, associated, outliers1, is_keyframe = tracked
+            if not is_keyframe:
+                viewpoint0 = self.active_viewpoints[-1]
+                self.frames.append((viewpoint0,
+                                    pose1 * self.poses[viewpoint0].inv()))
+                self.recent_poses.append(pose1)
+                return pose1.local_to_world()
+            # the keyframe reuses the pose and points tracked above
+            tracked = (pose1, associated, outliers1)
+
+        viewpoint = self.add_keyframe(keypoints, features1, image,
+                                      tracked=tracked)
         if viewpoint < 0:
             return None
 
@@ -140,116 +243,344 @@ class FeatureBasedVO(object):
         pose1 = estimate_pose_change(keypoints0, keypoints1)
         point_array, mask = triangulate(pose0, pose1, keypoints0, keypoints1)
 
-        point_dict, correspondence0, correspondence1 = subscribe(
-            point_array[mask], matches01[mask]
-        )
-        return pose1, point_dict, correspondence0, correspondence1
+        created = [(viewpoint0, matches01[mask], point_array[mask])]
+        return pose1, created, empty_observations(), empty_keypoints()
 
     def estimate_pose_points(self, features1):
+        """
+        Returns
+            pose1 : pose of the new frame
+            created : list of (viewpoint0, matches01, points) where
+                'points' are created by triangulating 'matches01'
+                between viewpoint0 and the new frame
+            associated : (point ids, keypoint indices) of existing
+                points observed in the new frame
+            outliers1 : indices of keypoints in the new frame
+                rejected by PnP
+        """
         if len(self.active_viewpoints) > 1:
             return self.estimate_pose_points_(features1, self.active_viewpoints)
 
         viewpoint0 = self.active_viewpoints[0]
-        pose1, point_dict, correspondence0, correspondence1 = self.init_first_two(
-            features1, viewpoint0
-        )
-        correspondence0s = {viewpoint0: correspondence0}
-        return pose1, point_dict, correspondence0s, correspondence1
+        return self.init_first_two(features1, viewpoint0)
 
     def estimate_pose_points_(self, features1, viewpoints):
+        if self.guided_matching:
+            try:
+                return self.estimate_pose_points_guided(features1, viewpoints)
+            except NotEnoughInliersException as e:
+                # fall back to matching with all keyframes
+                print_error(e)
+
         matches, viewpoints = self.match(features1, viewpoints)
-        pose1 = self.estime_pose(features1, viewpoints, matches)
-        point_dict, correspondence0s, correspondence1 = self.triangulate(
+        pose1, outliers1 = self.estime_pose(features1, viewpoints, matches)
+        # keypoints rejected by PnP are not associated with any point
+        matches = [m[~np.isin(m[:, 1], outliers1)] for m in matches]
+        created, associated = self.triangulate(viewpoints, matches,
+                                               pose1, features1)
+        return pose1, created, associated, outliers1
+
+    def predict_pose(self):
+        # constant velocity model
+        pose0, pose1 = self.recent_poses
+        return (pose1 * pose0.inv()) * pose1
+
+    def point_ids(self, viewpoint):
+        # point id of each keypoint in 'viewpoint', -1 if not triangulated
+        n_keypoints = len(self.features[viewpoint].keypoints)
+        return self.map.keypoint_to_point(viewpoint, n_keypoints)
+
+    def map_descriptors(self, viewpoints):
+        # descriptor of each map point is taken from
+        # the newest keyframe that observes the point
+        vs, point_ids, keypoint_indices = self.map.observations(viewpoints)
+        order = np.argsort(-vs, kind='stable')
+        point_ids, first = np.unique(point_ids[order], return_index=True)
+        vs = vs[order][first]
+        keypoint_indices = keypoint_indices[order][first]
+
+        D = self.features[viewpoints[-1]].descriptors
+        descriptors = np.empty((len(point_ids), D.shape[1]), dtype=D.dtype)
+        for viewpoint in np.unique(vs):
+            mask = vs == viewpoint
+            descriptors[mask] = (self.features[viewpoint]
+                                 .descriptors[keypoint_indices[mask]])
+        return point_ids, descriptors
+
+    def track_local_map(self, features1, viewpoints):
+        """
+        Estimate the pose of the new frame by guided matching.
+        Returns the pose, (point ids, keypoint indices) of map points
+        tracked in the new frame and indices of keypoints rejected by PnP
+        """
+        pose = self.predict_pose()
+        point_ids, descriptors = self.map_descriptors(viewpoints)
+        if len(point_ids) == 0:
+            raise NotEnoughInliersException("No map points to track")
+
+        point_array = self.map.points[point_ids]
+        P = transform(pose.R, pose.t, point_array)
+        front = np.where(P[:, 2] > 0)[0]
+
+        max_distance = int(self.max_hamming_ratio * descriptors.shape[1])
+        matches = match_by_projection(pi(P[front]), descriptors[front],
+                                      features1.keypoints,
+                                      features1.descriptors,
+                                      self.search_radius, max_distance)
+        if len(matches) < self.min_matches:
+            raise NotEnoughInliersException(
+                "Not enough map points tracked by guided matching"
+            )
+
+        indices0, indices1 = front[matches[:, 0]], matches[:, 1]
+        pose1, inliers = solve_pnp(point_array[indices0],
+                                   features1.keypoints[indices1])
+        return (pose1, (point_ids[indices0[inliers]], indices1[inliers]),
+                indices1[~inliers])
+
+    def estimate_pose_points_guided(self, features1, viewpoints):
+        pose1, tracked, outliers1 = self.track_local_map(features1,
+                                                         viewpoints)
+        # new points are created only from the newest keyframe
+        return self.triangulate_tracked(features1, viewpoints[-1:],
+                                        pose1, tracked, outliers1)
+
+    def triangulate_tracked(self, features1, viewpoints, pose1, tracked,
+                            outliers1):
+        """
+        Create new points from keypoints that are not tracked.
+        'tracked' is (point ids, keypoint indices) of map points
+        already tracked in the new frame at 'pose1'.
+        Only keypoints neither tracked nor rejected by PnP ('outliers1')
+        are matched with 'viewpoints'
+        """
+        tracked_ids, tracked_indices1 = tracked
+
+        untracked = np.setdiff1d(np.arange(len(features1.keypoints)),
+                                 np.concatenate((tracked_indices1, outliers1)))
+        matches = self.match_(Features(features1.keypoints[untracked],
+                                       features1.descriptors[untracked]),
+                              viewpoints)
+
+        # exclude map points already associated
+        for i, (viewpoint0, matches01) in enumerate(zip(viewpoints, matches)):
+            matches01 = np.column_stack((matches01[:, 0],
+                                         untracked[matches01[:, 1]]))
+            point_ids0 = get_point_hashes(self.point_ids(viewpoint0),
+                                          matches01[:, 0])
+            matches[i] = matches01[~np.isin(point_ids0, tracked_ids)]
+
+        created, (point_ids, keypoint_indices) = self.triangulate(
             viewpoints, matches, pose1, features1
         )
-        return pose1, point_dict, correspondence0s, correspondence1
+        associated = (np.concatenate((tracked_ids, point_ids)),
+                      np.concatenate((tracked_indices1, keypoint_indices)))
+        return pose1, created, associated, outliers1
+
+    def track(self, features1):
+        """
+        Estimate the pose of the new frame against the local map.
+        Returns None if tracking fails. Otherwise returns the pose,
+        (point ids, keypoint indices) of tracked map points, indices of
+        keypoints rejected by PnP and whether the frame should become
+        a keyframe
+        """
+        if self.n_active_keyframes < 2:
+            return None
+
+        try:
+            pose1, (point_ids, keypoint_indices), outliers1 =\
+                self.track_local_map(features1, self.active_viewpoints)
+        except NotEnoughInliersException as e:
+            print_error(e)
+            return None
+
+        point_array = self.map.points[point_ids]
+        keypoints1 = features1.keypoints[keypoint_indices]
+        n_tracked = len(point_ids)
+        [pose1], _ = run_motion_only_ba(
+            np.zeros(n_tracked, dtype=np.int64), np.arange(n_tracked),
+            [pose1], point_array, keypoints1
+        )
+
+        viewpoint0 = self.active_viewpoints[-1]
+        _, reference, _ = self.map.observations([viewpoint0])
+        n_tracked0 = np.sum(np.isin(point_ids, reference))
+        parallax = median_parallax(point_array, self.poses[viewpoint0], pose1)
+        is_keyframe = self.keyframe_policy(n_tracked0, len(reference),
+                                           parallax)
+        return pose1, (point_ids, keypoint_indices), outliers1, is_keyframe
 
     def add(self, camera_model, image, min_keypoints=8):
         keypoints, descriptors = extract_features(image)
-
+        features1 = Features(camera_model.normalize(keypoints),
+                             descriptors)
+        return self.add_keyframe(keypoints, features1, image, min_keypoints)
+
+    def add_keyframe(self, keypoints, features1, image, min_keypoints=8,
+                     tracked=None):
+        # 'keypoints' are keypoints before normalization.
+        # 'tracked' is the pose, (point ids, keypoint indices) of map
+        # points tracked by 'track' and keypoints rejected by PnP.
+        # The pose is not estimated again if it is given
         if len(keypoints) <= min_keypoints:
             print_error("Keypoints not sufficient")
             return -1
 
         viewpoint1 = get_new_viewpoint(self.active_viewpoints)
 
-        features1 = Features(camera_model.normalize(keypoints),
-                             descriptors)
-
         if len(self.active_viewpoints) == 0:
-            correspondence1 = init_correspondence()
             pose1 = Pose.identity()
-            point_dict = dict()
+            created, associated = [], empty_observations()
+            outliers1 = empty_keypoints()
+        elif tracked is not None:
+            pose1, created, associated, outliers1 = self.triangulate_tracked(
+                features1, self.active_viewpoints, *tracked
+            )
         else:
             try:
-                pose1, point_dict, correspondence0s, correspondence1 =\
+                pose1, created, associated, outliers1 =\
                     self.estimate_pose_points(features1)
             except NotEnoughInliersException as e:
                 print_error(e)
                 return -1
 
-            for viewpoint0, m0 in correspondence0s.items():
-                self.correspondences[viewpoint0] = merge_correspondences(
-                    self.correspondences[viewpoint0], m0
-                )
-
         self.poses[viewpoint1] = pose1
-        self.correspondences[viewpoint1] = correspondence1
+        self.features[viewpoint1] = features1
 
-        # use distorted (not normalized) keypoints
-        point_colors = extract_colors(correspondence1,
-                                      point_dict, keypoints, image)
-        self.point_colors.update(point_colors)
-        self.point_dict.update(point_dict)
+        for viewpoint0, matches01, point_array in created:
+            # use distorted (not normalized) keypoints
+            colors = extract_colors(keypoints[matches01[:, 1]], image)
+            point_ids = self.map.add_points(point_array, colors)
+            self.add_observations(viewpoint0, point_ids, matches01[:, 0])
+            self.add_observations(viewpoint1, point_ids, matches01[:, 1])
+        self.add_observations(viewpoint1, *associated)
+        # keypoints rejected by PnP are not used to create points later
+        self.map.reject_keypoints(viewpoint1, outliers1)
 
-        self.features[viewpoint1] = features1
         self.images[viewpoint1] = image
         self.active_viewpoints = np.append(self.active_viewpoints, viewpoint1)
 
         if len(self.active_viewpoints) >= 3:
-            self.run_ba(self.active_viewpoints)
+            if viewpoint1 % self.full_ba_interval == 0:
+                self.run_ba(self.active_viewpoints)
+            else:
+                self.refine(self.active_viewpoints)
+
+        self.frames.append((viewpoint1, Pose.identity()))
+        self.recent_poses.append(self.poses[viewpoint1])
         return viewpoint1
 
+    def add_observations(self, viewpoint, point_ids, keypoint_indices):
+        self.map.add_observations(viewpoint, point_ids, keypoint_indices)
+
+        if self.window_ba is None:
+            return
+
+        keypoints = self.features[viewpoint].keypoints[keypoint_indices]
+        self.window_ba.add_observations(viewpoint, point_ids, keypoints)
+
     def run_ba(self, viewpoints):
-        correspondences = value_list(self.correspondences, viewpoints)
+        if self.window_ba is not None:
+            self.run_window_ba()
+            return
+
+        (poses, point_ids, point_array,
+         viewpoint_indices, point_indices, keypoints) = self.ba_problem(viewpoints)
+
+        if self.robustifier is None:
+            poses, point_array = try_run_ba(viewpoint_indices, point_indices,
+                                            poses, point_array, keypoints)
+        else:
+            poses, point_array, inliers = try_run_robust_ba(
+                viewpoint_indices, point_indices,
+                poses, point_array, keypoints, self.robustifier
+            )
+            self.map.remove_observations(
+                viewpoints[viewpoint_indices[~inliers]],
+                point_ids[point_indices[~inliers]]
+            )
+
+        self.update_map(viewpoints, poses, point_ids, point_array)
+
+    def ba_problem(self, viewpoints):
+        viewpoints = np.asarray(viewpoints)
         poses = value_list(self.poses, viewpoints)
-        features = value_list(self.features, viewpoints)
 
-        point_hashes = unique_point_hashes(correspondences)
+        vs, point_ids, keypoint_indices = self.map.observations(viewpoints)
+        point_ids, point_indices = np.unique(point_ids, return_inverse=True)
+        viewpoint_indices = np.searchsorted(viewpoints, vs)
 
-        point_array = np.array(value_list(self.point_dict, point_hashes))
+        # sort observations by viewpoint, then by point
+        order = np.lexsort((point_indices, viewpoint_indices))
+        viewpoint_indices = viewpoint_indices[order]
+        point_indices = point_indices[order]
+        keypoint_indices = keypoint_indices[order]
 
-        viewpoint_indices, point_indices, keypoints = get_ba_indices(
-            correspondences, features, point_hashes
-        )
+        keypoints = np.empty((len(keypoint_indices), 2))
+        for j, viewpoint in enumerate(viewpoints):
+            mask = viewpoint_indices == j
+            keypoints[mask] = (self.features[viewpoint]
+                               .keypoints[keypoint_indices[mask]])
 
-        poses, point_array = try_run_ba(viewpoint_indices, point_indices,
-                                        poses, point_array, keypoints)
+        return (poses, point_ids, self.map.points[point_ids],
+                viewpoint_indices, point_indices, keypoints)
 
-        for point_hash, point in zip(point_hashes, point_array):
-            self.point_dict[point_hash] = point
+    def update_map(self, viewpoints, poses, point_ids, point_array):
+        self.map.points[point_ids] = point_array
 
         for viewpoint, pose in zip(viewpoints, poses):
             self.poses[viewpoint] = pose
 
+    def refine(self, viewpoints):
+        # motion-only refinement of the newest pose followed by
+        # structure-only refinement of the points
+        (poses, point_ids, point_array,
+         viewpoint_indices, point_indices, keypoints) = self.ba_problem(viewpoints)
+
+        mask = viewpoint_indices == len(viewpoints) - 1
+        [pose1], _ = run_motion_only_ba(
+            np.zeros(np.sum(mask), dtype=np.int64), point_indices[mask],
+            poses[-1:], point_array, keypoints[mask]
+        )
+        poses[-1] = pose1
+
+        poses, point_array = run_structure_only_ba(
+            viewpoint_indices, point_indices,
+            poses, point_array, keypoints
+        )
+        self.update_map(viewpoints, poses, point_ids, point_array)
+
+    def run_window_ba(self):
+        poses, point_ids, point_array, outliers = self.window_ba.optimize(
+            self.poses, self.map.points
+        )
+        self.poses.update(poses)
+        self.map.points[point_ids] = point_array
+
+        # 'outliers' is a pair of viewpoints and point ids
+        self.map.remove_observations(*outliers)
+
     def estime_pose(self, features1, viewpoints, matches):
         assert(len(viewpoints) == len(matches))
-        correspondences = value_list(self.correspondences, viewpoints)
 
-        point_hashes = []
+        point_ids = []
         keypoint_indices = []
         for viewpoint, matches01 in zip(viewpoints, matches):
-            correspondences = self.correspondences[viewpoint]
-            hashes_, indices_ = get_indices(correspondences, matches01)
-            point_hashes += hashes_
-            keypoint_indices += indices_
-        assert(len(point_hashes) == len(keypoint_indices))
-        point_array = np.array(value_list(self.point_dict, point_hashes))
-        return solve_pnp(point_array, features1.keypoints[keypoint_indices])
+            point_ids0, indices1 = get_indices(self.point_ids(viewpoint),
+                                               matches01)
+            point_ids.append(point_ids0)
+            keypoint_indices.append(indices1)
+        point_ids = np.concatenate(point_ids)
+        keypoint_indices = np.concatenate(keypoint_indices)
+        pose1, inliers = solve_pnp(self.map.points[point_ids],
+                                   features1.keypoints[keypoint_indices])
+        # returns the pose and indices of outlier keypoints
+        return pose1, keypoint_indices[~inliers]
 
     def match_(self, features1, viewpoints):
         features = value_list(self.features, viewpoints)
-        return [self.matcher(features0, features1) for features0 in features]
+        return match_all(self.matcher, features, features1, self.executor)
 
     def match(self, features1, viewpoints):
         matches = self.match_(features1, viewpoints)
@@ -259,15 +590,19 @@ class FeatureBasedVO(object):
     def triangulate_(self, matches01, viewpoint0, pose1, features1):
         pose0 = self.poses[viewpoint0]
         features0 = self.features[viewpoint0]
-        correspondence0 = self.correspondences[viewpoint0]
+
+        correspondence0 = self.point_ids(viewpoint0)
+
+        # outliers are neither associated nor triangulated again
+        matches01 = matches01[~is_rejected(correspondence0, matches01[:, 0])]
 
         mask = is_triangulated(correspondence0, matches01[:, 0])
         triangulated, untriangulated = matches01[mask], matches01[~mask]
 
-        copied1 = associate_triangulated(correspondence0, triangulated)
+        associated = associate_triangulated(correspondence0, triangulated)
 
         if len(untriangulated) == 0:
-            return dict(), init_correspondence(), init_correspondence()
+            return None, associated
 
         # if point doesn't exist, create it by triangulation
         point_array, mask = triangulate(
@@ -275,47 +610,34 @@ class FeatureBasedVO(object):
             features0.keypoints[untriangulated[:, 0]],
             features1.keypoints[untriangulated[:, 1]]
         )
-
-        point_dict, created0, created1 = subscribe(point_array[mask],
-                                                   untriangulated[mask])
-
-        correspondence1 = merge_correspondences(copied1, created1)
-
-        return point_dict, created0, correspondence1
+        return (viewpoint0, untriangulated[mask], point_array[mask]), associated
 
     def triangulate(self, viewpoints, matches, pose1, features1):
-        # filter keypoints so that one keypoint has only one corresponding
-        # 3D point
-        used_indices1 = set()
-        def filter_unused(matches01):
-            matches01_ = []
-            for index0, index1 in matches01:
-                if index1 not in used_indices1:
-                    matches01_.append([index0, index1])
-                    used_indices1.add(index1)
-            return np.array(matches01_)
-
-        point_dict = dict()
-        correspondence0s = dict()
-        correspondence1 = init_correspondence()
-        for viewpoint0, matches01 in zip(viewpoints, matches):
-            matches01 = filter_unused(matches01)
-
+        created = []
+        point_ids, keypoint_indices = empty_observations()
+        for viewpoint0, matches01 in zip(viewpoints, remove_duplicates(matches)):
             if len(matches01) == 0:
                 continue
 
-            point_dict_, correspondence0_, correspondence1_ = self.triangulate_(
+            created_, (point_ids_, keypoint_indices_) = self.triangulate_(
                 matches01, viewpoint0, pose1, features1
             )
-            correspondence0s[viewpoint0] = correspondence0_
-            correspondence1 = merge_correspondences(correspondence1, correspondence1_)
-            point_dict.update(point_dict_)
+            if created_ is not None:
+                created.append(created_)
+            point_ids = np.concatenate((point_ids, point_ids_))
+            keypoint_indices = np.concatenate((keypoint_indices,
+                                               keypoint_indices_))
 
-        return point_dict, correspondence0s, correspondence1
+        # a point can be matched from multiple keyframes
+        return created, unique_observations(point_ids, keypoint_indices)
 
     def try_remove(self):
         if self.n_active_keyframes <= self.__window_size:
             return False
 
+        if self.window_ba is not None:
+            self.window_ba.marginalize(self.active_viewpoints[0],
+                                       self.poses, self.map.points)
+
         self.active_viewpoints = np.delete(self.active_viewpoints, 0)
         return True
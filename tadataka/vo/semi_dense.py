@@ -130,8 +130,17 @@ class DepthEstimator(object):
         self.image_key = image_key
         self.image_ref = image_ref
         self.pose_key_to_ref = pose_key_to_ref
+        self.triangulation = DepthFromTriangulation(Pose.identity(),
+                                                    pose_key_to_ref)
+
+    def search(self, u_key, min_depth, max_depth, prior_depth_key):
+        """
+        Search the epipolar line in the reference image for the
+        correspondence of 'u_key'.
+        Returns the pair of normalized coordinates in the key and
+        reference frames
+        """
 
-    def __call__(self, u_key, min_depth, max_depth, prior_depth_key):
         R = self.pose_key_to_ref.rotation.as_matrix()
         t = self.pose_key_to_ref.t
 
@@ -184,6 +193,29 @@ class DepthEstimator(object):
         argmin = search_intensities(intensities_ref, intensities_key,
                                     calc_error)
 
-        f = DepthFromTriangulation(Pose.identity(), self.pose_key_to_ref)
-        key_depth, ref_depth = f(xs_key[2], xs_ref[argmin])
+        return xs_key[2], xs_ref[argmin]
+
+    def __call__(self, u_key, min_depth, max_depth, prior_depth_key):
+        x_key, x_ref = self.search(u_key, min_depth, max_depth,
+                                   prior_depth_key)
+        key_depth, ref_depth = self.triangulation(x_key, x_ref)
         return key_depth
+
+    def estimate(self, us_key, min_depth, max_depth, prior_depths_key):
+        """
+        Depths of pixels 'us_key' in the key frame.
+        The epipolar search is done per pixel and the matched pairs are
+        triangulated at once. Depths are NaN if the search fails or
+        the rays are nearly parallel
+        """
+
+        xs_key = np.full((len(us_key), 2), np.nan)
+        xs_ref = np.full((len(us_key), 2), np.nan)
+        for i, (u_key, prior_depth_key) in enumerate(zip(us_key,
+                                                         prior_depths_key)):
+            try:
+                xs_key[i], xs_ref[i] = self.search(u_key, min_depth, max_depth,
+                                                   prior_depth_key)
+            except InsufficientCoordinatesError:
+                continue
+        return self.triangulation(xs_key, xs_ref)[:, 0]
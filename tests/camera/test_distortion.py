@@ -49,7 +49,7 @@ def test_normalizer():
 
         # poses should be able to be estimated without a camera matrix
         keypoints_ = normalizer.normalize(keypoints_true)
-        pose = solve_pnp(points, keypoints_)
+        pose, _ = solve_pnp(points, keypoints_)
 
         P = transform(pose.R, pose.t, points)
         keypoints_pred = projection.compute(P)
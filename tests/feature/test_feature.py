@@ -1,5 +1,5 @@
 import numpy as np
-from tadataka.feature.feature import extract_keypoints
+from tadataka.feature.feature import extract_keypoints, Features, Matcher
 
 
 def test_extract_keypoints():
@@ -15,3 +15,16 @@ def test_extract_keypoints():
     mask_x = np.logical_and(0 <= xs, xs < width)
     mask_y = np.logical_and(0 <= ys, ys < height)
     assert(np.logical_and(mask_x, mask_y).all())
+
+
+def test_matcher_zero_motion():
+    # the essential matrix is degenerate if the camera does not move
+    # but matching must not fail
+    np.random.seed(3939)
+    keypoints = np.random.uniform(-1, 1, (100, 2))
+    descriptors = np.random.randint(0, 2, (100, 256)).astype(np.bool_)
+    features = Features(keypoints, descriptors)
+
+    matcher = Matcher(model='essential')
+    matches = matcher(features, features)
+    assert(matches.shape[1] == 2)
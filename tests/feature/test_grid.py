@@ -0,0 +1,61 @@
+import numpy as np
+
+from tadataka.feature.grid import KeypointGrid
+
+
+def test_query_radius():
+    np.random.seed(3939)
+
+    keypoints = np.random.uniform(-1, 1, (500, 2))
+    # includes points outside the grid
+    points = np.random.uniform(-1.5, 1.5, (100, 2))
+    radius = 0.1
+
+    grid = KeypointGrid(keypoints, cell_size=0.05)
+    indices, offsets = grid.query_radius(points, radius)
+    assert(len(offsets) == len(points) + 1)
+
+    for i, p in enumerate(points):
+        d = np.linalg.norm(keypoints - p, axis=1)
+        expected = np.where(d <= radius)[0]
+        assert(set(indices[offsets[i]:offsets[i+1]]) == set(expected))
+
+    # no keypoints
+    grid = KeypointGrid(np.empty((0, 2)), cell_size=0.05)
+    indices, offsets = grid.query_radius(points, radius)
+    assert(len(indices) == 0)
+
+
+def test_image_grid():
+    keypoints = np.array([
+    #     x    y
+        [0.5, 0.5],    # cell (0, 0)
+        [1.5, 0.2],    # cell (0, 1)
+        [1.8, 0.9],    # cell (0, 1)
+        [2.5, 1.5],    # cell (1, 2)
+        [-0.1, 0.5],   # out of the image
+        [1.0, 2.0]     # out of the image
+    ])
+    grid = KeypointGrid(keypoints, cell_size=1.0, image_shape=(2, 3))
+    assert(grid.grid_shape == (2, 3))
+    assert(np.array_equal(grid.counts, [1, 2, 0, 0, 0, 1]))
+    assert(np.array_equal(grid.cell_indices(keypoints), [0, 1, 1, 5, -1, -1]))
+
+    points = np.array([[0.1, 0.1], [2.9, 0.1], [2.0, 1.0], [5.0, 5.0]])
+    assert(np.array_equal(grid.occupied(points), [True, False, True, False]))
+
+
+def test_cap():
+    keypoints = np.array([
+        [0.1, 0.1], [0.2, 0.2], [0.3, 0.3],  # cell 0
+        [1.1, 0.1], [1.2, 0.2],              # cell 1
+        [0.1, 1.1]                           # cell 2
+    ])
+    grid = KeypointGrid(keypoints, cell_size=1.0, image_shape=(2, 2))
+
+    assert(np.array_equal(grid.cap(1), [0, 3, 5]))
+    assert(np.array_equal(grid.cap(2), [0, 1, 3, 4, 5]))
+
+    scores = np.array([1, 3, 2, 0, 5, 1])
+    assert(np.array_equal(grid.cap(1, scores), [1, 4, 5]))
+    assert(np.array_equal(grid.cap(2, scores), [1, 2, 3, 4, 5]))
@@ -0,0 +1,30 @@
+from numpy.testing import assert_array_equal
+import numpy as np
+
+from tadataka.feature.guided import match_by_projection
+
+
+def test_match_by_projection():
+    np.random.seed(3939)
+
+    n_keypoints, n_bits = 400, 256
+    keypoints1 = np.random.uniform(-1, 1, (n_keypoints, 2))
+    descriptors1 = np.random.randint(0, 2, (n_keypoints, n_bits))
+    descriptors1 = descriptors1.astype(np.bool_)
+
+    # map points correspond to keypoints1[indices]
+    indices = np.random.choice(n_keypoints, 100, replace=False)
+    projected = keypoints1[indices] + np.random.uniform(-0.005, 0.005,
+                                                        (100, 2))
+    map_descriptors = np.copy(descriptors1[indices])
+    map_descriptors[:, 0:10] = ~map_descriptors[:, 0:10]  # noise
+
+    # the last 10 map points are projected far from true keypoints
+    projected[90:] = projected[90:] + 0.5
+
+    matches = match_by_projection(projected, map_descriptors,
+                                  keypoints1, descriptors1,
+                                  radius=0.02, max_distance=64)
+
+    assert_array_equal(matches[:, 0], np.arange(90))
+    assert_array_equal(matches[:, 1], indices[:90])
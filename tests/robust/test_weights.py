@@ -1,7 +1,8 @@
 import unittest
 import numpy as np
 from numpy.testing import assert_array_equal, assert_equal
-from tadataka.robust.weights import tukey, median_absolute_deviation
+from tadataka.robust.weights import (
+    compute_weights_cauchy, tukey, median_absolute_deviation)
 
 
 def test_tukey():
@@ -13,3 +14,9 @@ def test_tukey():
 def test_median_absolute_deviation():
     x = np.array([1, 1, 2, 2, 4, 6, 9])
     assert_equal(median_absolute_deviation(x), 1)
+
+
+def test_compute_weights_cauchy():
+    x = np.array([0, 1, -2])
+    GT = np.array([1, 1 / (1 + 1 / 4), 1 / (1 + 1)])
+    assert_array_equal(compute_weights_cauchy(x, c=2), GT)
@@ -0,0 +1,62 @@
+from numpy.testing import assert_array_almost_equal
+import numpy as np
+
+from tadataka import so3_codegen
+from tadataka.batch_projection import (
+    exp_so3, jacobians, point_jacobian, pose_jacobian, projection)
+from tests.utils import unit_uniform
+
+
+def random_poses_points(n):
+    poses = np.hstack((np.pi * unit_uniform((n, 3)), unit_uniform((n, 3))))
+    points = 5 * unit_uniform((n, 3))
+    points[:, 2] = points[:, 2] + 10  # keep points in front of cameras
+    return poses, points
+
+
+def test_exp_so3():
+    np.random.seed(3939)
+
+    omegas = np.vstack((
+        np.zeros(3),
+        [1e-12, 0, 0],
+        [np.pi / 2, 0, 0],
+        np.pi * unit_uniform((10, 3))
+    ))
+
+    R = exp_so3(omegas)
+    for i, omega in enumerate(omegas):
+        assert_array_almost_equal(R[i], so3_codegen.exp_so3(omega))
+
+
+def test_projection():
+    np.random.seed(3939)
+
+    poses, points = random_poses_points(20)
+
+    x_pred = projection(poses, points)
+
+    assert(x_pred.shape == (20, 2))
+    for k, (pose, point) in enumerate(zip(poses, points)):
+        assert_array_almost_equal(x_pred[k],
+                                  so3_codegen.projection(pose, point))
+
+
+def test_jacobians():
+    np.random.seed(3939)
+
+    poses, points = random_poses_points(20)
+    # rotations close to identity are computed in a different branch
+    poses[0, 0:3] = 0
+    poses[1, 0:3] = 1e-12
+
+    A, B = jacobians(poses, points)
+
+    assert(A.shape == (20, 2, 6))
+    assert(B.shape == (20, 2, 3))
+    for k, (pose, point) in enumerate(zip(poses, points)):
+        assert_array_almost_equal(A[k], so3_codegen.pose_jacobian(pose, point))
+        assert_array_almost_equal(B[k], so3_codegen.point_jacobian(pose, point))
+
+    assert_array_almost_equal(pose_jacobian(poses, points), A)
+    assert_array_almost_equal(point_jacobian(poses, points), B)
@@ -0,0 +1,77 @@
+from numpy.testing import assert_array_equal
+import numpy as np
+
+from tadataka.correspondence import (
+    REJECTED, associate_triangulated, dense_correspondence, get_indices,
+    get_point_hashes, init_correspondence, is_rejected, is_triangulated,
+    point_exists)
+
+
+# point 'a' <-> keypoint 3, point 'b' <-> keypoint 0
+bidict_correspondence = init_correspondence({'a': 3, 'b': 0})
+# point 7 <-> keypoint 3, point 2 <-> keypoint 0
+array_correspondence = dense_correspondence([7, 2], [3, 0], 5)
+
+matches01 = np.array([
+    [0, 4],
+    [1, 1],
+    [3, 2]
+])
+
+
+def test_dense_correspondence():
+    assert_array_equal(array_correspondence, [2, -1, -1, 7, -1])
+
+
+def test_point_exists():
+    for correspondence in [bidict_correspondence, array_correspondence]:
+        assert(point_exists(correspondence, 3))
+        assert(not point_exists(correspondence, 1))
+
+
+def test_is_triangulated():
+    indices = np.array([0, 1, 2, 3, 4])
+    expected = [True, False, False, True, False]
+    assert_array_equal(is_triangulated(bidict_correspondence, indices),
+                       expected)
+    assert_array_equal(is_triangulated(array_correspondence, indices),
+                       expected)
+
+
+def test_is_rejected():
+    correspondence = np.array([2, REJECTED, -1, 7, REJECTED])
+    indices = np.array([0, 1, 2, 3, 4])
+    assert_array_equal(is_rejected(correspondence, indices),
+                       [False, True, False, False, True])
+    # rejected keypoints are not triangulated
+    assert_array_equal(is_triangulated(correspondence, indices),
+                       [True, False, False, True, False])
+    assert_array_equal(is_rejected(bidict_correspondence, indices), False)
+
+
+def test_get_point_hashes():
+    assert(get_point_hashes(bidict_correspondence, [3, 0]) == ['a', 'b'])
+    assert_array_equal(get_point_hashes(array_correspondence, [3, 0]),
+                       [7, 2])
+
+
+def test_get_indices():
+    point_hashes, indices1 = get_indices(bidict_correspondence, matches01)
+    assert(point_hashes == ['b', 'a'])
+    assert(indices1 == [4, 2])
+
+    point_ids, indices1 = get_indices(array_correspondence, matches01)
+    assert_array_equal(point_ids, [2, 7])
+    assert_array_equal(indices1, [4, 2])
+
+
+def test_associate_triangulated():
+    triangulated = matches01[[0, 2]]
+    correspondence1 = associate_triangulated(bidict_correspondence,
+                                             triangulated)
+    assert(correspondence1 == init_correspondence({'b': 4, 'a': 2}))
+
+    point_ids, indices1 = associate_triangulated(array_correspondence,
+                                                 triangulated)
+    assert_array_equal(point_ids, [2, 7])
+    assert_array_equal(indices1, [4, 2])
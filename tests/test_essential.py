@@ -0,0 +1,103 @@
+from numpy.testing import assert_array_almost_equal
+import numpy as np
+from scipy.spatial.transform import Rotation
+
+from tadataka.essential import five_point, ransac_essential
+from tadataka.fundamental import sampson_distances
+from tadataka.matrix import to_homogeneous
+from tadataka.rigid_transform import transform
+
+
+R_true = Rotation.from_rotvec([0.05, -0.1, 0.02]).as_matrix()
+t_true = np.array([1.0, 0.2, 0.1])
+
+
+def skew(v):
+    return np.array([
+        [0, -v[2], v[1]],
+        [v[2], 0, -v[0]],
+        [-v[1], v[0], 0]
+    ])
+
+
+def projection(P):
+    return P[:, 0:2] / P[:, [2]]
+
+
+def generate_keypoints(n_points):
+    points = np.random.uniform(-1, 1, (n_points, 3))
+    points[:, 2] = points[:, 2] + 5
+    return projection(points), projection(transform(R_true, t_true, points))
+
+
+def test_five_point():
+    np.random.seed(3939)
+    keypoints0, keypoints1 = generate_keypoints(10)
+    X0 = np.stack((keypoints0[0:5], keypoints0[5:10]))
+    X1 = np.stack((keypoints1[0:5], keypoints1[5:10]))
+
+    E = five_point(X0, X1)
+    assert(1 <= len(E) <= 20)
+
+    # all solutions are essential matrices
+    # that have two equal singular values and one zero
+    S = np.linalg.svd(E, compute_uv=False)
+    assert_array_almost_equal(S[:, 0], S[:, 1])
+    assert_array_almost_equal(S[:, 2], np.zeros(len(E)))
+
+    # the true essential matrix is included in the solutions
+    E_true = skew(t_true).dot(R_true)
+    E_true = E_true / np.linalg.norm(E_true)
+    errors = np.minimum(np.abs(E - E_true).max(axis=(1, 2)),
+                        np.abs(E + E_true).max(axis=(1, 2)))
+    assert(np.min(errors) < 1e-6)
+
+
+def test_ransac_essential():
+    np.random.seed(3939)
+    keypoints0, keypoints1 = generate_keypoints(200)
+    outliers = np.zeros(200, dtype=np.bool_)
+    outliers[::5] = True
+    keypoints1[outliers] = np.random.uniform(-0.5, 0.5,
+                                             (np.sum(outliers), 2))
+
+    E, inliers = ransac_essential(keypoints0, keypoints1)
+    assert(np.all(inliers[~outliers]))
+    assert(np.sum(inliers[outliers]) <= 2)
+
+    x0, x1 = to_homogeneous(keypoints0), to_homogeneous(keypoints1)
+    assert_array_almost_equal(np.sum(x1[~outliers].dot(E) * x0[~outliers],
+                                     axis=1),
+                              np.zeros(np.sum(~outliers)))
+    assert(np.all(sampson_distances(E[np.newaxis],
+                                    keypoints0[~outliers],
+                                    keypoints1[~outliers]) < 1e-6))
+
+
+def test_ransac_essential_not_enough_data():
+    keypoints = np.random.uniform(-1, 1, (4, 2))
+    E, inliers = ransac_essential(keypoints, keypoints)
+    assert(E is None)
+    assert(not np.any(inliers))
+
+
+def test_ransac_essential_degenerate():
+    # degenerate sample sets have to be skipped
+    # instead of failing the whole batch
+
+    # zero motion
+    for seed in range(20):
+        np.random.seed(seed)
+        keypoints = np.random.uniform(-1, 1, (100, 2))
+        E, inliers = ransac_essential(keypoints, keypoints)
+        assert(E is None or E.shape == (3, 3))
+        assert(inliers.shape == (100,))
+
+    # coincident points
+    X = np.zeros((3, 5, 2))
+    assert(five_point(X, X).shape == (0, 3, 3))
+
+    keypoints = np.zeros((50, 2))
+    E, inliers = ransac_essential(keypoints, keypoints)
+    assert(E is None)
+    assert(not np.any(inliers))
@@ -0,0 +1,77 @@
+from numpy.testing import assert_array_almost_equal
+import numpy as np
+from scipy.spatial.transform import Rotation
+
+from tadataka.fundamental import (
+    eight_point, estimate_fundamental, ransac_fundamental,
+    sampson_distances, seven_point)
+from tadataka.rigid_transform import transform
+
+
+K = np.array([
+    [300, 0, 320],
+    [0, 300, 240],
+    [0, 0, 1]
+], dtype=np.float64)
+
+
+def projection(P):
+    x = np.dot(P, K.T)
+    return x[:, 0:2] / x[:, [2]]
+
+
+def generate_keypoints(n_points):
+    points = np.random.uniform(-1, 1, (n_points, 3))
+    points[:, 2] = points[:, 2] + 5
+    R = Rotation.from_rotvec([0.05, -0.1, 0.02]).as_matrix()
+    t = np.array([1.0, 0.2, 0.1])
+    return projection(points), projection(transform(R, t, points))
+
+
+def test_eight_point():
+    np.random.seed(3939)
+    keypoints0, keypoints1 = generate_keypoints(50)
+
+    F = estimate_fundamental(keypoints0, keypoints1)
+    assert(np.isclose(np.linalg.norm(F), 1))
+    assert(np.isclose(np.linalg.det(F), 0))
+    assert(np.all(sampson_distances(F[np.newaxis], keypoints0, keypoints1)
+                  < 1e-6))
+
+    # batched estimation must be same as the individual estimation
+    X0 = np.stack((keypoints0[0:8], keypoints0[8:16]))
+    X1 = np.stack((keypoints1[0:8], keypoints1[8:16]))
+    F = eight_point(X0, X1)
+    for i in range(2):
+        assert_array_almost_equal(F[i], estimate_fundamental(X0[i], X1[i]))
+
+
+def test_seven_point():
+    np.random.seed(3939)
+    keypoints0, keypoints1 = generate_keypoints(14)
+    X0 = np.stack((keypoints0[0:7], keypoints0[7:14]))
+    X1 = np.stack((keypoints1[0:7], keypoints1[7:14]))
+
+    F = seven_point(X0, X1)
+    assert(1 <= len(F) <= 6)
+    assert_array_almost_equal(np.linalg.det(F), np.zeros(len(F)))
+
+    # at least one of the solutions satisfies the epipolar constraint
+    # for all points
+    d = sampson_distances(F, keypoints0, keypoints1)
+    assert(np.min(np.max(d, axis=1)) < 1e-6)
+
+
+def test_ransac_fundamental():
+    np.random.seed(3939)
+    keypoints0, keypoints1 = generate_keypoints(200)
+    outliers = np.zeros(200, dtype=np.bool_)
+    outliers[::5] = True
+    keypoints1[outliers] = np.random.uniform(0, 640, (np.sum(outliers), 2))
+
+    for method in ['8point', '7point']:
+        F, inliers = ransac_fundamental(keypoints0, keypoints1,
+                                        method=method)
+        # outliers lying on the epipolar line by chance can be inliers
+        assert(np.all(inliers[~outliers]))
+        assert(np.sum(inliers[outliers]) <= 2)
@@ -3,8 +3,12 @@ import numpy as np
 from numpy.linalg import norm
 
 from tadataka.local_ba import (
-    LocalBundleAdjustment, Projection,
-    calc_error, calc_errors, calc_relative_error)
+    LocalBundleAdjustment, Projection, block_lm,
+    calc_error, calc_errors, calc_relative_error, update_weights,
+    params_to_poses, poses_to_params,
+    run_motion_only_ba, run_structure_only_ba)
+from tadataka.robust.weights import (
+    compute_weights_cauchy, compute_weights_huber, tukey)
 from tests.utils import unit_uniform
 
 
@@ -81,6 +85,40 @@ def test_calc_errors():
     assert_array_equal(calc_errors(x_true, x_pred), [1, 1, 10])
     assert(calc_error(x_true, x_pred) == 12 / 3)
 
+    weights = np.array([
+        [[2, 0],
+         [0, 1]],
+        [[1, 0],
+         [0, 3]],
+        [[1, 1],
+         [1, 2]]
+    ])
+    # [-3, 1] * [[1, 1], [1, 2]] * [-3, 1] = 5
+    assert_array_equal(calc_errors(x_true, x_pred, weights), [2, 3, 5])
+    assert(calc_error(x_true, x_pred, weights) == 10 / 3)
+
+
+def test_update_weights():
+    x_pred = np.zeros((5, 2))
+    x_true = np.array([
+        [1, 0],
+        [0, -1],
+        [-1, 0],
+        [0, 1],
+        [30, 40]
+    ])
+
+    # median norm of residuals is 1
+    # standardized residuals are |x| / (1 / sqrt(2 log 2))
+    weights = update_weights(lambda z: z, x_true, x_pred)
+    assert(weights.shape == (5, 2, 2))
+    assert_array_almost_equal(weights[:, 0, 0],
+                              np.array([1, 1, 1, 1, 50]) * 1.1774,
+                              decimal=3)
+    assert_array_equal(weights[:, 0, 1], 0)
+    assert_array_equal(weights[:, 1, 0], 0)
+    assert_array_equal(weights[:, 0, 0], weights[:, 1, 1])
+
 
 def test_local_bundle_adjustment():
 
@@ -146,3 +184,178 @@ def test_local_bundle_adjustment():
     run(omegas_true, translations_true, points_noisy)
     # if all parameters are noisy
     run(omegas_noisy, translations_noisy, points_noisy)
+
+
+def test_jacobians_computed_once_per_iteration():
+    np.random.seed(3939)
+
+    n_viewpoints, n_points = 4, 5
+    viewpoint_indices, point_indices = np.where(
+        np.ones((n_viewpoints, n_points), dtype=bool)
+    )
+
+    projection = Projection(viewpoint_indices, point_indices)
+
+    omegas_true = np.pi * unit_uniform((n_viewpoints, 3))
+    translations_true = unit_uniform((n_viewpoints, 3))
+    points_true = unit_uniform((n_points, 3))
+    points_true[:, 2] = points_true[:, 2] + 5
+
+    keypoints_true = projection.compute(
+        to_poses(omegas_true, translations_true), points_true
+    )
+
+    local_ba = LocalBundleAdjustment(viewpoint_indices, point_indices,
+                                     keypoints_true)
+
+    n_calls = {"jacobians": 0, "updates": 0}
+
+    jacobians = local_ba.projection.jacobians
+    def count_jacobians(*args):
+        n_calls["jacobians"] += 1
+        return jacobians(*args)
+    local_ba.projection.jacobians = count_jacobians
+
+    calc_update = local_ba.calc_update
+    def count_updates(*args):
+        n_calls["updates"] += 1
+        return calc_update(*args)
+    local_ba.calc_update = count_updates
+
+    max_iter = 5
+    local_ba.compute(add_noise(omegas_true, 0.01),
+                     add_noise(translations_true, 0.01),
+                     add_noise(points_true, 0.01),
+                     # huge damping factor forces retries
+                     initial_mu=1e4, nu=10.0, max_iter=max_iter,
+                     absolute_error_threshold=0.0,
+                     relative_error_threshold=0.0)
+
+    # jacobians are evaluated once per iteration
+    # even though the damping factor is changed several times
+    assert(n_calls["jacobians"] == max_iter)
+    assert(n_calls["updates"] > n_calls["jacobians"])
+
+
+def test_robust_local_bundle_adjustment():
+    np.random.seed(3939)
+
+    n_viewpoints, n_points = 5, 20
+    viewpoint_indices, point_indices = np.where(
+        np.ones((n_viewpoints, n_points), dtype=bool)
+    )
+
+    projection = Projection(viewpoint_indices, point_indices)
+
+    omegas_true = 0.1 * unit_uniform((n_viewpoints, 3))
+    translations_true = unit_uniform((n_viewpoints, 3))
+    points_true = unit_uniform((n_points, 3))
+    points_true[:, 2] = points_true[:, 2] + 5
+
+    keypoints_true = projection.compute(
+        to_poses(omegas_true, translations_true), points_true
+    )
+    keypoints_true = add_noise(keypoints_true, 1e-3)
+
+    outliers = np.array([3, 17, 40, 62, 88])
+    keypoints_true[outliers] += 0.5 * unit_uniform((len(outliers), 2))
+
+    omegas_noisy = add_noise(omegas_true, 0.01)
+    translations_noisy = add_noise(translations_true, 0.01)
+    points_noisy = add_noise(points_true, 0.01)
+
+    def point_error(robustifier):
+        local_ba = LocalBundleAdjustment(viewpoint_indices, point_indices,
+                                         keypoints_true, robustifier)
+        _, _, points_pred = local_ba.compute(
+            omegas_noisy, translations_noisy, points_noisy, max_iter=20,
+            absolute_error_threshold=0.0, relative_error_threshold=1e-6
+        )
+        return relative_error(points_true, points_pred), local_ba.inliers
+
+    error, inliers = point_error(None)
+    # all observations are regarded as inliers if robustifier is not given
+    assert(np.all(inliers))
+
+    for robustifier in [compute_weights_huber, compute_weights_cauchy,
+                        lambda z: tukey(z, beta=4.6851)]:
+        robust_error, inliers = point_error(robustifier)
+        assert(robust_error < error)
+        assert(not np.any(inliers[outliers]))
+        # most of correct observations are kept
+        mask = np.ones(len(inliers), dtype=bool)
+        mask[outliers] = False
+        assert(np.mean(inliers[mask]) > 0.8)
+
+
+def generate_problem(n_viewpoints, n_points):
+    omegas = 0.1 * unit_uniform((n_viewpoints, 3))
+    translations = unit_uniform((n_viewpoints, 3))
+    translations[:, 2] = translations[:, 2] + 6
+    points = 2 * unit_uniform((n_points, 3))
+
+    viewpoint_indices, point_indices = np.where(
+        np.ones((n_viewpoints, n_points), dtype=np.bool_)
+    )
+    params = to_poses(omegas, translations)
+    keypoints = Projection(viewpoint_indices, point_indices).compute(
+        params, points
+    )
+    return viewpoint_indices, point_indices, params, points, keypoints
+
+
+def test_block_lm_retries_rejected_steps():
+    # the first gauss-newton step from p = 10 overshoots because
+    # arctan is flat there. the step has to be retried with larger damping
+    def compute(params):
+        return np.arctan(params)
+
+    def jacobian(params):
+        J = np.zeros((params.shape[0], 2, 2))
+        J[:, [0, 1], [0, 1]] = 1 / (1 + params * params)
+        return J
+
+    params = np.array([[10.0, -10.0]])
+    params = block_lm(compute, jacobian, params, np.array([0]),
+                      np.zeros((1, 2)), max_iter=50, initial_mu=1e-6)
+    assert_array_almost_equal(params, np.zeros((1, 2)))
+
+
+def test_run_structure_only_ba():
+    np.random.seed(3939)
+
+    viewpoint_indices, point_indices, params, points_true, keypoints_true =\
+        generate_problem(n_viewpoints=4, n_points=100)
+    poses = params_to_poses(params)
+
+    points_noisy = add_noise(points_true, 0.05)
+    poses_, points = run_structure_only_ba(viewpoint_indices, point_indices,
+                                           poses, points_noisy,
+                                           keypoints_true)
+    assert(poses_ is poses)  # poses are not changed
+    assert_array_almost_equal(points, points_true)
+
+
+def test_run_motion_only_ba():
+    np.random.seed(3939)
+
+    viewpoint_indices, point_indices, params_true, points, keypoints_true =\
+        generate_problem(n_viewpoints=4, n_points=100)
+
+    params_noisy = np.copy(params_true)
+    params_noisy[:, 0:3] = add_noise(params_true[:, 0:3], 0.01)
+    params_noisy[:, 3:6] = add_noise(params_true[:, 3:6], 0.1)
+
+    poses, points_ = run_motion_only_ba(viewpoint_indices, point_indices,
+                                        params_to_poses(params_noisy), points,
+                                        keypoints_true)
+    assert(points_ is points)  # points are not changed
+    assert_array_almost_equal(poses_to_params(poses), params_true)
+
+    # refine only the last pose
+    mask = viewpoint_indices == 3
+    poses, _ = run_motion_only_ba(np.zeros(np.sum(mask), dtype=np.int64),
+                                  point_indices[mask],
+                                  params_to_poses(params_noisy[[3]]), points,
+                                  keypoints_true[mask])
+    assert_array_almost_equal(poses_to_params(poses)[0], params_true[3])
@@ -0,0 +1,59 @@
+from numpy.testing import assert_array_equal
+import numpy as np
+
+from tadataka.correspondence import REJECTED
+from tadataka.map_store import GrowableArray, MapStore
+
+
+def test_growable_array():
+    array = GrowableArray((2,), np.int64, capacity=2)
+    assert_array_equal(array.append([[0, 1], [2, 3]]), [0, 1])
+    # exceeds the capacity
+    assert_array_equal(array.append([[4, 5], [6, 7], [8, 9]]), [2, 3, 4])
+    assert(len(array) == 5)
+    assert_array_equal(array.array, np.arange(10).reshape(5, 2))
+
+    array.compress(np.array([True, False, True, False, True]))
+    assert_array_equal(array.array, [[0, 1], [4, 5], [8, 9]])
+    assert_array_equal(array.append([[10, 11]]), [3])
+
+
+def test_map_store():
+    store = MapStore()
+    point_ids = store.add_points(np.random.uniform(-1, 1, (4, 3)),
+                                 np.zeros((4, 3)))
+    assert_array_equal(point_ids, [0, 1, 2, 3])
+    assert(store.n_points == 4)
+
+    store.add_observations(0, [0, 1, 2], [5, 3, 1])
+    store.add_observations(1, [1, 2, 3], [0, 2, 4])
+    # cached correspondence has to be updated by following operations
+    assert_array_equal(store.keypoint_to_point(2, 3), [-1, -1, -1])
+    store.add_observations(2, [0, 3], [1, 0])
+    assert_array_equal(store.keypoint_to_point(2, 3), [3, 0, -1])
+    assert(store.n_observations == 8)
+
+    viewpoints, point_ids, keypoint_indices = store.observations([0, 2])
+    assert_array_equal(viewpoints, [0, 0, 0, 2, 2])
+    assert_array_equal(point_ids, [0, 1, 2, 0, 3])
+    assert_array_equal(keypoint_indices, [5, 3, 1, 1, 0])
+
+    assert_array_equal(store.keypoint_to_point(0, 6), [-1, 2, -1, 1, -1, 0])
+    assert_array_equal(store.keypoint_to_point(1, 5), [1, -1, 2, -1, 3])
+
+    # keypoints of removed observations are rejected
+    store.remove_observations([0, 1, 2], [1, 3, 3])
+    assert(store.n_observations == 5)
+    R = REJECTED
+    assert_array_equal(store.keypoint_to_point(0, 6), [-1, 2, -1, R, -1, 0])
+    assert_array_equal(store.keypoint_to_point(1, 5), [1, -1, 2, -1, R])
+    assert_array_equal(store.keypoint_to_point(2, 3), [R, 0, -1])
+
+    # rejection is kept when the correspondence is created again
+    store.reject_keypoints(3, [1])
+    assert_array_equal(store.keypoint_to_point(3, 3), [-1, R, -1])
+    assert_array_equal(store.keypoint_to_point(2, 4), [R, 0, -1, -1])
+
+    # points are writable through the view
+    store.points[[1, 2]] = 0
+    assert_array_equal(store.points[1:3], np.zeros((2, 3)))
@@ -33,9 +33,10 @@ from skimage._shared.testing import assert_equal
 from skimage import data
 from skimage import transform as tf
 from skimage.color import rgb2gray
-from tadataka.match import match_descriptors
+from tadataka.match import match_descriptors, pack_descriptors, popcount64
 from skimage.feature import BRIEF, corner_peaks, corner_harris
 from skimage._shared import testing
+from sklearn.metrics import pairwise_distances
 
 
 def test_binary_descriptors_unequal_descriptor_sizes_error():
@@ -125,3 +126,101 @@ def test_binary_descriptors_rotation_crosscheck_true():
                              28, 27, 22, 23, 29, 30, 31, 32, 35, 33, 34, 36])
     assert_equal(matches[:, 0], exp_matches1)
     assert_equal(matches[:, 1], exp_matches2)
+
+
+def test_pack_descriptors():
+    descriptors = np.random.randint(0, 2, (4, 100)).astype(np.bool_)
+    packed = pack_descriptors(descriptors)
+    assert(packed.shape == (4, 2))
+    assert(packed.dtype == np.uint64)
+
+    for d, p in zip(descriptors, packed):
+        assert_equal(sum(popcount64(w) for w in p), np.sum(d))
+
+
+def test_binary_descriptors_same_as_dense():
+    # matching on packed binary descriptors must give the same result
+    # as the euclidean distance on the float representation
+    np.random.seed(3939)
+    descs1 = np.random.randint(0, 2, (60, 256)).astype(np.bool_)
+    descs2 = np.random.randint(0, 2, (80, 256)).astype(np.bool_)
+    descs2[:30] = descs1[:30]
+
+    for cross_check in [True, False]:
+        for max_ratio in [1.0, 0.9, 0.6]:
+            assert_equal(
+                match_descriptors(descs1, descs2, cross_check, max_ratio),
+                match_descriptors(descs1.astype(np.float64),
+                                  descs2.astype(np.float64),
+                                  cross_check, max_ratio)
+            )
+
+
+def test_match_descriptors_tiled():
+    # results must not depend on the tile size
+    np.random.seed(3939)
+    descs1 = np.random.randint(0, 4, (50, 16)).astype(np.float64)
+    descs2 = np.random.randint(0, 4, (70, 16)).astype(np.float64)
+    descs2[:20] = descs1[:20]
+
+    for cross_check in [True, False]:
+        for max_ratio in [1.0, 0.8]:
+            expected = match_descriptors(descs1, descs2, cross_check,
+                                         max_ratio, tile_size=1024)
+            for tile_size in [1, 7, 32]:
+                assert_equal(
+                    match_descriptors(descs1, descs2, cross_check,
+                                      max_ratio, tile_size=tile_size),
+                    expected
+                )
+
+
+def match_descriptors_dense(descriptors1, descriptors2,
+                            cross_check=True, max_ratio=1.0):
+    # the original implementation that builds the whole distance matrix
+    distances = pairwise_distances(descriptors1, descriptors2)
+
+    indices1 = np.arange(descriptors1.shape[0])
+    indices2 = np.argmin(distances, axis=1)
+
+    if cross_check:
+        matches1 = np.argmin(distances, axis=0)
+        mask = indices1 == matches1[indices2]
+        indices1 = indices1[mask]
+        indices2 = indices2[mask]
+
+    if max_ratio < 1.0:
+        distances = distances.astype(np.float64)
+        best_distances = distances[indices1, indices2]
+        distances[indices1, indices2] = np.inf
+        second_best_indices2 = np.argmin(distances[indices1], axis=1)
+        second_best_distances = distances[indices1, second_best_indices2]
+        second_best_distances[second_best_distances == 0] \
+            = np.finfo(np.double).eps
+        ratio = best_distances / second_best_distances
+        mask = ratio < max_ratio
+        indices1 = indices1[mask]
+        indices2 = indices2[mask]
+
+    return np.column_stack((indices1, indices2))
+
+
+def test_match_descriptors_same_as_dense():
+    # small integer descriptors produce many ties in distances
+    np.random.seed(3939)
+    for n1, n2 in [(50, 70), (70, 50), (1, 30), (30, 2)]:
+        descs1 = np.random.randint(0, 3, (n1, 8)).astype(np.float64)
+        descs2 = np.random.randint(0, 3, (n2, 8)).astype(np.float64)
+        n = min(n1, n2) // 2
+        descs2[:n] = descs1[:n]
+
+        for cross_check in [True, False]:
+            for max_ratio in [1.0, 0.9, 0.5]:
+                expected = match_descriptors_dense(descs1, descs2,
+                                                   cross_check, max_ratio)
+                for tile_size in [1, 7, 1024]:
+                    assert_equal(
+                        match_descriptors(descs1, descs2, cross_check,
+                                          max_ratio, tile_size=tile_size),
+                        expected
+                    )
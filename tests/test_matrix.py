@@ -34,6 +34,27 @@ def test_solve_linear():
     assert_array_almost_equal(np.dot(A, x), np.zeros(3))
 
 
+def test_solve_linear_batch():
+    np.random.seed(3939)
+
+    # under-determined systems have exact solutions
+    A = np.random.uniform(-1, 1, (10, 3, 8))
+    X = solve_linear(A)
+    assert_equal(X.shape, (10, 8))
+    assert_array_almost_equal(np.linalg.norm(X, axis=1), np.ones(10))
+    assert_array_almost_equal(np.einsum('nij,nj->ni', A, X),
+                              np.zeros((10, 3)))
+
+    # over-determined systems are solved in the least squares sense,
+    # which gives the singular vector of the smallest singular value
+    A = np.random.uniform(-1, 1, (10, 12, 4))
+    X = solve_linear(A)
+    assert_equal(X.shape, (10, 4))
+    for A_, x in zip(A, X):
+        w, V = np.linalg.eigh(np.dot(A_.T, A_))
+        assert(np.isclose(abs(np.dot(x, V[:, 0])), 1))
+
+
 def test_to_homogeneous():
     assert_array_equal(
         to_homogeneous(np.array([[2, 3], [4, 5]])),
@@ -0,0 +1,155 @@
+from numpy.testing import assert_array_almost_equal
+import numpy as np
+from scipy.spatial.transform import Rotation
+
+from tadataka.pnp import (align, epnp, ransac_pnp, refine_pose,
+                          reprojection_errors)
+from tadataka.rigid_transform import transform
+
+
+def project(R, t, points):
+    P = transform(R, t, points)
+    return P[:, 0:2] / P[:, [2]]
+
+
+def generate_observations(n_points, rotvec, t):
+    points = np.random.uniform(-1, 1, (n_points, 3))
+    points[:, 2] = points[:, 2] + 4
+    R = Rotation.from_rotvec(rotvec).as_matrix()
+    return R, points, project(R, t, points)
+
+
+def test_align():
+    np.random.seed(3939)
+    R_true = Rotation.from_rotvec([[0.3, -1.2, 2.0],
+                                   [-2.0, 0.1, 0.4]]).as_matrix()
+    t_true = np.array([[1.0, -2.0, 0.5], [0.0, 3.0, -1.0]])
+    P = np.random.uniform(-1, 1, (2, 10, 3))
+    Q = np.einsum('sij,snj->sni', R_true, P) + t_true[:, np.newaxis]
+    R, t = align(P, Q)
+    assert_array_almost_equal(R, R_true)
+    assert_array_almost_equal(t, t_true)
+
+
+def test_epnp():
+    np.random.seed(3939)
+    rotvecs = np.array([[0.1, -0.3, 0.2], [-0.2, 0.4, 0.1]])
+    ts = np.array([[0.3, -0.2, 0.5], [-0.5, 0.1, 1.0]])
+
+    P, X, R_true = [], [], []
+    for rotvec, t in zip(rotvecs, ts):
+        R, points, keypoints = generate_observations(6, rotvec, t)
+        P.append(points)
+        X.append(keypoints)
+        R_true.append(R)
+    P, X = np.array(P), np.array(X)
+
+    R, t = epnp(P, X)
+    assert(R.shape == (6, 3, 3) and t.shape == (6, 3))
+
+    # candidates are ordered as [N=1 of all sets, N=2 of all sets, ...]
+    # and N=1 is exact for noise-free data
+    assert_array_almost_equal(R[0:2], np.array(R_true))
+    assert_array_almost_equal(t[0:2], ts)
+
+
+def test_reprojection_errors():
+    R = np.identity(3)[np.newaxis]
+    t = np.zeros((1, 3))
+    points = np.array([[1.0, 2.0, 2.0], [0.0, 0.0, -1.0]])
+    keypoints = np.array([[0.5, 0.0], [0.0, 0.0]])
+    errors = reprojection_errors(R, t, points, keypoints)
+    # the 2nd point is behind the camera
+    assert_array_almost_equal(errors, [[1.0, np.inf]])
+
+
+def test_ransac_pnp():
+    np.random.seed(3939)
+    t_true = np.array([0.3, -0.2, 0.5])
+    R_true, points, keypoints = generate_observations(
+        200, [0.1, -0.3, 0.2], t_true
+    )
+    keypoints += np.random.normal(0, 1e-3, keypoints.shape)
+    outliers = np.zeros(200, dtype=np.bool_)
+    outliers[::4] = True
+    keypoints[outliers] = np.random.uniform(-0.5, 0.5, (np.sum(outliers), 2))
+
+    R, t, inliers = ransac_pnp(points, keypoints, residual_threshold=5e-3)
+    assert_array_almost_equal(R, R_true, decimal=2)
+    assert_array_almost_equal(t, t_true, decimal=2)
+    assert(np.all(inliers[~outliers]))
+    assert(np.sum(inliers[outliers]) <= 2)
+
+
+def test_refine_pose_in_front():
+    # Gauss-Newton steps must not move points behind the camera
+    # even if the keypoints are too noisy to fit
+    for seed in [16, 38, 51, 65, 66]:
+        np.random.seed(seed)
+        points = np.random.uniform(-1, 1, (10, 3))
+        points[:, 2] = np.random.uniform(0.05, 0.5, 10)
+        keypoints = (points[:, 0:2] / points[:, [2]] +
+                     np.random.normal(0, 0.5, (10, 2)))
+        R = Rotation.from_rotvec(np.random.normal(0, 0.1, 3)).as_matrix()
+        t = np.random.normal(0, 0.02, 3)
+        assert(np.all(transform(R, t, points)[:, 2] > 0))
+
+        R, t = refine_pose(R, t, points, keypoints)
+        assert(np.all(transform(R, t, points)[:, 2] > 0))
+
+
+def test_ransac_pnp_not_enough_data():
+    points = np.random.uniform(-1, 1, (5, 3))
+    keypoints = np.random.uniform(-1, 1, (5, 2))
+    R, t, inliers = ransac_pnp(points, keypoints, residual_threshold=1e-3)
+    assert(R is None and t is None)
+    assert(not np.any(inliers))
+
+
+def test_epnp_degenerate():
+    np.random.seed(3939)
+    t_true = np.array([0.3, -0.2, 0.5])
+    R_true, points, keypoints = generate_observations(
+        6, [0.1, -0.3, 0.2], t_true
+    )
+    planar = np.copy(points)
+    planar[:, 2] = 4
+    P = np.array([points, planar, np.repeat(points[0:2], 3, axis=0)])
+    X = np.array([keypoints, project(R_true, t_true, planar),
+                  np.repeat(keypoints[0:2], 3, axis=0)])
+
+    # 3 candidates from the general set, 2 from the planar set and
+    # nothing from the set of 2 repeated points
+    R, t = epnp(P, X)
+    assert(R.shape == (5, 3, 3) and t.shape == (5, 3))
+    # N=1 is exact for the planar set as well
+    assert_array_almost_equal(R[3], R_true)
+    assert_array_almost_equal(t[3], t_true)
+
+
+def test_ransac_pnp_planar():
+    np.random.seed(3939)
+    t_true = np.array([0.3, -0.2, 0.5])
+    R_true = Rotation.from_rotvec([0.1, -0.3, 0.2]).as_matrix()
+    points = np.random.uniform(-1, 1, (100, 3))
+    points[:, 2] = 5
+    keypoints = project(R_true, t_true, points)
+
+    R, t, inliers = ransac_pnp(points, keypoints, residual_threshold=1e-3)
+    assert_array_almost_equal(R, R_true)
+    assert_array_almost_equal(t, t_true)
+    assert(np.all(inliers))
+
+
+def test_ransac_pnp_repeated_points():
+    np.random.seed(3939)
+    t_true = np.array([0.3, -0.2, 0.5])
+    R_true, points, _ = generate_observations(100, [0.1, -0.3, 0.2], t_true)
+    # 40 points are at the same position
+    points[60:] = points[0]
+    keypoints = project(R_true, t_true, points)
+
+    R, t, inliers = ransac_pnp(points, keypoints, residual_threshold=1e-3)
+    assert_array_almost_equal(R, R_true)
+    assert_array_almost_equal(t, t_true)
+    assert(np.all(inliers))
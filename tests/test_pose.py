@@ -48,7 +48,8 @@ def test_solve_pnp():
         P = transform(exp_so3(omega_true), t_true, points)
         keypoints_true = projection.compute(P)
 
-        pose = solve_pnp(points, keypoints_true)
+        pose, inliers = solve_pnp(points, keypoints_true)
+        assert(np.all(inliers))
 
         P = transform(pose.R, pose.t, points)
         keypoints_pred = projection.compute(P)
@@ -187,7 +188,7 @@ def test_estimate_pose_change():
 
     def case2():
         # 5 points are behind cameras
-        t_true = np.array([0, 0, 0])
+        t_true = np.array([5, 0, 0])
         P0 = X_true
         P1 = transform(R_true, t_true, X_true)
         keypoints0 = projection.compute(P0)
@@ -197,8 +198,19 @@ def test_estimate_pose_change():
         with pytest.warns(RuntimeWarning, match=message):
             pose_change_from_stereo(keypoints0, keypoints1)
 
+    def case3():
+        # pure rotation is degenerate for the essential matrix
+        P0 = X_true
+        P1 = transform(R_true, np.zeros(3), X_true)
+        keypoints0 = projection.compute(P0)
+        keypoints1 = projection.compute(P1)
+
+        with pytest.raises(NotEnoughInliersException):
+            pose_change_from_stereo(keypoints0, keypoints1)
+
     case1()
     case2()
+    case3()
 
 
 def test_calc_relative_pose():
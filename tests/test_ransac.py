@@ -0,0 +1,43 @@
+from numpy.testing import assert_array_equal
+import numpy as np
+
+from tadataka.ransac import n_required_trials, random_samples, ransac
+
+
+def test_n_required_trials():
+    # log(1 - 0.99) / log(1 - 0.5^2)
+    assert(np.isclose(n_required_trials(0.5, 2, 0.99), 16.00784))
+    assert(n_required_trials(1.0, 2, 0.99) == 0)
+    assert(n_required_trials(0.0, 2, 0.99) == np.inf)
+
+
+def test_random_samples():
+    samples = random_samples(np.random.RandomState(3939), 10, 50, 4)
+    assert(samples.shape == (50, 4))
+    for s in samples:
+        assert(len(np.unique(s)) == 4)
+
+
+def test_ransac():
+    # fit a line y = a * x + b
+    np.random.seed(3939)
+    xs = np.random.uniform(-1, 1, 100)
+    ys = 2 * xs + 1
+    outliers = np.zeros(100, dtype=np.bool_)
+    outliers[::4] = True
+    ys[outliers] = np.random.uniform(-5, 5, np.sum(outliers))
+
+    def estimate(samples):
+        x0, x1 = xs[samples[:, 0]], xs[samples[:, 1]]
+        y0, y1 = ys[samples[:, 0]], ys[samples[:, 1]]
+        a = (y1 - y0) / (x1 - x0)
+        return np.column_stack((a, y0 - a * x0))
+
+    def residuals(models):
+        a, b = models[:, [0]], models[:, [1]]
+        return np.abs(a * xs + b - ys)
+
+    model, inliers = ransac(estimate, residuals, 100, 2,
+                            residual_threshold=1e-6)
+    assert(np.allclose(model, [2, 1]))
+    assert_array_equal(inliers, ~outliers)
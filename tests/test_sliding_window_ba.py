@@ -0,0 +1,238 @@
+from numpy.testing import assert_array_almost_equal, assert_array_equal
+import numpy as np
+
+from sparseba import SBA
+
+from tadataka.local_ba import Projection, calc_error
+from tadataka.sliding_window_ba import (
+    PosePrior, PriorBundleAdjustment, SlidingWindowBA,
+    calc_normal_blocks, eliminate_points, params_to_poses, poses_to_params)
+from tests.utils import unit_uniform
+
+
+def generate_scene(n_viewpoints, n_points):
+    poses = np.hstack((0.1 * unit_uniform((n_viewpoints, 3)),
+                       unit_uniform((n_viewpoints, 3))))
+    points = unit_uniform((n_points, 3))
+    points[:, 2] = points[:, 2] + 5
+    return poses, points
+
+
+def test_calc_update():
+    # the update has to be same as sparseba's if the prior is empty
+    np.random.seed(3939)
+
+    n_viewpoints, n_points = 4, 8
+    poses_true, points_true = generate_scene(n_viewpoints, n_points)
+
+    mask = np.ones((n_viewpoints, n_points), dtype=bool)
+    mask[0, 1] = mask[1, 3] = mask[3, 5] = False
+    viewpoint_indices, point_indices = np.where(mask)
+
+    projection = Projection(viewpoint_indices, point_indices)
+    x_true = projection.compute(poses_true, points_true)
+
+    poses = poses_true + 0.01 * unit_uniform(poses_true.shape)
+    points = points_true + 0.01 * unit_uniform(points_true.shape)
+    x_pred = projection.compute(poses, points)
+
+    mu = 0.1
+    ba = PriorBundleAdjustment(viewpoint_indices, point_indices, x_true,
+                               np.arange(n_viewpoints), PosePrior.empty())
+    A, B = ba.linearize(poses, points)
+    dposes_pred, dpoints_pred = ba.calc_update(x_pred, A, B, mu)
+
+    sba = SBA(viewpoint_indices, point_indices)
+    dposes_true, dpoints_true = sba.compute(x_true, x_pred, A, B, mu=mu)
+
+    assert_array_almost_equal(dposes_pred, dposes_true)
+    assert_array_almost_equal(dpoints_pred, dpoints_true)
+
+
+def test_eliminate_points():
+    # the reduced camera system has to be same as the one computed
+    # with dense (n_points, n_viewpoints) blocks
+    np.random.seed(3939)
+
+    n_viewpoints, n_points = 4, 6
+    mask = np.random.uniform(size=(n_viewpoints, n_points)) < 0.7
+    mask[:, 0] = True
+    viewpoint_indices, point_indices = np.where(mask)
+    n_visible = len(viewpoint_indices)
+
+    A = unit_uniform((n_visible, 2, 6))
+    B = unit_uniform((n_visible, 2, 3))
+    epsilon = unit_uniform((n_visible, 2))
+    U, V, W, epsilon_a, epsilon_b = calc_normal_blocks(
+        viewpoint_indices, point_indices, n_viewpoints, n_points,
+        A, B, epsilon
+    )
+    V_inv = np.linalg.inv(V + np.identity(3))
+    S, e = eliminate_points(viewpoint_indices, point_indices,
+                            U, V_inv, W, epsilon_a, epsilon_b)
+
+    WD = np.zeros((n_points, n_viewpoints, 6, 3))
+    WD[point_indices, viewpoint_indices] = W
+    S_true = np.zeros((6 * n_viewpoints, 6 * n_viewpoints))
+    e_true = epsilon_a.flatten()
+    for j in range(n_viewpoints):
+        S_true[6*j:6*j+6, 6*j:6*j+6] += U[j]
+        for k in range(n_viewpoints):
+            for i in range(n_points):
+                Y = np.dot(WD[i, j], V_inv[i])
+                S_true[6*j:6*j+6, 6*k:6*k+6] -= np.dot(Y, WD[i, k].T)
+        for i in range(n_points):
+            Y = np.dot(WD[i, j], V_inv[i])
+            e_true[6*j:6*j+6] -= np.dot(Y, epsilon_b[i])
+
+    assert_array_almost_equal(S, S_true)
+    assert_array_almost_equal(e, e_true)
+
+
+def test_pose_prior():
+    np.random.seed(3939)
+
+    viewpoints = np.array([2, 5])
+    poses0 = unit_uniform((2, 6))
+    A = unit_uniform((12, 12))
+    H = np.dot(A, A.T)
+    b = unit_uniform(12)
+    prior = PosePrior(viewpoints, poses0, H, b)
+
+    # prior is expanded to the coordinate of [1, 2, 4, 5]
+    poses = np.vstack((unit_uniform((1, 6)), poses0[0],
+                       unit_uniform((1, 6)), poses0[1] + 0.1))
+    H_, rhs = prior.expand([1, 2, 4, 5], poses)
+
+    assert(H_.shape == (24, 24))
+    assert_array_equal(H_[6:12, 6:12], H[0:6, 0:6])
+    assert_array_equal(H_[18:24, 6:12], H[6:12, 0:6])
+    assert_array_equal(H_[0:6], 0)
+    assert_array_equal(H_[12:18], 0)
+
+    d = np.concatenate((np.zeros(6), 0.1 * np.ones(6)))
+    assert_array_almost_equal(rhs[6:12], (b - H.dot(d))[0:6])
+    assert_array_almost_equal(rhs[18:24], (b - H.dot(d))[6:12])
+
+    c = b.dot(np.linalg.solve(H, b))
+    assert(np.isclose(prior.energy([1, 2, 4, 5], poses),
+                      d.dot(H).dot(d) - 2 * b.dot(d) + c))
+
+    # the energy is zero at the minimum
+    poses[[1, 3]] = poses0 + np.linalg.solve(H, b).reshape(2, 6)
+    assert(np.isclose(prior.energy([1, 2, 4, 5], poses), 0))
+
+
+def test_prior_bundle_adjustment():
+    # the prior must not make the error negative and stop the
+    # optimization before convergence
+    np.random.seed(3939)
+
+    n_viewpoints, n_points = 3, 10
+    poses_true, points_true = generate_scene(n_viewpoints, n_points)
+
+    viewpoint_indices, point_indices = np.where(
+        np.ones((n_viewpoints, n_points), dtype=bool)
+    )
+    projection = Projection(viewpoint_indices, point_indices)
+    x_true = projection.compute(poses_true, points_true)
+
+    # the minimum of the prior is at the true poses
+    # but far from the linearization point
+    H = 1e2 * np.identity(12)
+    offset = unit_uniform(12)
+    prior = PosePrior([1, 2], poses_true[1:] + offset.reshape(2, 6),
+                      H, -H.dot(offset))
+
+    poses = poses_true + 0.01 * unit_uniform(poses_true.shape)
+    points = points_true + 0.01 * unit_uniform(points_true.shape)
+    ba = PriorBundleAdjustment(viewpoint_indices, point_indices, x_true,
+                               [0, 1, 2], prior)
+    rotvecs, translations, points_pred = ba.compute(
+        poses[:, 0:3], poses[:, 3:6], points,
+        absolute_error_threshold=1e-12, relative_error_threshold=1e-6
+    )
+
+    _, error = ba.evaluate(np.hstack((rotvecs, translations)), points_pred)
+    assert(0 <= error < 1e-12)
+    assert_array_almost_equal(translations, poses_true[:, 3:6], decimal=4)
+
+
+def add_observations(window_ba, keypoints, point_ids, viewpoints):
+    for viewpoint in viewpoints:
+        ids = [i for i in point_ids if (viewpoint, i) in keypoints]
+        window_ba.add_observations(
+            viewpoint, ids, [keypoints[(viewpoint, i)] for i in ids]
+        )
+
+
+def test_sliding_window_ba():
+    np.random.seed(3939)
+
+    n_viewpoints, n_points = 5, 40
+    poses_true, points_true = generate_scene(n_viewpoints, n_points)
+
+    # point i is observed from observers[i % 5]
+    observers = [[0, 1], [0, 2], [0, 1, 2, 3], [1, 2, 3, 4], [2, 3, 4]]
+    keypoints = dict()
+    for i in range(n_points):
+        for j in observers[i % 5]:
+            P = Projection(np.array([0]), np.array([0]))
+            x = P.compute(poses_true[[j]], points_true[[i]])[0]
+            keypoints[(j, i)] = x
+
+    points = points_true + 0.01 * unit_uniform(points_true.shape)
+    poses = dict(zip(range(n_viewpoints),
+                     params_to_poses(poses_true +
+                                     0.01 * unit_uniform(poses_true.shape))))
+
+    window_ba = SlidingWindowBA()
+    add_observations(window_ba, keypoints, range(n_points),
+                     range(n_viewpoints))
+    assert(window_ba.viewpoints == list(range(n_viewpoints)))
+
+    def error(poses, points):
+        viewpoint_indices, point_indices, x_true, point_ids =\
+            window_ba.get_indices(window_ba.viewpoints)
+        params = poses_to_params([poses[v] for v in window_ba.viewpoints])
+        P = Projection(viewpoint_indices, point_indices)
+        return calc_error(x_true, P.compute(params, points[point_ids]))
+
+    E0 = error(poses, points)
+    new_poses, point_ids, new_points, (viewpoints, _) = window_ba.optimize(
+        poses, points, max_iter=10
+    )
+    assert(len(viewpoints) == 0)
+    assert_array_equal(point_ids, np.arange(n_points))
+    poses.update(new_poses)
+    points[point_ids] = new_points
+    E1 = error(poses, points)
+    assert(E1 < E0)
+
+    # points observed from [0, 1] and [0, 2] have only one observation
+    # after removing viewpoint 0 so they are marginalized together
+    window_ba.marginalize(0, poses, points)
+
+    assert(window_ba.viewpoints == [1, 2, 3, 4])
+    assert_array_equal(window_ba.prior.viewpoints, [1, 2])
+    assert(window_ba.prior.H.shape == (12, 12))
+    assert_array_almost_equal(window_ba.prior.H, window_ba.prior.H.T)
+    # prior is positive semi-definite
+    assert(np.all(np.linalg.eigvalsh(window_ba.prior.H) > -1e-8))
+
+    for i in range(n_points):
+        if i % 5 in {0, 1}:
+            assert(len(window_ba.observers(i)) == 0)
+    for i in range(2, n_points, 5):
+        # observation from viewpoint 0 is dropped
+        assert(window_ba.observers(i) == {1, 2, 3})
+
+    # optimization still works with the prior
+    new_poses, point_ids, _, _ = window_ba.optimize(poses, points)
+    assert(set(new_poses.keys()) == {1, 2, 3, 4})
+    assert(0 not in point_ids)
+
+    # observations can be removed from the window
+    window_ba.remove_observations([1, 3], [2, 3])
+    assert(window_ba.observers(2) == {2, 3})
+    assert(window_ba.observers(3) == {1, 2, 4})
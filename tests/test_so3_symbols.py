@@ -0,0 +1,37 @@
+from numpy.testing import assert_array_almost_equal
+import numpy as np
+import sympy
+
+from tadataka.so3_symbols import kernel_expressions
+from tadataka import _so3_kernels
+from tadataka._so3_kernels import projection_, pose_jacobian_
+
+
+def test_kernels_match_expressions():
+    # fails if 'tadataka/_so3_kernels.py' is not regenerated
+    # after the expressions in 'tadataka/so3_symbols.py' are modified
+    np.random.seed(3939)
+    for name, args, M in kernel_expressions():
+        kernel = getattr(_so3_kernels, name)
+        expected = sympy.lambdify(args, M, modules="numpy")
+        for i in range(10):
+            values = np.random.uniform(-1, 1, len(args))
+            if len(args) == 9:
+                # keep the point in front of the camera
+                values[8] = values[8] + 5
+            assert_array_almost_equal(kernel(*values),
+                                      np.array(expected(*values), dtype=float))
+
+
+def test_kernels_broadcast():
+    poses = np.random.uniform(-1, 1, (4, 6))
+    points = np.random.uniform(-1, 1, (4, 3))
+    points[:, 2] = points[:, 2] + 5
+
+    X = projection_(*poses.T, *points.T)
+    A = pose_jacobian_(*poses.T, *points.T)
+    assert(X.shape == (4, 2, 1))
+    assert(A.shape == (4, 2, 6))
+    for i in range(4):
+        assert_array_almost_equal(X[i], projection_(*poses[i], *points[i]))
+        assert_array_almost_equal(A[i], pose_jacobian_(*poses[i], *points[i]))
@@ -10,7 +10,8 @@ from tadataka.dataset.observations import generate_translations
 from tadataka.pose import Pose
 from tadataka.projection import PerspectiveProjection
 from tadataka.rigid_transform import transform
-from tadataka._triangulation import linear_triangulation
+from tadataka._triangulation import (
+    linear_triangulation, linear_triangulation_)
 from tadataka.triangulation import (
     Triangulation, TwoViewTriangulation, DepthFromTriangulation)
 
@@ -69,6 +70,27 @@ def test_linear_triangulation():
         )
 
 
+def test_linear_triangulation_batch():
+    # batched triangulation must be same as the per-point one
+    rotations = np.array([R0, R1, R2])
+    translations = np.array([t0, t1, t2])
+    keypoints = np.stack((keypoints0, keypoints1, keypoints2))
+    keypoints = keypoints + np.random.normal(0, 0.01, keypoints.shape)
+
+    points, depths = linear_triangulation(rotations, translations, keypoints)
+    for i in range(keypoints.shape[1]):
+        point, depths_ = linear_triangulation_(rotations, translations,
+                                               keypoints[:, i])
+        assert_array_almost_equal(points[i], point)
+        assert_array_almost_equal(depths[:, i], depths_)
+
+    # zero points
+    points, depths = linear_triangulation(rotations, translations,
+                                          np.empty((3, 0, 2)))
+    assert(points.shape == (0, 3))
+    assert(depths.shape == (3, 0))
+
+
 def test_two_view_triangulation():
     triangulator = TwoViewTriangulation(
         Pose(Rotation.from_matrix(R0), t0),
@@ -117,6 +139,55 @@ def test_triangulation():
         )
 
 
+def test_triangulate_sparse():
+    triangulator = Triangulation(
+        [Pose(Rotation.from_matrix(R0), t0),
+         Pose(Rotation.from_matrix(R1), t1),
+         Pose(Rotation.from_matrix(R2), t2)]
+    )
+
+    keypoints = np.stack((keypoints0, keypoints1, keypoints2))
+
+    # points 0-3 are observed from viewpoints 0 and 1, 4-7 from 1 and 2,
+    # 8 from all viewpoints, and 9 only from viewpoint 2
+    viewpoint_indices = [0, 1, 0, 1, 0, 1, 0, 1,
+                         1, 2, 1, 2, 1, 2, 1, 2,
+                         2, 1, 0, 2]
+    point_indices = [0, 0, 1, 1, 2, 2, 3, 3,
+                     4, 4, 5, 5, 6, 6, 7, 7,
+                     8, 8, 8, 9]
+    keypoints_ = keypoints[viewpoint_indices, point_indices]
+
+    points, depths = triangulator.triangulate_sparse(
+        viewpoint_indices, point_indices, keypoints_
+    )
+
+    assert_array_almost_equal(points[:9], points_true[:9])
+    assert(np.isinf(points[9]).all())
+
+    assert(depths.shape == (len(point_indices),))
+    rotations, translations = np.array([R0, R1, R2]), np.array([t0, t1, t2])
+    for k, (j, i) in enumerate(zip(viewpoint_indices[:-1], point_indices[:-1])):
+        expected = np.dot(rotations[j], points_true[i])[2] + translations[j, 2]
+        assert_almost_equal(depths[k], expected)
+    assert(np.isnan(depths[-1]))
+
+    # must be same as the dense triangulation if all points are visible
+    noisy = keypoints + np.random.normal(0, 0.01, keypoints.shape)
+    viewpoint_indices, point_indices = np.meshgrid(
+        np.arange(3), np.arange(points_true.shape[0]), indexing='ij'
+    )
+    viewpoint_indices = viewpoint_indices.flatten()
+    point_indices = point_indices.flatten()
+    points, depths = triangulator.triangulate_sparse(
+        viewpoint_indices, point_indices,
+        noisy[viewpoint_indices, point_indices]
+    )
+    points_dense, depths_dense = triangulator.triangulate(noisy)
+    assert_array_almost_equal(points, points_dense)
+    assert_array_almost_equal(depths, depths_dense.flatten())
+
+
 def test_depths_from_triangulation():
     projection = PerspectiveProjection(
         CameraParameters(focal_length=[1, 1], offset=[0, 0]),
@@ -138,3 +209,37 @@ def test_depths_from_triangulation():
 
     depths = DepthFromTriangulation(pose0, pose1)(keypoint0, keypoint1)
     assert_array_almost_equal(depths, np.array([5, 5]))
+
+
+def test_depths_from_triangulation_batch():
+    f = DepthFromTriangulation(Pose(Rotation.from_matrix(R0), t0),
+                               Pose(Rotation.from_matrix(R1), t1))
+
+    depths = f(keypoints0, keypoints1)
+    assert(depths.shape == (points_true.shape[0], 2))
+    assert_array_almost_equal(depths[:, 0],
+                              np.dot(points_true, R0[2]) + t0[2])
+    assert_array_almost_equal(depths[:, 1],
+                              np.dot(points_true, R1[2]) + t1[2])
+
+    # compare with lstsq for noisy keypoints
+    noisy0 = keypoints0 + np.random.normal(0, 0.01, keypoints0.shape)
+    noisy1 = keypoints1 + np.random.normal(0, 0.01, keypoints1.shape)
+    depths = f(noisy0, noisy1)
+    for i in range(points_true.shape[0]):
+        A = np.column_stack((np.dot(R0.T, np.append(noisy0[i], 1)),
+                             -np.dot(R1.T, np.append(noisy1[i], 1))))
+        b = np.dot(R0.T, t0) - np.dot(R1.T, t1)
+        expected, _, _, _ = np.linalg.lstsq(A, b, rcond=None)
+        assert_array_almost_equal(depths[i], expected)
+        assert_array_almost_equal(f(noisy0[i], noisy1[i]), expected)
+
+    # rays are parallel if poses have the same rotation and
+    # keypoints are at the same position
+    rotation = Rotation.from_quat([0, 0, 0, 1])
+    f = DepthFromTriangulation(Pose(rotation, np.array([-1, 0, 0])),
+                               Pose(rotation, np.array([1, 0, 0])))
+    depths = f(np.array([[0.1, 0.2], [-0.2, 0.0]]),
+               np.array([[0.1, 0.2], [0.2, 0.0]]))
+    assert(np.isnan(depths[0]).all())
+    assert_array_almost_equal(depths[1], [5, 5])
@@ -0,0 +1,172 @@
+from numpy.testing import assert_array_almost_equal
+import numpy as np
+from scipy.spatial.transform import Rotation
+
+from tadataka.camera import CameraModel, CameraParameters, RadTan
+from tadataka.dataset.frame import Frame
+from tadataka.coordinates import image_coordinates
+from tadataka.pose import Pose
+from tadataka.vo.dvo import (DVO, KeyframePolicy, PoseChangeEstimator,
+                             information_ratio, log_determinant,
+                             solve_cholesky)
+from tadataka.vo.dvo.jacobian import calc_jacobian, calc_normal_equation
+from tadataka.vo.dvo.pyramid import ImagePyramid
+from tadataka.vo.dvo.selection import GradientPercentileSelector
+
+
+camera_parameters = CameraParameters(focal_length=[120., 120.],
+                                     offset=[79.5, 59.5])
+image_shape = (120, 160)
+
+
+def texture(X, Y):
+    return (np.sin(3 * X) * np.cos(2 * Y) + 0.5 * np.sin(7 * X + 5 * Y)) / 3
+
+
+def render_plane(pose, plane_depth=2.0, texture=texture):
+    """
+    Render the textured plane Z = 'plane_depth' from the camera at 'pose'
+    which transforms world points to camera coordinates.
+    Returns the image and the depth map
+    """
+    R, t = pose.R, pose.t
+    xs = image_coordinates(image_shape) - camera_parameters.offset
+    rays = np.column_stack((xs / camera_parameters.focal_length,
+                            np.ones(len(xs))))
+    # solve Z of R^T * (s * ray - t) = plane_depth for s
+    depths = (plane_depth + np.dot(R.T, t)[2]) / np.dot(rays, R)[:, 2]
+    P = np.dot(depths.reshape(-1, 1) * rays - t, R)
+    I = texture(P[:, 0], P[:, 1])
+    return I.reshape(image_shape), depths.reshape(image_shape)
+
+
+def test_solve_cholesky():
+    n = 50
+    DX, DY = np.random.normal(size=(2, n))
+    P = np.random.uniform(1, 2, (n, 3))
+    r = np.random.normal(size=n)
+    weights = np.random.uniform(0.1, 1, n)
+
+    fx, fy = camera_parameters.focal_length
+    H, g = calc_normal_equation(fx, fy, DX, DY, P, r, weights * weights)
+    xi = solve_cholesky(H, g)
+
+    # weights are multiplied to each row of J and r
+    J = calc_jacobian(camera_parameters, DX, DY, P)
+    expected = np.linalg.lstsq(J * weights.reshape(-1, 1), r * weights,
+                               rcond=None)[0]
+    assert_array_almost_equal(xi, expected)
+
+
+def run_estimator(**kwargs):
+    pose1 = Pose(Rotation.from_rotvec([0.01, -0.02, 0.015]),
+                 np.array([0.03, -0.02, 0.04]))
+
+    I0, D0 = render_plane(Pose.identity())
+    I1, D1 = render_plane(pose1)
+
+    pyramid0 = ImagePyramid(camera_parameters, I0, D0, n_levels=4)
+    pyramid1 = ImagePyramid(camera_parameters, I1, D1, n_levels=4)
+
+    # the estimated pose change transforms points in the t1 coordinate
+    # to the t0 coordinate
+    pose = PoseChangeEstimator(pyramid0, pyramid1, **kwargs).estimate(4)
+    expected = pose1.inv()
+    assert_array_almost_equal(pose.rotation.as_rotvec(),
+                              expected.rotation.as_rotvec(), decimal=3)
+    assert_array_almost_equal(pose.t, expected.t, decimal=3)
+    return pyramid0
+
+
+def test_pose_change_estimator():
+    run_estimator()
+
+
+def test_pose_change_estimator_inverse_compositional():
+    pyramid0 = run_estimator(inverse_compositional=True)
+    # jacobians of all levels are cached in the reference pyramid
+    assert(sorted(pyramid0.jacobians.keys()) == [(l, None) for l in range(4)])
+
+
+def test_pose_change_estimator_pixel_selection():
+    selector = GradientPercentileSelector(percentile=50, min_pixels=1000)
+    run_estimator(pixel_selector=selector)
+    run_estimator(pixel_selector=selector, inverse_compositional=True)
+
+
+def test_pose_change_estimator_rank_deficient():
+    # the stripe texture doesn't constrain the motion along the stripes,
+    # so the normal equation is rank deficient
+    def stripe(X, Y):
+        return np.sin(3 * X)
+
+    pose1 = Pose(Rotation.from_rotvec(np.zeros(3)), np.array([0.03, 0, 0]))
+    I0, D0 = render_plane(Pose.identity(), texture=stripe)
+    I1, D1 = render_plane(pose1, texture=stripe)
+
+    for inverse_compositional in [False, True]:
+        pyramid0 = ImagePyramid(camera_parameters, I0, D0, n_levels=4)
+        pyramid1 = ImagePyramid(camera_parameters, I1, D1, n_levels=4)
+        estimator = PoseChangeEstimator(
+            pyramid0, pyramid1, inverse_compositional=inverse_compositional
+        )
+        pose = estimator.estimate(4)
+        assert_array_almost_equal(pose.rotation.as_rotvec(), np.zeros(3),
+                                  decimal=3)
+        assert_array_almost_equal(pose.t, [-0.03, 0, 0], decimal=3)
+
+
+def test_information_ratio():
+    # well conditioned hessians whose entropies are negative
+    H_reference = np.diag([1e4, 2e4, 3e4, 1e5, 2e5, 3e5])
+    H = H_reference / 4
+    logdet_reference = log_determinant(H_reference)
+    logdet = log_determinant(H)
+    assert(logdet_reference > logdet > 0)
+
+    # the estimate with less information has a smaller ratio
+    assert(np.isclose(information_ratio(logdet, logdet_reference), 0.25))
+    assert(np.isclose(information_ratio(logdet_reference, logdet), 4.0))
+
+    # singular or missing hessian
+    assert(log_determinant(np.zeros((6, 6))) == -np.inf)
+    assert(information_ratio(log_determinant(np.zeros((6, 6))),
+                             logdet_reference) == 0)
+    assert(np.isnan(information_ratio(log_determinant(None),
+                                      logdet_reference)))
+
+
+def test_keyframe_policy():
+    policy = KeyframePolicy(min_overlap=0.7, min_information_ratio=0.5)
+    assert(policy(0.6, 1.0))
+    assert(policy(0.8, 0.4))
+    assert(not policy(0.8, 0.6))
+    # failed estimates make keyframes
+    assert(policy(0.8, np.nan))
+    assert(policy(np.nan, 1.0))
+
+
+def test_dvo_keyframe():
+    camera_model = CameraModel(camera_parameters, RadTan(np.zeros(5)))
+
+    def frame(rotvec, t):
+        # 'rotvec' and 't' represent the camera pose in the world
+        pose = Pose(Rotation.from_rotvec(rotvec), np.array(t))
+        I, D = render_plane(pose.inv())
+        return Frame(camera_model, camera_model, pose, I, D)
+
+    frames = [frame([0, 0.002 * i, 0], [0.01 * i, 0, 0.02 * i])
+              for i in range(6)]
+
+    # min_overlap = 0.9 is large enough to switch keyframes at least once
+    vo = DVO(n_levels=4, inverse_compositional=True,
+             keyframe_policy=KeyframePolicy(min_overlap=0.9))
+    for f in frames:
+        pose = vo.estimate(f)
+        assert_array_almost_equal(pose.rotation.as_rotvec(),
+                                  f.pose.rotation.as_rotvec(), decimal=3)
+        assert_array_almost_equal(pose.t, f.pose.t, decimal=3)
+
+    assert(len(vo.poses) == 6)
+    assert(vo.keyframe_indices[0] == 0)
+    assert(1 < len(vo.keyframe_indices) < 6)
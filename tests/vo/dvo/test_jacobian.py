@@ -2,7 +2,9 @@ import numpy as np
 from numpy.testing import assert_array_equal, assert_array_almost_equal
 
 from tadataka.camera import CameraParameters
-from tadataka.vo.dvo.jacobian import (calc_projection_jacobian,
+from tadataka.vo.dvo.jacobian import (accumulate_normal_equation,
+                                      calc_jacobian, calc_normal_equation,
+                                      calc_projection_jacobian,
                                       calc_image_gradient)
 
 
@@ -29,3 +31,23 @@ def test_calc_projection_jacobian():
     ])
 
     assert_array_equal(J, GT)
+
+
+def test_calc_normal_equation():
+    camera_parameters = CameraParameters(focal_length=[3, 2], offset=[0, 0])
+    n = 20
+    dx, dy = np.random.normal(size=(2, n))
+    P = np.random.uniform(1, 2, (n, 3))
+    r = np.random.normal(size=n)
+    weights = np.random.uniform(0, 1, n)
+
+    J = calc_jacobian(camera_parameters, dx, dy, P)
+    H, g = calc_normal_equation(3., 2., dx, dy, P, r, weights)
+    assert_array_almost_equal(H, np.dot(J.T * weights, J))
+    assert_array_almost_equal(g, np.dot(J.T * weights, r))
+
+    indices = np.array([1, 4, 5, 9])
+    H, g = accumulate_normal_equation(J, indices, r[indices], weights[indices])
+    JI = J[indices]
+    assert_array_almost_equal(H, np.dot(JI.T * weights[indices], JI))
+    assert_array_almost_equal(g, np.dot(JI.T * weights[indices], r[indices]))
@@ -0,0 +1,89 @@
+from numpy.testing import assert_array_equal, assert_array_almost_equal
+import numpy as np
+
+from tadataka.camera import CameraParameters
+from tadataka.vo.dvo.jacobian import calc_jacobian
+from tadataka.vo.dvo.pyramid import (camera_parameters_at, decimate_depth,
+                                     decimate_image, ImagePyramid)
+
+
+def test_decimate_image():
+    image = np.array([
+        [0, 1, 2, 3, 9],
+        [4, 5, 6, 7, 9],
+        [9, 9, 9, 9, 9]
+    ])
+    # odd rows and columns are cropped
+    assert_array_equal(decimate_image(image), [[2.5, 4.5]])
+
+
+def test_decimate_depth():
+    depth_map = np.array([
+        [0, 0, 2, 0],
+        [0, 0, 0, 4]
+    ])
+    # invalid (zero) depths are ignored
+    assert_array_equal(decimate_depth(depth_map), [[0, 3]])
+
+
+def test_camera_parameters_at():
+    camera_parameters = CameraParameters(focal_length=[8, 4], offset=[3.5, 1.5])
+    camera_parameters = camera_parameters_at(camera_parameters, 1)
+    assert_array_equal(camera_parameters.focal_length, [4, 2])
+    # the center of pixels (3, 1) and (4, 2) is the center of pixel (1.5, 0.5)
+    assert_array_equal(camera_parameters.offset, [1.5, 0.5])
+
+
+def test_image_pyramid():
+    camera_parameters = CameraParameters(focal_length=[8, 8], offset=[3.5, 3.5])
+    image = np.random.uniform(0, 1, (8, 8, 3))
+    depth_map = np.random.uniform(1, 2, (8, 8))
+
+    pyramid = ImagePyramid(camera_parameters, image, depth_map, n_levels=3)
+    assert(pyramid.n_levels == 3)
+    assert(pyramid.images[0].shape == (8, 8))  # converted to grayscale
+    assert(pyramid.images[2].shape == (2, 2))
+    assert(pyramid.depth_maps[2].shape == (2, 2))
+    assert(pyramid.points[2].shape == (4, 3))
+    DX, DY = pyramid.gradients[1]
+    assert(DX.shape == DY.shape == (4, 4))
+
+    # points are placed at the decimated depths
+    assert_array_almost_equal(pyramid.points[1][:, 2],
+                              pyramid.depth_maps[1].flatten())
+
+    pyramid = ImagePyramid(camera_parameters, image, n_levels=3)
+    assert(pyramid.depth_maps[0] is None and pyramid.points[0] is None)
+
+    # levels smaller than 2x2 are not built
+    pyramid = ImagePyramid(camera_parameters, image, depth_map, n_levels=5)
+    assert(pyramid.n_levels == 3)
+
+
+def test_jacobian():
+    camera_parameters = CameraParameters(focal_length=[8, 8], offset=[3.5, 3.5])
+    image = np.random.uniform(0, 1, (8, 8))
+    depth_map = np.random.uniform(1, 2, (8, 8))
+    depth_map[0, 0:2] = 0
+
+    pyramid = ImagePyramid(camera_parameters, image, depth_map, n_levels=2)
+
+    # pixels of invalid depth are excluded
+    indices = pyramid.pixel_indices(0)
+    assert_array_equal(indices, np.arange(2, 64))
+
+    J = pyramid.jacobian(0)
+    DX, DY = pyramid.gradients[0]
+    expected = calc_jacobian(camera_parameters, DX.flatten()[2:],
+                             DY.flatten()[2:], pyramid.points[0][2:])
+    assert_array_almost_equal(J, expected)
+
+    # cached
+    assert(pyramid.pixel_indices(0) is indices)
+    assert(pyramid.jacobian(0) is J)
+
+    # rows correspond to the selected pixels
+    def selector(DX, DY, depth_map):
+        return np.array([3, 10])
+
+    assert_array_almost_equal(pyramid.jacobian(0, selector), expected[[1, 8]])
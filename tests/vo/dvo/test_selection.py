@@ -0,0 +1,40 @@
+from numpy.testing import assert_array_equal
+import numpy as np
+
+from tadataka.vo.dvo.selection import GradientPercentileSelector, GridSelector
+
+
+def test_gradient_percentile_selector():
+    DX = np.array([
+        [0, 1, 2, 3],
+        [4, 5, 6, 7]
+    ], dtype=np.float64)
+    DY = np.zeros((2, 4))
+    depth_map = np.ones((2, 4))
+    depth_map[1, 3] = 0  # the pixel of the largest gradient is invalid
+
+    selector = GradientPercentileSelector(percentile=50, min_pixels=0)
+    assert_array_equal(selector(DX, DY, depth_map), [3, 4, 5, 6])
+
+    # all valid pixels are selected if there are few pixels
+    selector = GradientPercentileSelector(percentile=50, min_pixels=10)
+    assert_array_equal(selector(DX, DY, depth_map), [0, 1, 2, 3, 4, 5, 6])
+
+
+def test_grid_selector():
+    DX = np.array([
+        [1, 5, 2, 0, 9],
+        [3, 0, 6, 7, 8],
+        [4, 0, 1, 2, 3]
+    ], dtype=np.float64)
+    DY = np.zeros(DX.shape)
+    depth_map = np.ones(DX.shape)
+    depth_map[0, 4] = 0
+
+    # cells are
+    # [[0, 0, 1, 1, 2],
+    #  [0, 0, 1, 1, 2],
+    #  [3, 3, 4, 4, 5]]
+    selector = GridSelector(cell_size=2, n_per_cell=2)
+    assert_array_equal(selector(DX, DY, depth_map),
+                       [1, 5, 7, 8, 9, 10, 11, 12, 13, 14])
@@ -0,0 +1,177 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from numpy.testing import assert_array_equal
+import numpy as np
+from scipy.spatial.transform import Rotation
+
+from tadataka.camera import CameraModel, CameraParameters, FOV
+from tadataka.feature import Features, Matcher
+from tadataka.pose import Pose
+from tadataka.projection import pi
+from tadataka.rigid_transform import transform
+from tadataka.robust.weights import compute_weights_huber
+from tadataka.vo.feature_based import (FeatureBasedVO, KeyframePolicy,
+                                       match_all, median_parallax)
+
+
+def test_match_all():
+    np.random.seed(3939)
+
+    n_keypoints = 100
+    descriptors1 = np.random.randint(0, 2, (n_keypoints, 256)).astype(np.bool_)
+    keypoints1 = np.random.uniform(-1, 1, (n_keypoints, 2))
+    features1 = Features(keypoints1, descriptors1)
+
+    features = []
+    for i in range(6):
+        # each keyframe observes a different subset of keypoints
+        indices = np.random.choice(n_keypoints, 60 + 5 * i, replace=False)
+        features.append(Features(keypoints1[indices], descriptors1[indices]))
+
+    matcher = Matcher(enable_ransac=False, enable_homography_filter=False)
+    expected = match_all(matcher, features, features1)
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        matches = match_all(matcher, features, features1, executor)
+
+    assert(len(matches) == len(expected))
+    for matches01, expected01 in zip(matches, expected):
+        assert_array_equal(matches01, expected01)
+
+
+def test_median_parallax():
+    points = np.array([
+        [0, 0, 1],
+        [0, 0, 2],
+        [1, 0, 1]
+    ], dtype=np.float64)
+
+    pose0 = Pose.identity()
+    # the camera center moves to [1, 0, 0]
+    pose1 = Pose(Rotation.from_rotvec(np.zeros(3)), np.array([-1, 0, 0]))
+
+    # angles are 45, arctan(1 / 2) and 45 degrees
+    assert(np.isclose(median_parallax(points, pose0, pose1), np.pi / 4))
+    assert(np.isclose(median_parallax(points, pose0, pose0), 0))
+
+
+def test_keyframe_policy():
+    policy = KeyframePolicy(min_tracked_ratio=0.5, max_parallax=0.1)
+    assert(not policy(n_tracked=60, n_reference=100, parallax=0.05))
+    # not enough points tracked
+    assert(policy(n_tracked=40, n_reference=100, parallax=0.05))
+    # large parallax
+    assert(policy(n_tracked=60, n_reference=100, parallax=0.2))
+
+
+def generate_sequence(n_frames, n_points=600, noise=0.3):
+    """
+    Keypoints and descriptors of a synthetic scene observed by
+    a camera moving sideways. Keypoints are in pixels.
+    Returns a camera model, a list of (keypoints, descriptors) and
+    the true camera centers
+    """
+    camera_parameters = CameraParameters(focal_length=[300, 300],
+                                         offset=[320, 240])
+    width, height = 640, 480
+
+    points = np.random.uniform(-3, 3, (n_points, 3))
+    points[:, 2] = np.random.uniform(6, 12, n_points)
+    descriptors = np.random.randint(0, 2, (n_points, 256)).astype(np.bool_)
+
+    frames, centers = [], []
+    for i in range(n_frames):
+        pose = Pose(Rotation.from_rotvec([0, 0.01 * i, 0]),
+                    np.array([-0.1 * i, 0.02 * i, 0]))
+        P = transform(pose.R, pose.t, points)
+        keypoints = (camera_parameters.focal_length * pi(P) +
+                     camera_parameters.offset)
+        mask = ((0 < keypoints[:, 0]) & (keypoints[:, 0] < width) &
+                (0 < keypoints[:, 1]) & (keypoints[:, 1] < height))
+        # each point is detected with probability 0.8
+        indices = np.where(mask & (np.random.uniform(size=n_points) < 0.8))[0]
+
+        keypoints = keypoints[indices] + np.random.normal(
+            0, noise, (len(indices), 2))
+        # flip a few bits
+        flip = np.random.uniform(size=(len(indices), 256)) < 0.03
+        frames.append((keypoints, descriptors[indices] ^ flip))
+        centers.append(pose.local_to_world().t)
+    camera_model = CameraModel(camera_parameters, FOV(0.0))
+    return camera_model, frames, np.array(centers)
+
+
+def run_vo(vo, camera_model, frames):
+    image = np.zeros((480, 640, 3), dtype=np.uint8)
+    for keypoints, descriptors in frames:
+        features = Features(camera_model.normalize(keypoints), descriptors)
+        vo.estimate_(keypoints, features, image)
+
+
+def trajectory_error(centers_true, centers_pred):
+    # the first camera is at the origin in both trajectories
+    # so they differ only by the scale
+    scale = (np.sum(centers_true * centers_pred) /
+             np.sum(centers_pred * centers_pred))
+    d = scale * centers_pred - centers_true
+    return np.sqrt(np.mean(np.sum(d * d, axis=1)))
+
+
+def test_feature_based_vo():
+    np.random.seed(3939)
+
+    camera_model, frames, centers_true = generate_sequence(8)
+
+    matcher = Matcher(enable_ransac=False, enable_homography_filter=False)
+    vo = FeatureBasedVO(matcher=matcher, window_size=4)
+    run_vo(vo, camera_model, frames)
+
+    poses = vo.export_poses()
+    assert(len(poses) == len(frames))
+    centers_pred = np.array([p.local_to_world().t for p in poses])
+    # the camera moves about 0.8 in total
+    assert(trajectory_error(centers_true, centers_pred) < 0.08)
+
+    points, colors = vo.export_points()
+    assert(len(points) == len(colors) > 0)
+
+
+def test_feature_based_vo_map_size():
+    # outliers removed by robust BA must not be triangulated again,
+    # otherwise the map keeps growing even though the scene is fixed
+    np.random.seed(3939)
+
+    n_points = 600
+    camera_model, frames, centers_true = generate_sequence(8, n_points)
+
+    matcher = Matcher(enable_ransac=False, enable_homography_filter=False)
+    vo = FeatureBasedVO(matcher=matcher, window_size=4, incremental_ba=True,
+                        robustifier=compute_weights_huber)
+    run_vo(vo, camera_model, frames)
+
+    assert(vo.map.n_points < 1.5 * n_points)
+
+    poses = vo.export_poses()
+    centers_pred = np.array([p.local_to_world().t for p in poses])
+    assert(trajectory_error(centers_true, centers_pred) < 0.08)
+
+
+def test_feature_based_vo_keyframe_policy():
+    np.random.seed(3939)
+
+    n_frames = 10
+    camera_model, frames, centers_true = generate_sequence(n_frames)
+
+    matcher = Matcher(enable_ransac=False, enable_homography_filter=False)
+    vo = FeatureBasedVO(matcher=matcher, window_size=4,
+                        keyframe_policy=KeyframePolicy())
+    run_vo(vo, camera_model, frames)
+
+    # some frames are not keyframes
+    assert(len(vo.poses) < n_frames)
+
+    # but poses of all frames are exported
+    poses = vo.export_poses()
+    assert(len(poses) == n_frames)
+    centers_pred = np.array([p.local_to_world().t for p in poses])
+    assert(trajectory_error(centers_true, centers_pred) < 0.08)
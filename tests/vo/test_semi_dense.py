@@ -2,10 +2,14 @@ from pathlib import Path
 
 import numpy as np
 from numpy.testing import assert_array_equal, assert_array_almost_equal
+from scipy.ndimage import gaussian_filter
 from scipy.spatial.transform import Rotation
 
+from tadataka.camera import CameraParameters
+from tadataka.camera.distortion import FOV
+from tadataka.camera.model import CameraModel
 from tadataka.dataset.new_tsukuba import NewTsukubaDataset
-from tadataka.pose import calc_relative_pose
+from tadataka.pose import Pose, calc_relative_pose
 from tadataka.vo.semi_dense import (
     convolve, coordinates_along_key_epipolar, coordinates_along_ref_epipolar,
     DepthEstimator, search_intensities
@@ -57,6 +61,31 @@ def test_coordinates_along_ref_epipolar():
     )
 
 
+def test_depth_estimator_estimate():
+    np.random.seed(3939)
+
+    camera_model = CameraModel(
+        CameraParameters(focal_length=[100., 100.], offset=[60., 60.]),
+        FOV(0.0)
+    )
+    # the reference camera moves by 0.1 along the x-axis and every pixel
+    # shifts by 3, so the depth of every pixel is 100 * 0.1 / 3
+    image_key = gaussian_filter(np.random.uniform(0, 1, (120, 120)), 2)
+    image_ref = np.roll(image_key, -3, axis=1)
+    pose_key_to_ref = Pose(Rotation.identity(), np.array([0.1, 0, 0]))
+    estimator = DepthEstimator(camera_model, camera_model,
+                               image_key, image_ref, pose_key_to_ref)
+
+    us_key = np.vstack((np.random.uniform(30, 90, (10, 2)),
+                        [[1, 60]]))  # too close to the image boundary
+    prior_depths = np.random.uniform(2, 4, len(us_key))
+    depths = estimator.estimate(us_key, 1.0, 10.0, prior_depths)
+
+    assert_array_almost_equal(depths[:-1], np.full(10, 10 / 3))
+    assert(np.isnan(depths[-1]))
+    for u_key, prior_depth, depth in zip(us_key[:-1], prior_depths, depths):
+        assert(np.isclose(estimator(u_key, 1.0, 10.0, prior_depth), depth))
+
 
 # def test_depth_estimation():
 #     dataset = NewTsukubaDataset(dataset_root)